@@ -0,0 +1,1168 @@
+/*
+ * Compiled accelerator for avl_range_tree.avl_tree.
+ *
+ * Provides a `RangeNode` type with the same attributes as the pure Python node, and the
+ * kernels every lookup and insertion goes through, `search_min_range`, `insert_node` and
+ * `insert_batch`. When the extension is available, avl_range_tree.avl_tree uses this node type
+ * and installs the kernels on `RangeTree`, so the whole RangeTree API (serialization, snapshots,
+ * batches, traversals, policies, rebuilds, persistence) runs on compiled nodes.
+ *
+ * The kernels follow avl_range_tree/avl_tree.py step by step, so both implementations build the
+ * same tree shape and return the same results, including ties. Bounds and points that are ints
+ * fitting in a signed 64-bit integer are compared natively, any other value (floats, big ints)
+ * goes through the Python comparison operators.
+ */
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+#include <structmember.h>
+#include <stdint.h>
+
+#if PY_VERSION_HEX < 0x030A0000
+static inline PyObject *
+Py_NewRef(PyObject *obj)
+{
+    Py_INCREF(obj);
+    return obj;
+}
+#endif
+
+/* Flags telling which bounds are ints cached in the int64 fields */
+#define START_SMALL 1
+#define END_SMALL 2
+#define MAX_SMALL 4
+
+typedef struct {
+    PyObject_HEAD
+    PyObject *start;
+    PyObject *end;
+    PyObject *max;    /* Maximum end value in the subtree rooted at this node */
+    int64_t start_v;
+    int64_t end_v;
+    int64_t max_v;
+    int flags;
+    Py_ssize_t height;
+    PyObject *left;   /* RangeNode or None */
+    PyObject *right;  /* RangeNode or None */
+    PyObject *key;
+    PyObject *bucket; /* List of additional keys sharing this exact interval, or None */
+    PyObject *score;
+    PyObject *best;
+} NodeObject;
+
+/* A bound or a point, with its int64 value when it is a small int */
+typedef struct {
+    PyObject *obj;
+    int64_t v;
+    int small;
+} Value;
+
+static PyTypeObject NodeType;
+
+#define Node_Check(op) PyObject_TypeCheck(op, &NodeType)
+#define CHILD(op) ((op) == Py_None ? NULL : (NodeObject *)(op))
+
+static PyObject *str_new_node, *str_size, *str_left_rotate, *str_right_rotate, *str_rebalance;
+static PyObject *str_compress_duplicates, *str_policy, *str_build_tree, *str_join, *str_insert_batch;
+
+static Value
+as_value(PyObject *obj)
+{
+    Value value = {obj, 0, 0};
+
+    if (PyLong_CheckExact(obj)) {
+        int overflow;
+        long long v = PyLong_AsLongLongAndOverflow(obj, &overflow);
+
+        if (!overflow && !(v == -1 && PyErr_Occurred())) {
+            value.v = (int64_t)v;
+            value.small = 1;
+        }
+        PyErr_Clear();
+    }
+    return value;
+}
+
+static inline Value
+node_start(const NodeObject *node)
+{
+    return (Value){node->start, node->start_v, node->flags & START_SMALL};
+}
+
+static inline Value
+node_end(const NodeObject *node)
+{
+    return (Value){node->end, node->end_v, node->flags & END_SMALL};
+}
+
+static inline Value
+node_max(const NodeObject *node)
+{
+    return (Value){node->max, node->max_v, node->flags & MAX_SMALL};
+}
+
+/* Each comparison returns 1 or 0, or -1 with an exception set */
+static inline int
+value_lt(Value a, Value b)
+{
+    if (a.small && b.small) {
+        return a.v < b.v;
+    }
+    return PyObject_RichCompareBool(a.obj, b.obj, Py_LT);
+}
+
+static inline int
+value_le(Value a, Value b)
+{
+    if (a.small && b.small) {
+        return a.v <= b.v;
+    }
+    return PyObject_RichCompareBool(a.obj, b.obj, Py_LE);
+}
+
+static inline int
+value_eq(Value a, Value b)
+{
+    if (a.small && b.small) {
+        return a.v == b.v;
+    }
+    return PyObject_RichCompareBool(a.obj, b.obj, Py_EQ);
+}
+
+/* Whether `a` is a strictly smaller interval than `b`, both containing the searched point */
+static int
+narrower(const NodeObject *a, const NodeObject *b)
+{
+    PyObject *width_a, *width_b;
+    int result;
+
+    if ((a->flags & b->flags & (START_SMALL | END_SMALL)) == (START_SMALL | END_SMALL)) {
+        /* Containing intervals have end >= start, so the unsigned differences are exact */
+        return (uint64_t)a->end_v - (uint64_t)a->start_v < (uint64_t)b->end_v - (uint64_t)b->start_v;
+    }
+    width_a = PyNumber_Subtract(a->end, a->start);
+    if (width_a == NULL) {
+        return -1;
+    }
+    width_b = PyNumber_Subtract(b->end, b->start);
+    if (width_b == NULL) {
+        Py_DECREF(width_a);
+        return -1;
+    }
+    result = PyObject_RichCompareBool(width_a, width_b, Py_LT);
+    Py_DECREF(width_a);
+    Py_DECREF(width_b);
+    return result;
+}
+
+/* Node attributes */
+
+static int
+set_bound(PyObject **slot, int64_t *v, int *flags, int flag, PyObject *value)
+{
+    Value bound;
+
+    if (value == NULL) {
+        PyErr_SetString(PyExc_AttributeError, "cannot delete interval bounds");
+        return -1;
+    }
+    bound = as_value(value);
+    Py_INCREF(value);
+    Py_SETREF(*slot, value);
+    *v = bound.v;
+    *flags = bound.small ? (*flags | flag) : (*flags & ~flag);
+    return 0;
+}
+
+static PyObject *
+Node_get_start(NodeObject *self, void *closure)
+{
+    return Py_NewRef(self->start);
+}
+
+static int
+Node_set_start(NodeObject *self, PyObject *value, void *closure)
+{
+    return set_bound(&self->start, &self->start_v, &self->flags, START_SMALL, value);
+}
+
+static PyObject *
+Node_get_end(NodeObject *self, void *closure)
+{
+    return Py_NewRef(self->end);
+}
+
+static int
+Node_set_end(NodeObject *self, PyObject *value, void *closure)
+{
+    return set_bound(&self->end, &self->end_v, &self->flags, END_SMALL, value);
+}
+
+static PyObject *
+Node_get_max(NodeObject *self, void *closure)
+{
+    return Py_NewRef(self->max);
+}
+
+static int
+Node_set_max(NodeObject *self, PyObject *value, void *closure)
+{
+    return set_bound(&self->max, &self->max_v, &self->flags, MAX_SMALL, value);
+}
+
+static int
+set_child(PyObject **slot, PyObject *value)
+{
+    if (value == NULL) {
+        value = Py_None;
+    }
+    else if (value != Py_None && !Node_Check(value)) {
+        PyErr_Format(PyExc_TypeError, "children must be RangeNode or None, not %.200s", Py_TYPE(value)->tp_name);
+        return -1;
+    }
+    Py_INCREF(value);
+    Py_SETREF(*slot, value);
+    return 0;
+}
+
+static PyObject *
+Node_get_left(NodeObject *self, void *closure)
+{
+    return Py_NewRef(self->left);
+}
+
+static int
+Node_set_left(NodeObject *self, PyObject *value, void *closure)
+{
+    return set_child(&self->left, value);
+}
+
+static PyObject *
+Node_get_right(NodeObject *self, void *closure)
+{
+    return Py_NewRef(self->right);
+}
+
+static int
+Node_set_right(NodeObject *self, PyObject *value, void *closure)
+{
+    return set_child(&self->right, value);
+}
+
+static int
+Node_init(NodeObject *self, PyObject *args, PyObject *kwds)
+{
+    static char *kwlist[] = {"start", "end", "key", NULL};
+    PyObject *start, *end, *key;
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "OOO:RangeNode", kwlist, &start, &end, &key)) {
+        return -1;
+    }
+    if (Node_set_start(self, start, NULL) < 0 || Node_set_end(self, end, NULL) < 0
+            || Node_set_max(self, end, NULL) < 0) {
+        return -1;
+    }
+    Py_INCREF(key);
+    Py_SETREF(self->key, key);
+    Py_SETREF(self->left, Py_NewRef(Py_None));
+    Py_SETREF(self->right, Py_NewRef(Py_None));
+    Py_SETREF(self->bucket, Py_NewRef(Py_None));
+    Py_SETREF(self->score, Py_NewRef(Py_None));
+    Py_SETREF(self->best, Py_NewRef(Py_None));
+    self->height = 1;
+    return 0;
+}
+
+static PyObject *
+Node_new(PyTypeObject *type, PyObject *args, PyObject *kwds)
+{
+    NodeObject *self = (NodeObject *)type->tp_alloc(type, 0);
+
+    if (self != NULL) {
+        self->start = Py_NewRef(Py_None);
+        self->end = Py_NewRef(Py_None);
+        self->max = Py_NewRef(Py_None);
+        self->left = Py_NewRef(Py_None);
+        self->right = Py_NewRef(Py_None);
+        self->key = Py_NewRef(Py_None);
+        self->bucket = Py_NewRef(Py_None);
+        self->score = Py_NewRef(Py_None);
+        self->best = Py_NewRef(Py_None);
+        self->height = 1;
+    }
+    return (PyObject *)self;
+}
+
+static int
+Node_traverse(NodeObject *self, visitproc visit, void *arg)
+{
+    Py_VISIT(self->start);
+    Py_VISIT(self->end);
+    Py_VISIT(self->max);
+    Py_VISIT(self->left);
+    Py_VISIT(self->right);
+    Py_VISIT(self->key);
+    Py_VISIT(self->bucket);
+    Py_VISIT(self->score);
+    Py_VISIT(self->best);
+    return 0;
+}
+
+static int
+Node_clear(NodeObject *self)
+{
+    Py_CLEAR(self->start);
+    Py_CLEAR(self->end);
+    Py_CLEAR(self->max);
+    Py_CLEAR(self->left);
+    Py_CLEAR(self->right);
+    Py_CLEAR(self->key);
+    Py_CLEAR(self->bucket);
+    Py_CLEAR(self->score);
+    Py_CLEAR(self->best);
+    return 0;
+}
+
+static void
+Node_dealloc(NodeObject *self)
+{
+    PyObject_GC_UnTrack(self);
+    Py_TRASHCAN_BEGIN(self, Node_dealloc)
+    Node_clear(self);
+    Py_TYPE(self)->tp_free((PyObject *)self);
+    Py_TRASHCAN_END
+}
+
+static PyGetSetDef Node_getset[] = {
+    {"start", (getter)Node_get_start, (setter)Node_set_start, "The start value of the interval.", NULL},
+    {"end", (getter)Node_get_end, (setter)Node_set_end, "The end value of the interval.", NULL},
+    {"max", (getter)Node_get_max, (setter)Node_set_max,
+     "The maximum end value in the subtree rooted at this node.", NULL},
+    {"left", (getter)Node_get_left, (setter)Node_set_left, "The left child node, or None.", NULL},
+    {"right", (getter)Node_get_right, (setter)Node_set_right, "The right child node, or None.", NULL},
+    {NULL},
+};
+
+static PyMemberDef Node_members[] = {
+    {"height", T_PYSSIZET, offsetof(NodeObject, height), 0, "The height of the node in the AVL tree."},
+    {"key", T_OBJECT, offsetof(NodeObject, key), 0, "The unique key associated with the interval."},
+    {"bucket", T_OBJECT, offsetof(NodeObject, bucket), 0,
+     "Additional keys sharing this exact interval, or None."},
+    {"score", T_OBJECT, offsetof(NodeObject, score), 0,
+     "The score given to the interval by the selection policy of the tree, or None."},
+    {"best", T_OBJECT, offsetof(NodeObject, best), 0, "The lowest score in the subtree rooted at this node, or None."},
+    {NULL},
+};
+
+static PyTypeObject NodeType = {
+    PyVarObject_HEAD_INIT(NULL, 0)
+    .tp_name = "avl_range_tree._avl_tree.RangeNode",
+    .tp_doc = PyDoc_STR(
+        "RangeNode(start, end, key)\n--\n\n"
+        "Represents a single node in the AVL tree, see avl_range_tree.avl_tree.RangeNode."),
+    .tp_basicsize = sizeof(NodeObject),
+    .tp_flags = Py_TPFLAGS_DEFAULT | Py_TPFLAGS_BASETYPE | Py_TPFLAGS_HAVE_GC,
+    .tp_new = Node_new,
+    .tp_init = (initproc)Node_init,
+    .tp_dealloc = (destructor)Node_dealloc,
+    .tp_traverse = (traverseproc)Node_traverse,
+    .tp_clear = (inquiry)Node_clear,
+    .tp_getset = Node_getset,
+    .tp_members = Node_members,
+};
+
+/* Search */
+
+/* Returns a borrowed reference to the smallest interval containing the point, or NULL with *error set */
+static NodeObject *
+search_node(NodeObject *node, Value point, int *error)
+{
+    NodeObject *min_node, *left = CHILD(node->left), *right = CHILD(node->right), *found;
+    int status;
+
+    status = value_lt(point, node_start(node));
+    if (status) {
+        if (status < 0) {
+            goto error;
+        }
+        /* The point is less than the current node's start, so only the left subtree can contain it */
+        if (left != NULL) {
+            status = value_le(point, node_max(left));
+            if (status < 0) {
+                goto error;
+            }
+            if (status) {
+                return search_node(left, point, error);
+            }
+        }
+        return NULL;
+    }
+
+    /* Check if the current node's interval contains the point */
+    status = value_le(point, node_end(node));
+    if (status < 0) {
+        goto error;
+    }
+    min_node = status ? node : NULL;
+
+    /* Intervals in the left subtree start earlier and may still reach the point */
+    if (left != NULL) {
+        status = value_le(point, node_max(left));
+        if (status < 0) {
+            goto error;
+        }
+        if (status) {
+            found = search_node(left, point, error);
+            if (*error) {
+                return NULL;
+            }
+            if (found != NULL) {
+                status = min_node == NULL ? 1 : narrower(found, min_node);
+                if (status < 0) {
+                    goto error;
+                }
+                if (status) {
+                    min_node = found;
+                }
+            }
+        }
+    }
+
+    /* Only search the right subtree if there's a chance to find a smaller interval */
+    if (right != NULL) {
+        status = value_le(point, node_max(right));
+        if (status < 0) {
+            goto error;
+        }
+        if (status) {
+            found = search_node(right, point, error);
+            if (*error) {
+                return NULL;
+            }
+            if (found != NULL) {
+                status = min_node == NULL ? 1 : narrower(found, min_node);
+                if (status < 0) {
+                    goto error;
+                }
+                if (status) {
+                    min_node = found;
+                }
+            }
+        }
+    }
+    return min_node;
+
+error:
+    *error = 1;
+    return NULL;
+}
+
+static PyObject *
+search_min_range(PyObject *module, PyObject *const *args, Py_ssize_t nargs)
+{
+    NodeObject *found;
+    int error = 0;
+
+    if (nargs != 2) {
+        PyErr_Format(PyExc_TypeError, "search_min_range() takes exactly 2 arguments (%zd given)", nargs);
+        return NULL;
+    }
+    if (args[0] == Py_None) {
+        Py_RETURN_NONE;
+    }
+    if (!Node_Check(args[0])) {
+        PyErr_Format(PyExc_TypeError, "expected a RangeNode or None, not %.200s", Py_TYPE(args[0])->tp_name);
+        return NULL;
+    }
+    found = search_node((NodeObject *)args[0], as_value(args[1]), &error);
+    if (error) {
+        return NULL;
+    }
+    if (found == NULL) {
+        Py_RETURN_NONE;
+    }
+    return Py_NewRef((PyObject *)found);
+}
+
+/* Insertion */
+
+typedef struct {
+    PyObject *tree;
+    PyObject *key;
+    Value start;
+    Value end;
+    int compress_duplicates;
+    int policy;
+} Insertion;
+
+/* Calls a method of the tree returning a node or None, so that subclasses can override it */
+static PyObject *
+call_tree(PyObject *tree, PyObject *name, PyObject *node)
+{
+    PyObject *result = PyObject_CallMethodOneArg(tree, name, node);
+
+    if (result != NULL && result != Py_None && !Node_Check(result)) {
+        PyErr_Format(PyExc_TypeError, "%U() must return a RangeNode or None", name);
+        Py_CLEAR(result);
+    }
+    return result;
+}
+
+static PyObject *
+new_node(Insertion *ins)
+{
+    PyObject *size, *node;
+
+    size = PyObject_GetAttr(ins->tree, str_size);
+    if (size == NULL) {
+        return NULL;
+    }
+    node = PyObject_CallMethodObjArgs(ins->tree, str_new_node, ins->start.obj, ins->end.obj, ins->key, size, NULL);
+    Py_DECREF(size);
+    if (node != NULL && !Node_Check(node)) {
+        PyErr_SetString(PyExc_TypeError, "_new_node() must return a RangeNode");
+        Py_CLEAR(node);
+    }
+    return node;
+}
+
+static int
+append_to_bucket(NodeObject *node, PyObject *key)
+{
+    PyObject *bucket;
+
+    if (node->bucket == NULL || node->bucket == Py_None) {
+        bucket = PyList_New(1);
+        if (bucket == NULL) {
+            return -1;
+        }
+        PyList_SET_ITEM(bucket, 0, Py_NewRef(key));
+        Py_SETREF(node->bucket, bucket);
+        return 0;
+    }
+    if (PyList_CheckExact(node->bucket)) {
+        return PyList_Append(node->bucket, key);
+    }
+    bucket = PyObject_CallMethod(node->bucket, "append", "O", key);
+    Py_XDECREF(bucket);
+    return bucket == NULL ? -1 : 0;
+}
+
+/* Recomputes max, height and, with a selection policy, best from the children */
+static int
+update(int policy, NodeObject *node)
+{
+    NodeObject *left = CHILD(node->left), *right = CHILD(node->right);
+    Value max = node_end(node);
+    Py_ssize_t height = 0;
+    int status;
+
+    /* Like the builtin max, the first of several equal values is kept */
+    if (left != NULL) {
+        status = value_lt(max, node_max(left));
+        if (status < 0) {
+            return -1;
+        }
+        if (status) {
+            max = node_max(left);
+        }
+        height = left->height;
+    }
+    if (right != NULL) {
+        status = value_lt(max, node_max(right));
+        if (status < 0) {
+            return -1;
+        }
+        if (status) {
+            max = node_max(right);
+        }
+        if (right->height > height) {
+            height = right->height;
+        }
+    }
+    Py_SETREF(node->max, Py_NewRef(max.obj));
+    node->max_v = max.v;
+    node->flags = max.small ? (node->flags | MAX_SMALL) : (node->flags & ~MAX_SMALL);
+    node->height = height + 1;
+
+    if (policy) {
+        PyObject *best = node->score;
+
+        if (left != NULL) {
+            status = PyObject_RichCompareBool(left->best, best, Py_LT);
+            if (status < 0) {
+                return -1;
+            }
+            if (status) {
+                best = left->best;
+            }
+        }
+        if (right != NULL) {
+            status = PyObject_RichCompareBool(right->best, best, Py_LT);
+            if (status < 0) {
+                return -1;
+            }
+            if (status) {
+                best = right->best;
+            }
+        }
+        Py_SETREF(node->best, Py_NewRef(best));
+    }
+    return 0;
+}
+
+static inline Py_ssize_t
+get_height(PyObject *node)
+{
+    return node == Py_None ? 0 : ((NodeObject *)node)->height;
+}
+
+/* Returns a new reference to the root of the subtree after insertion, or NULL on error */
+static PyObject *
+insert(Insertion *ins, PyObject *subtree)
+{
+    NodeObject *node;
+    PyObject **child, *new_child, *rotated;
+    Py_ssize_t balance;
+    int status;
+
+    /* Base case: empty subtree */
+    if (subtree == Py_None) {
+        return new_node(ins);
+    }
+    node = (NodeObject *)subtree;
+
+    if (ins->compress_duplicates) {
+        /* Identical intervals share one node, the extra keys go to its bucket */
+        status = value_eq(ins->start, node_start(node));
+        if (status < 0) {
+            return NULL;
+        }
+        if (status) {
+            status = value_eq(ins->end, node_end(node));
+            if (status < 0) {
+                return NULL;
+            }
+            if (status) {
+                if (append_to_bucket(node, ins->key) < 0) {
+                    return NULL;
+                }
+                return Py_NewRef(subtree);
+            }
+            /* Order by (start, end) so that identical intervals always meet on the insertion path */
+            status = value_lt(ins->end, node_end(node));
+        }
+        else {
+            status = value_lt(ins->start, node_start(node));
+        }
+    }
+    else {
+        status = value_lt(ins->start, node_start(node));
+    }
+    if (status < 0) {
+        return NULL;
+    }
+
+    /* Recursively insert into the left or right subtree */
+    child = status ? &node->left : &node->right;
+    new_child = insert(ins, *child);
+    if (new_child == NULL) {
+        return NULL;
+    }
+    Py_SETREF(*child, new_child);
+
+    if (update(ins->policy, node) < 0) {
+        return NULL;
+    }
+
+    balance = get_height(node->left) - get_height(node->right);
+    if (balance >= -1 && balance <= 1) {
+        return Py_NewRef(subtree);
+    }
+    if (ins->compress_duplicates) {
+        return call_tree(ins->tree, str_rebalance, subtree);
+    }
+
+    /* The node is unbalanced, the rotations are left to the tree so that subclasses can override them */
+    if (balance > 1) {
+        status = value_lt(ins->start, node_start((NodeObject *)node->left));
+        if (status < 0) {
+            return NULL;
+        }
+        if (!status) {
+            /* Left Right Case: an equal start went to the right of node.left */
+            rotated = call_tree(ins->tree, str_left_rotate, node->left);
+            if (rotated == NULL) {
+                return NULL;
+            }
+            Py_SETREF(node->left, rotated);
+        }
+        /* Left Left Case */
+        return call_tree(ins->tree, str_right_rotate, subtree);
+    }
+
+    status = value_lt(ins->start, node_start((NodeObject *)node->right));
+    if (status < 0) {
+        return NULL;
+    }
+    if (status) {
+        /* Right Left Case */
+        rotated = call_tree(ins->tree, str_right_rotate, node->right);
+        if (rotated == NULL) {
+            return NULL;
+        }
+        Py_SETREF(node->right, rotated);
+    }
+    /* Right Right Case: identical starts always go to the right */
+    return call_tree(ins->tree, str_left_rotate, subtree);
+}
+
+static PyObject *
+insert_node(PyObject *module, PyObject *const *args, Py_ssize_t nargs)
+{
+    Insertion ins;
+    PyObject *attr;
+    int status;
+
+    if (nargs != 5) {
+        PyErr_Format(PyExc_TypeError, "insert_node() takes exactly 5 arguments (%zd given)", nargs);
+        return NULL;
+    }
+    if (args[1] != Py_None && !Node_Check(args[1])) {
+        PyErr_Format(PyExc_TypeError, "expected a RangeNode or None, not %.200s", Py_TYPE(args[1])->tp_name);
+        return NULL;
+    }
+    ins.tree = args[0];
+    ins.start = as_value(args[2]);
+    ins.end = as_value(args[3]);
+    ins.key = args[4];
+
+    attr = PyObject_GetAttr(ins.tree, str_compress_duplicates);
+    if (attr == NULL) {
+        return NULL;
+    }
+    status = PyObject_IsTrue(attr);
+    Py_DECREF(attr);
+    if (status < 0) {
+        return NULL;
+    }
+    ins.compress_duplicates = status;
+
+    attr = PyObject_GetAttr(ins.tree, str_policy);
+    if (attr == NULL) {
+        return NULL;
+    }
+    ins.policy = attr != Py_None;
+    Py_DECREF(attr);
+
+    return insert(&ins, args[1]);
+}
+
+/* Batch insertion */
+
+typedef struct {
+    PyObject *tree;
+    PyObject *batch;  /* List of (start, end, key, position) intervals sorted in tree order */
+    PyObject *keys;   /* List of the sort key of every interval: its start, or (start, end) */
+    Py_ssize_t size;  /* Size of the tree before the batch, added to the position of an interval to number it */
+    int compress_duplicates;
+    int policy;
+    int direct;       /* Whether the tree uses this kernel for its subtrees, so recursion can stay in C */
+} Batch;
+
+static PyObject *insert_batch_function;
+
+/* Returns the first index of keys[lo:hi] whose key is not less than x (left), or greater than x (right) */
+static Py_ssize_t
+bisect(PyObject *keys, PyObject *x, Py_ssize_t lo, Py_ssize_t hi, int right)
+{
+    Py_ssize_t mid;
+    PyObject *item;
+    int status;
+
+    while (lo < hi) {
+        mid = lo + (hi - lo) / 2;
+        item = PyList_GetItem(keys, mid);
+        if (item == NULL) {
+            return -1;
+        }
+        Py_INCREF(item);
+        status = right ? PyObject_RichCompareBool(x, item, Py_LT) : PyObject_RichCompareBool(item, x, Py_LT);
+        Py_DECREF(item);
+        if (status < 0) {
+            return -1;
+        }
+        if (status == right) {
+            hi = mid;
+        }
+        else {
+            lo = mid + 1;
+        }
+    }
+    return lo;
+}
+
+/* Unpacks an interval of the batch into new references and its position */
+static int
+unpack_interval(PyObject *batch, Py_ssize_t i, PyObject **start, PyObject **end, PyObject **key, Py_ssize_t *position)
+{
+    PyObject *item, *fast;
+
+    item = PyList_GetItem(batch, i);
+    if (item == NULL) {
+        return -1;
+    }
+    fast = PySequence_Fast(item, "intervals must be (start, end, key, position) sequences");
+    if (fast == NULL) {
+        return -1;
+    }
+    if (PySequence_Fast_GET_SIZE(fast) != 4) {
+        PyErr_Format(PyExc_ValueError, "expected 4 values in an interval, got %zd", PySequence_Fast_GET_SIZE(fast));
+        Py_DECREF(fast);
+        return -1;
+    }
+    *position = PyLong_AsSsize_t(PySequence_Fast_GET_ITEM(fast, 3));
+    if (*position == -1 && PyErr_Occurred()) {
+        Py_DECREF(fast);
+        return -1;
+    }
+    *start = Py_NewRef(PySequence_Fast_GET_ITEM(fast, 0));
+    *end = Py_NewRef(PySequence_Fast_GET_ITEM(fast, 1));
+    *key = Py_NewRef(PySequence_Fast_GET_ITEM(fast, 2));
+    Py_DECREF(fast);
+    return 0;
+}
+
+/* Builds a balanced subtree holding batch[lo:hi] with the `_build_tree` method of the tree */
+static PyObject *
+build_slice(Batch *b, Py_ssize_t lo, Py_ssize_t hi)
+{
+    PyObject *nodes, *start, *end, *key, *seq, *node, *root;
+    Py_ssize_t i, position;
+
+    nodes = PyList_New(hi - lo);
+    if (nodes == NULL) {
+        return NULL;
+    }
+    for (i = lo; i < hi; i++) {
+        if (unpack_interval(b->batch, i, &start, &end, &key, &position) < 0) {
+            goto error;
+        }
+        seq = PyLong_FromSsize_t(b->size + position);
+        node = seq == NULL ? NULL : PyObject_CallMethodObjArgs(b->tree, str_new_node, start, end, key, seq, NULL);
+        Py_DECREF(start);
+        Py_DECREF(end);
+        Py_DECREF(key);
+        Py_XDECREF(seq);
+        if (node == NULL) {
+            goto error;
+        }
+        if (!Node_Check(node)) {
+            PyErr_SetString(PyExc_TypeError, "_new_node() must return a RangeNode");
+            Py_DECREF(node);
+            goto error;
+        }
+        PyList_SET_ITEM(nodes, i - lo, node);
+    }
+    if (hi - lo == 1) {
+        /* A single new node is already a balanced subtree */
+        root = Py_NewRef(PyList_GET_ITEM(nodes, 0));
+        Py_DECREF(nodes);
+        return root;
+    }
+    root = call_tree(b->tree, str_build_tree, nodes);
+    Py_DECREF(nodes);
+    return root;
+
+error:
+    Py_DECREF(nodes);
+    return NULL;
+}
+
+/* Appends the keys of batch[lo:hi] to the bucket of a node, replacing the bucket like the tree does */
+static int
+extend_bucket(Batch *b, NodeObject *node, Py_ssize_t lo, Py_ssize_t hi)
+{
+    PyObject *bucket, *start, *end, *key;
+    Py_ssize_t i, position;
+    int status;
+
+    if (node->bucket == NULL || node->bucket == Py_None) {
+        bucket = PyList_New(0);
+    }
+    else {
+        bucket = PySequence_List(node->bucket);
+    }
+    if (bucket == NULL) {
+        return -1;
+    }
+    for (i = lo; i < hi; i++) {
+        if (unpack_interval(b->batch, i, &start, &end, &key, &position) < 0) {
+            Py_DECREF(bucket);
+            return -1;
+        }
+        status = PyList_Append(bucket, key);
+        Py_DECREF(start);
+        Py_DECREF(end);
+        Py_DECREF(key);
+        if (status < 0) {
+            Py_DECREF(bucket);
+            return -1;
+        }
+    }
+    Py_SETREF(node->bucket, bucket);
+    return 0;
+}
+
+static PyObject *insert_slice(Batch *b, PyObject *subtree, Py_ssize_t lo, Py_ssize_t hi);
+
+/* Inserts batch[lo:hi] into a child subtree, through the `_insert_batch` method when a subclass overrides it */
+static PyObject *
+insert_child(Batch *b, PyObject *subtree, Py_ssize_t lo, Py_ssize_t hi)
+{
+    PyObject *result;
+
+    if (b->direct || lo >= hi) {
+        return insert_slice(b, subtree, lo, hi);
+    }
+    result = PyObject_CallMethod(b->tree, "_insert_batch", "OOOnn", subtree, b->batch, b->keys, lo, hi);
+    if (result != NULL && result != Py_None && !Node_Check(result)) {
+        PyErr_SetString(PyExc_TypeError, "_insert_batch() must return a RangeNode or None");
+        Py_CLEAR(result);
+    }
+    return result;
+}
+
+/* Returns a new reference to the root of the subtree after inserting batch[lo:hi], or NULL on error */
+static PyObject *
+insert_slice(Batch *b, PyObject *subtree, Py_ssize_t lo, Py_ssize_t hi)
+{
+    NodeObject *node;
+    PyObject *interval, *child, *left, *right, *result;
+    Py_ssize_t split, duplicates, balance;
+
+    if (lo >= hi) {
+        return Py_NewRef(subtree);
+    }
+    /* Base case: empty subtree */
+    if (subtree == Py_None) {
+        return build_slice(b, lo, hi);
+    }
+    node = (NodeObject *)subtree;
+
+    if (b->compress_duplicates) {
+        /* Identical intervals share one node, the extra keys go to its bucket */
+        interval = PyTuple_Pack(2, node->start, node->end);
+        if (interval == NULL) {
+            return NULL;
+        }
+        split = bisect(b->keys, interval, lo, hi, 0);
+        duplicates = split < 0 ? -1 : bisect(b->keys, interval, split, hi, 1);
+        Py_DECREF(interval);
+        if (duplicates < 0) {
+            return NULL;
+        }
+        if (duplicates > split && extend_bucket(b, node, split, duplicates) < 0) {
+            return NULL;
+        }
+    }
+    else {
+        /* Equal starts go to the right, as in insert_node */
+        split = duplicates = bisect(b->keys, node->start, lo, hi, 0);
+        if (split < 0) {
+            return NULL;
+        }
+    }
+
+    child = insert_child(b, node->left, lo, split);
+    if (child == NULL) {
+        return NULL;
+    }
+    Py_SETREF(node->left, child);
+    child = insert_child(b, node->right, duplicates, hi);
+    if (child == NULL) {
+        return NULL;
+    }
+    Py_SETREF(node->right, child);
+
+    if (update(b->policy, node) < 0) {
+        return NULL;
+    }
+
+    balance = get_height(node->left) - get_height(node->right);
+    if (balance >= -1 && balance <= 1) {
+        return Py_NewRef(subtree);
+    }
+    if (balance == 2 || balance == -2) {
+        return call_tree(b->tree, str_rebalance, subtree);
+    }
+
+    /* More than a rotation can fix, both sides are joined through the node */
+    left = Py_NewRef(node->left);
+    right = Py_NewRef(node->right);
+    result = PyObject_CallMethodObjArgs(b->tree, str_join, left, subtree, right, NULL);
+    Py_DECREF(left);
+    Py_DECREF(right);
+    if (result != NULL && result != Py_None && !Node_Check(result)) {
+        PyErr_SetString(PyExc_TypeError, "_join() must return a RangeNode");
+        Py_CLEAR(result);
+    }
+    return result;
+}
+
+static PyObject *
+insert_batch(PyObject *module, PyObject *const *args, Py_ssize_t nargs)
+{
+    Batch b;
+    PyObject *attr;
+    Py_ssize_t lo, hi;
+    int status;
+
+    if (nargs != 6) {
+        PyErr_Format(PyExc_TypeError, "_insert_batch() takes exactly 6 arguments (%zd given)", nargs);
+        return NULL;
+    }
+    if (args[1] != Py_None && !Node_Check(args[1])) {
+        PyErr_Format(PyExc_TypeError, "expected a RangeNode or None, not %.200s", Py_TYPE(args[1])->tp_name);
+        return NULL;
+    }
+    if (!PyList_Check(args[2]) || !PyList_Check(args[3])) {
+        PyErr_SetString(PyExc_TypeError, "the batch and its keys must be lists");
+        return NULL;
+    }
+    lo = PyLong_AsSsize_t(args[4]);
+    if (lo == -1 && PyErr_Occurred()) {
+        return NULL;
+    }
+    hi = PyLong_AsSsize_t(args[5]);
+    if (hi == -1 && PyErr_Occurred()) {
+        return NULL;
+    }
+    b.tree = args[0];
+    b.batch = args[2];
+    b.keys = args[3];
+
+    attr = PyObject_GetAttr(b.tree, str_compress_duplicates);
+    if (attr == NULL) {
+        return NULL;
+    }
+    status = PyObject_IsTrue(attr);
+    Py_DECREF(attr);
+    if (status < 0) {
+        return NULL;
+    }
+    b.compress_duplicates = status;
+
+    attr = PyObject_GetAttr(b.tree, str_policy);
+    if (attr == NULL) {
+        return NULL;
+    }
+    b.policy = attr != Py_None;
+    Py_DECREF(attr);
+
+    attr = PyObject_GetAttr(b.tree, str_size);
+    if (attr == NULL) {
+        return NULL;
+    }
+    b.size = PyLong_AsSsize_t(attr);
+    Py_DECREF(attr);
+    if (b.size == -1 && PyErr_Occurred()) {
+        return NULL;
+    }
+
+    /* Looked up on the class, the instance method gives back the function it wraps */
+    attr = PyObject_GetAttr((PyObject *)Py_TYPE(b.tree), str_insert_batch);
+    if (attr == NULL) {
+        return NULL;
+    }
+    b.direct = attr == insert_batch_function;
+    Py_DECREF(attr);
+
+    return insert_slice(&b, args[1], lo, hi);
+}
+
+static PyMethodDef module_methods[] = {
+    {"search_min_range", (PyCFunction)(void (*)(void))search_min_range, METH_FASTCALL,
+     "search_min_range(node, point)\n--\n\n"
+     "Returns the node of the smallest interval containing the point in the subtree rooted at node, or None."},
+    {NULL, NULL, 0, NULL},
+};
+
+static PyMethodDef insert_node_def = {
+    "insert_node", (PyCFunction)(void (*)(void))insert_node, METH_FASTCALL,
+    "insert_node(tree, node, start, end, key)\n--\n\n"
+    "Inserts an interval into the subtree rooted at node and returns the new root of the subtree.\n\n"
+    "Module attribute `insert_node` wraps this function in an instance method, so that it can be\n"
+    "installed as RangeTree.insert_node.",
+};
+
+static PyMethodDef insert_batch_def = {
+    "_insert_batch", (PyCFunction)(void (*)(void))insert_batch, METH_FASTCALL,
+    "_insert_batch(tree, node, batch, keys, lo, hi)\n--\n\n"
+    "Inserts the sorted intervals batch[lo:hi] into the subtree rooted at node in a single descent and\n"
+    "returns the new root of the subtree.\n\n"
+    "Module attribute `insert_batch` wraps this function in an instance method, so that it can be\n"
+    "installed as RangeTree._insert_batch.",
+};
+
+static struct PyModuleDef module = {
+    PyModuleDef_HEAD_INIT,
+    .m_name = "avl_range_tree._avl_tree",
+    .m_doc = "Compiled node type and kernels for avl_range_tree.avl_tree.",
+    .m_size = -1,
+    .m_methods = module_methods,
+};
+
+PyMODINIT_FUNC
+PyInit__avl_tree(void)
+{
+    PyObject *m, *function, *method;
+
+    if (PyType_Ready(&NodeType) < 0) {
+        return NULL;
+    }
+    if (!(str_new_node = PyUnicode_InternFromString("_new_node"))
+            || !(str_size = PyUnicode_InternFromString("_size"))
+            || !(str_left_rotate = PyUnicode_InternFromString("left_rotate"))
+            || !(str_right_rotate = PyUnicode_InternFromString("right_rotate"))
+            || !(str_rebalance = PyUnicode_InternFromString("_rebalance"))
+            || !(str_compress_duplicates = PyUnicode_InternFromString("compress_duplicates"))
+            || !(str_policy = PyUnicode_InternFromString("policy"))
+            || !(str_build_tree = PyUnicode_InternFromString("_build_tree"))
+            || !(str_join = PyUnicode_InternFromString("_join"))
+            || !(str_insert_batch = PyUnicode_InternFromString("_insert_batch"))) {
+        return NULL;
+    }
+    m = PyModule_Create(&module);
+    if (m == NULL) {
+        return NULL;
+    }
+    Py_INCREF(&NodeType);
+    if (PyModule_AddObject(m, "RangeNode", (PyObject *)&NodeType) < 0) {
+        Py_DECREF(&NodeType);
+        goto error;
+    }
+    function = PyCFunction_NewEx(&insert_node_def, NULL, NULL);
+    if (function == NULL) {
+        goto error;
+    }
+    method = PyInstanceMethod_New(function);
+    Py_DECREF(function);
+    if (method == NULL || PyModule_AddObject(m, "insert_node", method) < 0) {
+        Py_XDECREF(method);
+        goto error;
+    }
+    insert_batch_function = PyCFunction_NewEx(&insert_batch_def, NULL, NULL);
+    if (insert_batch_function == NULL) {
+        goto error;
+    }
+    method = PyInstanceMethod_New(insert_batch_function);
+    if (method == NULL || PyModule_AddObject(m, "insert_batch", method) < 0) {
+        Py_XDECREF(method);
+        goto error;
+    }
+    return m;
+
+error:
+    Py_DECREF(m);
+    return NULL;
+}
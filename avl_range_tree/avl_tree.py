@@ -1,7 +1,28 @@
-from typing import Optional, Dict, Any, Generator, Tuple, Callable
+from __future__ import annotations
 
-import orjson
-import json
+import os
+from bisect import bisect_left, bisect_right
+from heapq import heappop, heappush, merge
+from operator import attrgetter, itemgetter
+
+# Annotations are never evaluated at runtime, so `typing` is only imported by type checkers
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Optional, Dict, Any, Generator, Iterable, Iterator, List, Tuple, Callable
+
+    from array import array
+    from threading import Thread
+
+    from avl_range_tree.policies import SelectionPolicy
+    from avl_range_tree.rebuild import RebuildMonitor
+
+# Version of the layout written by `RangeTree.to_snapshot`
+SNAPSHOT_FORMAT = 1
+
+# `RangeTree.insert_many` rebuilds the tree when k * log2(n + k) > REBUILD_FACTOR * (n + k), where k is the
+# batch size and n the tree size: building a node from scratch costs about as much as REBUILD_FACTOR levels
+# of an insertion path
+REBUILD_FACTOR = 4
 
 
 class RangeNode:
@@ -16,8 +37,14 @@ class RangeNode:
         left (RangeNode): The left child node.
         right (RangeNode): The right child node.
         key (str): The unique key associated with the interval.
+        bucket (list): Additional keys sharing this exact interval, or None. Only used
+            when the tree compresses duplicate intervals.
+        score: The score given to the interval by the selection policy of the tree, or None.
+        best: The lowest score in the subtree rooted at this node, or None without a selection policy.
     """
 
+    __slots__ = ("start", "end", "max", "height", "left", "right", "key", "bucket", "score", "best")
+
     def __init__(self, start, end, key):
         """
         Initializes an RangeNode with a given interval.
@@ -34,6 +61,9 @@ class RangeNode:
         self.left = None
         self.right = None
         self.key = key
+        self.bucket = None
+        self.score = None
+        self.best = None
 
 
 class RangeTree:
@@ -46,12 +76,30 @@ class RangeTree:
 
     Attributes:
         root (RangeNode): The root of the AVL tree.
+        compress_duplicates (bool): Whether identical (start, end) intervals share a single node.
+        policy (SelectionPolicy): The policy choosing which containing interval `search` returns,
+            or None for the smallest one.
     """
 
-    def __init__(self):
-        """Initializes an empty RangeTree."""
+    def __init__(self, compress_duplicates: bool = False, policy: Optional[SelectionPolicy] = None):
+        """
+        Initializes an empty RangeTree.
+
+        Args:
+            compress_duplicates (bool): If True, intervals with the same (start, end) are stored
+                in a single node holding a bucket of keys instead of one node per key. The
+                first inserted key is the one returned by `search`, and the one scored by the
+                selection policy.
+            policy (Optional[SelectionPolicy]): A policy from `avl_range_tree.policies` choosing
+                which of the intervals containing a point `search` returns, or None for the
+                smallest one. Policies are not serialized, trees restored from a serialized
+                form or a snapshot use the default.
+        """
         self.root = None
-        self._size = 0  # Initialize a size attribute to keep track of the number of nodes
+        self.compress_duplicates = compress_duplicates
+        self.policy = policy
+        self._size = 0  # Initialize a size attribute to keep track of the number of intervals
+        self._monitor = None  # RebuildMonitor, set by `enable_auto_rebuild`
 
     def get_height(self, node):
         """
@@ -124,6 +172,11 @@ class RangeTree:
         x.max = max(x.end, self.get_max(x.left), self.get_max(x.right))
         z.max = max(z.end, self.get_max(z.left), self.get_max(z.right))
 
+        # Update best scores
+        if self.policy is not None:
+            self._update_best(x)
+            self._update_best(z)
+
         return z
 
     def right_rotate(self, x):
@@ -153,6 +206,11 @@ class RangeTree:
         x.max = max(x.end, self.get_max(x.left), self.get_max(x.right))
         z.max = max(z.end, self.get_max(z.left), self.get_max(z.right))
 
+        # Update best scores
+        if self.policy is not None:
+            self._update_best(x)
+            self._update_best(z)
+
         return z
 
     def insert_node(self, node, start, end, key):
@@ -172,10 +230,24 @@ class RangeTree:
         """
         # Base case: empty subtree
         if not node:
-            return RangeNode(start, end, key)
-
+            return self._new_node(start, end, key, self._size)
+
+        if self.compress_duplicates:
+            # Identical intervals share one node, the extra keys go to its bucket
+            if start == node.start and end == node.end:
+                if node.bucket is None:
+                    node.bucket = [key]
+                else:
+                    node.bucket.append(key)
+                return node
+
+            # Order by (start, end) so that identical intervals always meet on the insertion path
+            if (start, end) < (node.start, node.end):
+                node.left = self.insert_node(node.left, start, end, key)
+            else:
+                node.right = self.insert_node(node.right, start, end, key)
         # Recursively insert into the left or right subtree
-        if start < node.start:
+        elif start < node.start:
             node.left = self.insert_node(node.left, start, end, key)
         else:
             node.right = self.insert_node(node.right, start, end, key)
@@ -186,6 +258,13 @@ class RangeTree:
         # Update height
         node.height = 1 + max(self.get_height(node.left), self.get_height(node.right))
 
+        # Update best score
+        if self.policy is not None:
+            self._update_best(node)
+
+        if self.compress_duplicates:
+            return self._rebalance(node)
+
         # Get the balance factor to check whether this node became unbalanced
         balance = self.get_balance(node)
 
@@ -203,7 +282,7 @@ class RangeTree:
             return self.left_rotate(node)
 
         # Left Right Case
-        if balance > 1 and start > node.left.start:
+        if balance > 1 and start >= node.left.start:  # an equal start went to the right of node.left
             node.left = self.left_rotate(node.left)
             return self.right_rotate(node)
 
@@ -214,6 +293,89 @@ class RangeTree:
 
         return node
 
+    def _new_node(self, start, end, key, seq):
+        """
+        Creates a node for a new interval, scored by the selection policy of the tree.
+
+        Args:
+            start (int): The start value of the interval.
+            end (int): The end value of the interval.
+            key (str): The key associated with the interval.
+            seq (int): The insertion sequence number of the interval.
+
+        Returns:
+            RangeNode: The new node.
+        """
+        node = RangeNode(start, end, key)
+        if self.policy is not None:
+            node.score = node.best = self.policy.score(start, end, key, seq)
+        return node
+
+    def _copy_node(self, node: RangeNode) -> RangeNode:
+        """
+        Returns a shallow copy of a node, sharing its children.
+
+        Args:
+            node (RangeNode): The node to copy.
+
+        Returns:
+            RangeNode: The copy of the node.
+        """
+        copy = RangeNode(node.start, node.end, node.key)
+        copy.max = node.max
+        copy.height = node.height
+        copy.left = node.left
+        copy.right = node.right
+        copy.bucket = node.bucket
+        copy.score = node.score
+        copy.best = node.best
+        return copy
+
+    def _update_best(self, node):
+        """
+        Recomputes the lowest score of the subtree rooted at a node from its children.
+
+        Args:
+            node (RangeNode): The node to update.
+        """
+        best = node.score
+        if node.left is not None and node.left.best < best:
+            best = node.left.best
+        if node.right is not None and node.right.best < best:
+            best = node.right.best
+        node.best = best
+
+    def _rebalance(self, node):
+        """
+        Restores the AVL property of a node whose children are already balanced.
+
+        The rotation case is chosen from the balance factor of the heavy child, so it does not
+        depend on how the intervals are ordered.
+
+        Args:
+            node (RangeNode): The node to rebalance, with up to date height and max values.
+
+        Returns:
+            RangeNode: The root of the subtree after rebalancing.
+        """
+        balance = self.get_balance(node)
+
+        if balance > 1:
+            # Left Right Case
+            if self.get_balance(node.left) < 0:
+                node.left = self.left_rotate(node.left)
+            # Left Left Case
+            return self.right_rotate(node)
+
+        if balance < -1:
+            # Right Left Case
+            if self.get_balance(node.right) > 0:
+                node.right = self.right_rotate(node.right)
+            # Right Right Case
+            return self.left_rotate(node)
+
+        return node
+
     def insert(self, start, end, key):
         """
         Inserts a new interval into the AVL tree.
@@ -223,9 +385,453 @@ class RangeTree:
             end (int): The end value of the interval.
             key (str): The key associated with the interval.
         """
-        self.root = self.insert_node(self.root, start, end, key)
-        # Increment the size when a new node is inserted
-        self._size += 1
+        monitor = self._monitor
+        if monitor is None:
+            self.root = self.insert_node(self.root, start, end, key)
+            # Increment the size when a new node is inserted
+            self._size += 1
+            return
+
+        with monitor.lock:
+            self.root = self.insert_node(self.root, start, end, key)
+            self._size += 1
+            monitor.written(self, ((start, end, key),))
+
+    def insert_many(self, intervals: Iterable[Tuple[int, int, str]]) -> None:
+        """
+        Inserts a batch of intervals into the AVL tree.
+
+        The batch is sorted first, and its intervals are numbered for the selection policy in the
+        order they are given. A batch that is small compared with the tree is inserted in a
+        single descent: the batch is split at every visited node and each node on the shared paths
+        is updated and rebalanced once, instead of once per interval. A large batch is merged with
+        the in-order sequence of the tree, and the tree is rebuilt perfectly balanced in linear
+        time. Intervals already in the tree keep their order before new ones with the same start.
+
+        Args:
+            intervals (Iterable[Tuple[int, int, str]]): The (start, end, key) intervals to insert.
+        """
+        intervals = list(intervals)
+        if not intervals:
+            return
+        order = itemgetter(0, 1) if self.compress_duplicates else itemgetter(0)
+        batch = sorted(
+            ((start, end, key, position) for position, (start, end, key) in enumerate(intervals)), key=order
+        )
+
+        monitor = self._monitor
+        if monitor is None:
+            self._insert_sorted(batch)
+            return
+
+        with monitor.lock:
+            self._insert_sorted(batch)
+            monitor.written(self, intervals)
+
+    def _insert_sorted(self, batch: List[Tuple[int, int, str, int]]) -> None:
+        """
+        Inserts a batch of intervals sorted in tree order, rebuilding the tree if the batch is large.
+
+        Args:
+            batch (List[Tuple[int, int, str, int]]): The (start, end, key, position) intervals to insert, sorted
+                by start, or by (start, end) when duplicates are compressed. The position of an interval in
+                the batch given by the caller sets its sequence number.
+        """
+        size = self._size + len(batch)
+        if len(batch) * size.bit_length() > REBUILD_FACTOR * size:
+            # Rebuilding costs O(n + k), less than the O(k log(n + k)) of inserting one by one
+            new_nodes = [self._new_node(start, end, key, self._size + position) for start, end, key, position in batch]
+            node_order = attrgetter("start", "end") if self.compress_duplicates else attrgetter("start")
+            self.root = self._build_tree(list(merge(self._nodes(), new_nodes, key=node_order)))
+            self._size = size
+        else:
+            if self.compress_duplicates:
+                keys = [(start, end) for start, end, _, _ in batch]
+            else:
+                keys = [start for start, _, _, _ in batch]
+            self.root = self._insert_batch(self.root, batch, keys, 0, len(batch))
+            self._size = size
+
+    def _insert_batch(self, node, batch, keys, lo, hi):
+        """
+        Recursively inserts a slice of a sorted batch into the subtree rooted at the given node.
+
+        The slice is split at the node: intervals that go before it are inserted into the left
+        subtree and the others into the right subtree, with the same order as `insert_node`. The
+        node is then updated and rebalanced once. When one side received many more intervals than
+        the other, their heights may differ by more than a rotation can fix, and both sides are
+        joined through the node instead.
+
+        Args:
+            node (RangeNode): The root of the subtree, or None.
+            batch (List[Tuple[int, int, str, int]]): The (start, end, key, position) intervals, sorted in
+                tree order.
+            keys (list): The sort key of every interval of the batch: its start, or (start, end) when
+                duplicates are compressed.
+            lo (int): The index of the first interval of the slice.
+            hi (int): The index after the last interval of the slice.
+
+        Returns:
+            RangeNode: The root of the subtree after insertion.
+        """
+        if lo >= hi:
+            return node
+
+        # Base case: empty subtree
+        if not node:
+            if hi - lo == 1:
+                start, end, key, position = batch[lo]
+                return self._new_node(start, end, key, self._size + position)
+            return self._build_tree(
+                [self._new_node(start, end, key, self._size + position) for start, end, key, position in batch[lo:hi]]
+            )
+
+        if self.compress_duplicates:
+            # Identical intervals share one node, the extra keys go to its bucket
+            interval = (node.start, node.end)
+            split = bisect_left(keys, interval, lo, hi)
+            duplicates = bisect_right(keys, interval, split, hi)
+            if duplicates > split:
+                node.bucket = (node.bucket or []) + [key for _, _, key, _ in batch[split:duplicates]]
+            node.left = self._insert_batch(node.left, batch, keys, lo, split)
+            node.right = self._insert_batch(node.right, batch, keys, duplicates, hi)
+        else:
+            # Equal starts go to the right, as in `insert_node`
+            split = bisect_left(keys, node.start, lo, hi)
+            node.left = self._insert_batch(node.left, batch, keys, lo, split)
+            node.right = self._insert_batch(node.right, batch, keys, split, hi)
+
+        node.max = max(node.end, self.get_max(node.left), self.get_max(node.right))
+        node.height = 1 + max(self.get_height(node.left), self.get_height(node.right))
+        if self.policy is not None:
+            self._update_best(node)
+
+        if abs(self.get_balance(node)) > 2:
+            return self._join(node.left, node, node.right)
+        return self._rebalance(node)
+
+    def _join(self, left, node, right):
+        """
+        Links two balanced subtrees of any heights through a node that goes between them.
+
+        The node is attached along the inner spine of the taller subtree at the height of the
+        shorter one, and the spine is rebalanced on the way back up, so the cost is proportional
+        to the difference of heights.
+
+        Args:
+            left (RangeNode): The subtree that goes before the node, or None.
+            node (RangeNode): The node that goes between both subtrees.
+            right (RangeNode): The subtree that goes after the node, or None.
+
+        Returns:
+            RangeNode: The root of the joined subtree.
+        """
+        if self.get_height(left) > self.get_height(right) + 1:
+            left.right = self._join(left.right, node, right)
+            node = left
+        elif self.get_height(right) > self.get_height(left) + 1:
+            right.left = self._join(left, node, right.left)
+            node = right
+        else:
+            node.left = left
+            node.right = right
+
+        node.max = max(node.end, self.get_max(node.left), self.get_max(node.right))
+        node.height = 1 + max(self.get_height(node.left), self.get_height(node.right))
+        if self.policy is not None:
+            self._update_best(node)
+        return self._rebalance(node)
+
+    def _nodes(self) -> Iterator[RangeNode]:
+        """
+        Iterates over the nodes of the tree in order.
+
+        Yields:
+            RangeNode: Every node of the tree, sorted by start value.
+        """
+        stack = []
+        node = self.root
+        while stack or node:
+            while node:
+                stack.append(node)
+                node = node.left
+            node = stack.pop()
+            yield node
+            node = node.right
+
+    def _build_tree(self, nodes: List[RangeNode]) -> Optional[RangeNode]:
+        """
+        Links nodes sorted in tree order into a perfectly balanced tree.
+
+        When duplicates are compressed, consecutive identical intervals are grouped in one node.
+
+        Args:
+            nodes (List[RangeNode]): The nodes, sorted by start, or by (start, end) when duplicates
+                are compressed.
+
+        Returns:
+            Optional[RangeNode]: The root of the new tree.
+        """
+        if self.compress_duplicates:
+            nodes = self._group_duplicates(nodes)
+        return self._build_balanced(nodes, 0, len(nodes))
+
+    def _group_duplicates(self, nodes: List[RangeNode]) -> List[RangeNode]:
+        """
+        Merges consecutive nodes holding the same interval into the first one.
+
+        The keys of the merged nodes are appended to the bucket of the first node, in order. The
+        bucket is replaced by a new list, so that lists shared with other trees are not modified.
+
+        Args:
+            nodes (List[RangeNode]): The nodes, sorted by (start, end).
+
+        Returns:
+            List[RangeNode]: The nodes holding distinct intervals.
+        """
+        grouped = []
+        extra_keys = []
+        for node in nodes:
+            if grouped and node.start == grouped[-1].start and node.end == grouped[-1].end:
+                extra_keys.append(node.key)
+                if node.bucket:
+                    extra_keys.extend(node.bucket)
+                continue
+            if extra_keys:
+                grouped[-1].bucket = (grouped[-1].bucket or []) + extra_keys
+                extra_keys = []
+            grouped.append(node)
+        if extra_keys:
+            grouped[-1].bucket = (grouped[-1].bucket or []) + extra_keys
+        return grouped
+
+    def _build_balanced(self, nodes, lo, hi):
+        """
+        Recursively links a slice of sorted nodes into a perfectly balanced subtree.
+
+        Args:
+            nodes (List[RangeNode]): The nodes in tree order.
+            lo (int): The index of the first node of the slice.
+            hi (int): The index after the last node of the slice.
+
+        Returns:
+            RangeNode: The root of the subtree, or None if the slice is empty.
+        """
+        if lo >= hi:
+            return None
+
+        mid = (lo + hi) // 2
+        node = nodes[mid]
+        node.left = self._build_balanced(nodes, lo, mid)
+        node.right = self._build_balanced(nodes, mid + 1, hi)
+        node.max = max(node.end, self.get_max(node.left), self.get_max(node.right))
+        node.height = 1 + max(self.get_height(node.left), self.get_height(node.right))
+        if self.policy is not None:
+            self._update_best(node)
+        return node
+
+    # Adaptive rebuild
+    def enable_auto_rebuild(
+            self,
+            height_ratio: Optional[float] = 1.5,
+            visit_ratio: Optional[float] = 2.0,
+            sample_every: int = 64,
+            window: int = 32,
+            min_size: int = 1024,
+            background: bool = True,
+    ) -> None:
+        """
+        Rebuilds the tree into a perfectly balanced layout whenever it degrades.
+
+        The height of the tree is compared with the optimal height, log2 of the number of intervals,
+        after every write. One search out of `sample_every` also counts the nodes it visits, and the
+        averages over windows of `window` samples are compared with the optimal height, or with the
+        average measured right after the last rebuild when it is higher, as happens with heavily
+        overlapping intervals.
+
+        Background rebuilds work on copies of the nodes, so searches are never blocked and keep
+        seeing the previous layout until the new one is swapped in with a single assignment. The
+        search or write crossing a threshold only starts the rebuild thread, which copies the nodes
+        while holding the write lock. Writes made after the copy go to the previous layout and are
+        replayed into the new one. Writes take a lock once automatic rebuilds are enabled.
+
+        Like `insert_many`, a rebuild may change which of several intervals of the same width is
+        returned for a point.
+
+        Args:
+            height_ratio (Optional[float]): Rebuild when the height exceeds this multiple of the optimal height,
+                or None to ignore the height. An AVL tree stays below 1.44 times the optimal height.
+            visit_ratio (Optional[float]): Rebuild when the average number of nodes visited per search exceeds
+                this multiple of the reference, or None to ignore visits.
+            sample_every (int): One search out of `sample_every` is measured.
+            window (int): The number of measured searches averaged before the visits are compared.
+            min_size (int): Trees with fewer intervals are never rebuilt automatically.
+            background (bool): Whether automatic rebuilds run in a background thread.
+        """
+        from avl_range_tree.rebuild import RebuildMonitor  # Imported on first use to keep the module import cheap
+
+        self.disable_auto_rebuild()
+        self._monitor = RebuildMonitor(height_ratio, visit_ratio, sample_every, window, min_size, background)
+
+    def disable_auto_rebuild(self) -> None:
+        """Stops tracking degradation, after waiting for the running background rebuild if any."""
+        if self._monitor is not None:
+            self._monitor.wait()
+            self._monitor = None
+
+    def wait_rebuild(self, timeout: Optional[float] = None) -> bool:
+        """
+        Waits for the running background rebuild, if any.
+
+        Args:
+            timeout (Optional[float]): The maximum number of seconds to wait, or None to wait until it is done.
+
+        Returns:
+            bool: True if no rebuild is running anymore.
+        """
+        return self._monitor is None or self._monitor.wait(timeout)
+
+    def degradation(self, points: Optional[Iterable[int]] = None) -> Dict[str, Any]:
+        """
+        Reports how far the layout of the tree is from a perfectly balanced one.
+
+        Args:
+            points (Optional[Iterable[int]]): Points to measure the number of nodes visited per search on. Without
+                points, the last average sampled by automatic rebuilds is reported, if any.
+
+        Returns:
+            Dict[str, Any]: The number of intervals ("size"), the height of the tree ("height"), the height of a
+            perfectly balanced tree ("optimal_height"), their ratio ("height_ratio"), the average number of nodes
+            visited per search or None ("visits_per_search") and the number of rebuilds since
+            `enable_auto_rebuild` ("rebuilds").
+        """
+        if points is not None:
+            points = list(points)
+            visits = sum(map(self._search_visits, points)) / len(points) if points else None
+        else:
+            visits = self._monitor.visits_per_search if self._monitor is not None else None
+
+        height = self.get_height(self.root)
+        optimal = self._size.bit_length()
+        return {
+            "size": self._size,
+            "height": height,
+            "optimal_height": optimal,
+            "height_ratio": height / optimal if optimal else 1.0,
+            "visits_per_search": visits,
+            "rebuilds": self._monitor.rebuilds if self._monitor is not None else 0,
+        }
+
+    def rebuild(self, background: bool = False) -> Optional[Thread]:
+        """
+        Rebuilds the tree into a compact, perfectly balanced layout.
+
+        The new layout is built from copies of the nodes, so searches running in other threads keep
+        working on the previous one until the new root is swapped in. When duplicates are
+        compressed, identical intervals left in separate nodes are merged.
+
+        Args:
+            background (bool): If True, the nodes are copied and the layout is built in a background thread,
+                and the method returns immediately. Intervals inserted once the nodes are copied are
+                replayed into the new layout before it is swapped in.
+
+        Returns:
+            Optional[Thread]: The background thread, or the one already running, or None if the rebuild is done.
+        """
+        monitor = self._monitor
+        if monitor is None:
+            if not background:
+                self.root = self._build_tree(self._copy_nodes())
+                return None
+            from avl_range_tree.rebuild import RebuildMonitor
+
+            # A monitor without thresholds only serializes the writes with the rebuild, and is removed after it
+            monitor = self._monitor = RebuildMonitor(detach=True)
+
+        if background:
+            return monitor.start(self)
+        with monitor.lock:
+            if monitor.running:
+                return monitor.thread
+            self.root = self._build_tree(self._copy_nodes())
+            monitor.rebuilt()
+            return None
+
+    def _copy_nodes(self) -> List[RangeNode]:
+        """
+        Copies the nodes of the tree in order, with their own bucket lists.
+
+        Returns:
+            List[RangeNode]: The copies, sorted in tree order.
+        """
+        copy_node = self._copy_node
+        nodes = []
+        for node in self._nodes():
+            node = copy_node(node)
+            if node.bucket:
+                node.bucket = list(node.bucket)
+            nodes.append(node)
+        return nodes
+
+    def _background_rebuild(self, monitor: RebuildMonitor) -> None:
+        """
+        Runs a background rebuild: copies the nodes, builds the new layout, replays the pending writes and
+        swaps it in.
+
+        Only the copy and the swap hold the lock of the monitor, which blocks the writes but never the searches.
+
+        Args:
+            monitor (RebuildMonitor): The monitor of the tree, which started the rebuild.
+        """
+        try:
+            with monitor.lock:
+                nodes = self._copy_nodes()
+                size = self._size
+                monitor.pending = []
+            try:
+                root = self._build_tree(nodes)
+            except BaseException:
+                # The writes went to the previous layout, which stays in place
+                with monitor.lock:
+                    monitor.pending = None
+                raise
+            with monitor.lock:
+                # Replayed intervals get the same sequence numbers as in the previous layout
+                self._size = size
+                for start, end, key in monitor.pending:
+                    root = self.insert_node(root, start, end, key)
+                    self._size += 1
+                monitor.pending = None
+                self.root = root
+                monitor.rebuilt()
+        finally:
+            if monitor.detach:
+                with monitor.lock:
+                    if self._monitor is monitor:
+                        self._monitor = None
+
+    def _search_visits(self, point: int) -> int:
+        """
+        Counts the nodes the default search visits for a point.
+
+        Args:
+            point (int): The searched point.
+
+        Returns:
+            int: The number of nodes visited.
+        """
+        visits = 0
+        stack = [self.root] if self.root else []
+        while stack:
+            node = stack.pop()
+            visits += 1
+            left = node.left
+            if left and point <= left.max:
+                stack.append(left)
+            right = node.right
+            if right and node.start <= point <= right.max:
+                stack.append(right)
+        return visits
 
     def search_min_range(self, node, point):
         """
@@ -245,67 +851,281 @@ class RangeTree:
         if not node:
             return None
 
+        if point < node.start:
+            # The point is less than the current node's start, so only the left subtree can contain it
+            if node.left and point <= node.left.max:
+                return self.search_min_range(node.left, point)
+            return None
+
         # Check if the current node's interval contains the point
-        if node.start <= point <= node.end:
-            min_node = node
+        min_node = node if point <= node.end else None
+
+        # Intervals in the left subtree start earlier and may still reach the point
+        if node.left and point <= node.left.max:
             left_node = self.search_min_range(node.left, point)
 
             # Check if a smaller interval exists in the left subtree
             if left_node and (
-                    left_node.end - left_node.start < min_node.end - min_node.start
+                    min_node is None or left_node.end - left_node.start < min_node.end - min_node.start
             ):
                 min_node = left_node
 
-            # Only search the right subtree if there's a chance to find a smaller interval
-            if node.right and point <= self.get_max(node.right):
-                right_node = self.search_min_range(node.right, point)
+        # Only search the right subtree if there's a chance to find a smaller interval
+        if node.right and point <= node.right.max:
+            right_node = self.search_min_range(node.right, point)
 
-                # Check if a smaller interval exists in the right subtree
-                if right_node and (
-                        right_node.end - right_node.start < min_node.end - min_node.start
-                ):
-                    min_node = right_node
+            # Check if a smaller interval exists in the right subtree
+            if right_node and (
+                    min_node is None or right_node.end - right_node.start < min_node.end - min_node.start
+            ):
+                min_node = right_node
 
-            return min_node
-        elif point < node.start:
-            # The point is less than the current node's start, so we should search the left subtree
-            return self.search_min_range(node.left, point)
-        else:
-            # The point is greater than the current node's end, so we should search the right subtree
-            # Only if the point is within the max range of the right subtree
-            if node.right and point <= self.get_max(node.right):
-                return self.search_min_range(node.right, point)
-        return None
+        return min_node
+
+    def search_best_range(self, node, point, best):
+        """
+        Recursively searches for the containing interval with the lowest policy score in the subtree
+        rooted at the given node.
+
+        Subtrees whose best score cannot beat the best interval found so far are skipped. The
+        nodes are visited in pre-order and only a strictly lower score replaces the best interval,
+        so ties are broken like in `search_min_range`.
+
+        Args:
+            node (RangeNode): The root of the subtree to search.
+            point (int): The point to find an interval for.
+            best (RangeNode): The best node found so far, or None.
+
+        Returns:
+            RangeNode: The best node found in the subtree or before, or None if there is none.
+        """
+        if not node:
+            return best
+
+        if point < node.start:
+            # Only the left subtree can contain the point
+            left = node.left
+            if left and point <= left.max and (best is None or left.best < best.score):
+                return self.search_best_range(left, point, best)
+            return best
+
+        if point <= node.end and (best is None or node.score < best.score):
+            best = node
+
+        left = node.left
+        if left and point <= left.max and (best is None or left.best < best.score):
+            best = self.search_best_range(left, point, best)
+
+        right = node.right
+        if right and point <= right.max and (best is None or right.best < best.score):
+            best = self.search_best_range(right, point, best)
+
+        return best
 
     def search(self, point):
         """
         Searches for the smallest interval that contains a given point in the entire tree.
 
+        With a selection policy, the containing interval with the lowest score is returned instead.
+
         Args:
             point (int): The point to find an interval for.
 
         Returns:
             tuple: A tuple (start, end) representing the smallest interval containing the point, or None if no such interval exists.
         """
-        node = self.search_min_range(self.root, point)
+        if self._monitor is not None:
+            self._monitor.searched(self, point)
+        if self.policy is None:
+            node = self.search_min_range(self.root, point)
+        else:
+            node = self.search_best_range(self.root, point, None)
         if node:
             return (node.start, node.end, node.key)
         return None
 
+    def search_sorted(self, points: Iterable[int]) -> Iterator[Optional[Tuple[int, int, str]]]:
+        """
+        Searches for the smallest interval containing each point of an ascending stream of points.
+
+        Instead of starting every search at the root, the tree is swept once in start order while
+        the points advance. Every interval starting at or before the current point enters a heap of
+        active intervals ordered by width, and intervals ending before the current point are
+        dropped when they reach the top of the heap. Subtrees whose `max` is below the current
+        point can never contain it nor any later point, so the sweep skips them without visiting
+        their nodes. Each interval is pushed and popped at most once, so a sorted stream costs
+        amortized O(log m) per point, where m is the number of active intervals, plus at most a
+        single pass over the tree.
+
+        Ties are broken like in `search`, which returns the first interval in pre-order among the
+        smallest ones: the heap orders intervals of the same width by their path from the root.
+        With a selection policy, the heap is ordered by score instead of width.
+
+        Args:
+            points (Iterable[int]): The points to find an interval for, in ascending order.
+
+        Yields:
+            Optional[Tuple[int, int, str]]: The result of `search` for each point, in the same order.
+
+        Raises:
+            ValueError: If a point is smaller than the previous one.
+        """
+        # In-order walk of the tree: the path of a node is a tuple of 0 (left) and 1 (right) steps
+        stack = []
+        node, path = self.root, ()
+        active = []  # Heap of (width, path, node) for the intervals starting at or before the point
+        previous = None
+        policy = self.policy  # With a selection policy, the heap is ordered by score instead of width
+
+        for point in points:
+            if previous is not None and point < previous:
+                raise ValueError(f"Points must be sorted in ascending order, got {point} after {previous}")
+            previous = point
+
+            # Activate every interval starting at or before the point, skipping the subtrees that end before it
+            while True:
+                while node is not None and node.max >= point:
+                    stack.append((node, path))
+                    node, path = node.left, path + (0,)
+                node = None
+                if not stack or stack[-1][0].start > point:
+                    break
+                top, top_path = stack.pop()
+                if top.end >= point:
+                    heappush(active, (top.end - top.start if policy is None else top.score, top_path, top))
+                node, path = top.right, top_path + (1,)
+
+            # Drop the smallest intervals as long as they end before the point
+            while active and active[0][2].end < point:
+                heappop(active)
+
+            if active:
+                found = active[0][2]
+                yield (found.start, found.end, found.key)
+            else:
+                yield None
+
+    def search_keys(self, point):
+        """
+        Searches for the smallest interval that contains a given point and returns all of its keys.
+
+        When duplicate intervals are compressed, every key stored for the interval is returned in
+        insertion order. Otherwise the list holds the single key returned by `search`.
+
+        Args:
+            point (int): The point to find an interval for.
+
+        Returns:
+            tuple: A tuple (start, end, keys) for the smallest interval containing the point, or None if no such interval exists.
+        """
+        if self._monitor is not None:
+            self._monitor.searched(self, point)
+        if self.policy is None:
+            node = self.search_min_range(self.root, point)
+        else:
+            node = self.search_best_range(self.root, point, None)
+        if node:
+            keys = [node.key]
+            if node.bucket:
+                keys.extend(node.bucket)
+            return (node.start, node.end, keys)
+        return None
+
     def __len__(self):
         """
-        Returns the number of nodes in the RangeTree.
+        Returns the number of intervals in the RangeTree.
+
+        Compressed duplicate intervals are counted once per key.
 
         Returns:
-            int: The number of nodes in the tree.
+            int: The number of intervals in the tree.
         """
         return self._size
 
+    def __iter__(self) -> Iterator[Tuple[int, int, str]]:
+        """
+        Iterates over the intervals of the tree sorted by start value.
+
+        Yields:
+            Tuple[int, int, str]: A tuple representing (start, end, key) for each interval.
+        """
+        return self.in_order_traversal(self.root)
+
+    def __reversed__(self) -> Iterator[Tuple[int, int, str]]:
+        """
+        Iterates over the intervals of the tree in reverse start order.
+
+        Yields:
+            Tuple[int, int, str]: A tuple representing (start, end, key) for each interval.
+        """
+        return self.irange(reverse=True)
+
+    def irange(self, lo=None, hi=None, reverse: bool = False) -> Generator[Tuple[int, int, str], None, None]:
+        """
+        Iterates over the intervals whose start lies between two bounds, in start order.
+
+        The iteration starts at the first matching interval after a single O(log n) descent and
+        stops as soon as an interval is out of bounds, so only the relevant part of the tree is
+        visited.
+
+        Args:
+            lo (int): The smallest start to include, or None for no lower bound.
+            hi (int): The largest start to include, or None for no upper bound.
+            reverse (bool): Whether to iterate from the largest start to the smallest one.
+
+        Yields:
+            Tuple[int, int, str]: A tuple representing (start, end, key) for each interval.
+        """
+        # The stack holds the ancestors still to be visited, the next interval on top
+        stack = []
+        node = self.root
+        if not reverse:
+            while node:
+                if lo is not None and node.start < lo:
+                    node = node.right
+                else:
+                    stack.append(node)
+                    node = node.left
+            while stack:
+                node = stack.pop()
+                if hi is not None and node.start > hi:
+                    return
+                yield (node.start, node.end, node.key)
+                if node.bucket:
+                    for key in node.bucket:
+                        yield (node.start, node.end, key)
+                node = node.right
+                while node:
+                    stack.append(node)
+                    node = node.left
+        else:
+            while node:
+                if hi is not None and node.start > hi:
+                    node = node.left
+                else:
+                    stack.append(node)
+                    node = node.right
+            while stack:
+                node = stack.pop()
+                if lo is not None and node.start < lo:
+                    return
+                if node.bucket:
+                    for key in reversed(node.bucket):
+                        yield (node.start, node.end, key)
+                yield (node.start, node.end, node.key)
+                node = node.left
+                while node:
+                    stack.append(node)
+                    node = node.right
+
     def in_order_traversal(self, node: Optional[RangeNode]) -> Generator[Tuple[int, int, str], None, None]:
         """
-        In-order Traversal recursively visit the left subtree, visit the root node, and finally,
-        visit the right subtree. This order is especially useful in binary search trees to
-        retrieve elements in sorted order.
+        In-order Traversal visit the left subtree, visit the root node, and finally, visit the
+        right subtree. This order is especially useful in binary search trees to retrieve elements
+        in sorted order.
+
+        The traversal keeps the pending ancestors in an explicit stack, so every item costs O(1)
+        amortized instead of going through one generator frame per level.
 
         Args:
             node (RangeNode): The current node to start the traversal from.
@@ -313,15 +1133,22 @@ class RangeTree:
         Yields:
             Tuple[int, int, str]: A tuple representing (start, end, key) for each node.
         """
-        if node:
-            yield from self.in_order_traversal(node.left)
+        stack = []
+        while stack or node:
+            while node:
+                stack.append(node)
+                node = node.left
+            node = stack.pop()
             yield (node.start, node.end, node.key)
-            yield from self.in_order_traversal(node.right)
+            if node.bucket:
+                for key in node.bucket:
+                    yield (node.start, node.end, key)
+            node = node.right
 
     def pre_order_traversal(self, node: Optional[RangeNode]) -> Generator[Tuple[int, int, str], None, None]:
         """
-        Pre-order Traversal visit the root node first, then recursively visit the left subtree,
-        followed by the right subtree.
+        Pre-order Traversal visit the root node first, then the left subtree, followed by the
+        right subtree.
 
         Args:
             node (RangeNode): The current node to start the traversal from.
@@ -329,14 +1156,21 @@ class RangeTree:
         Yields:
             Tuple[int, int, str]: A tuple representing (start, end, key) for each node.
         """
-        if node:
+        stack = [node] if node else []
+        while stack:
+            node = stack.pop()
             yield (node.start, node.end, node.key)
-            yield from self.pre_order_traversal(node.left)
-            yield from self.pre_order_traversal(node.right)
+            if node.bucket:
+                for key in node.bucket:
+                    yield (node.start, node.end, key)
+            if node.right:
+                stack.append(node.right)
+            if node.left:
+                stack.append(node.left)
 
     def post_order_traversal(self, node: Optional[RangeNode]) -> Generator[Tuple[int, int, str], None, None]:
         """
-        Post-order traversal recursively visit the left and right subtrees before visiting the root node.
+        Post-order traversal visit the left and right subtrees before visiting the root node.
         This method is useful for operations that require processing children before their parents, such
         as tree deletions.
 
@@ -346,10 +1180,22 @@ class RangeTree:
         Yields:
             Tuple[int, int, str]: A tuple representing (start, end, key) for each node.
         """
-        if node:
-            yield from self.post_order_traversal(node.left)
-            yield from self.post_order_traversal(node.right)
-            yield (node.start, node.end, node.key)
+        stack = []
+        last = None  # The last node yielded, to know whether the right subtree of the top was visited
+        while stack or node:
+            if node:
+                stack.append(node)
+                node = node.left
+                continue
+            top = stack[-1]
+            if top.right and top.right is not last:
+                node = top.right
+            else:
+                yield (top.start, top.end, top.key)
+                if top.bucket:
+                    for key in top.bucket:
+                        yield (top.start, top.end, key)
+                last = stack.pop()
 
     # Serialization and Deserialization Methods
     def _node_to_dict(self, node: Optional[RangeNode]) -> Optional[Dict[str, Any]]:
@@ -365,7 +1211,7 @@ class RangeTree:
         """
         if node is None:
             return None
-        return {
+        node_dict = {
             "start": node.start,
             "end": node.end,
             "max": node.max,
@@ -374,6 +1220,9 @@ class RangeTree:
             "left": self._node_to_dict(node.left),  # Recursively convert the left child
             "right": self._node_to_dict(node.right),  # Recursively convert the right child
         }
+        if node.bucket:
+            node_dict["bucket"] = node.bucket  # Only present for compressed duplicate intervals
+        return node_dict
 
     def serialize(self, serializer: Optional[Callable[[Dict[str, Any]], str]] = None) -> str:
         """
@@ -386,8 +1235,12 @@ class RangeTree:
             str: The serialized tree as a string.
         """
         if serializer is None:
+            import json  # Imported on first use to keep the module import cheap
+
             serializer = json.dumps  # Use the standard json library by default
         tree_dict = {"root": self._node_to_dict(self.root)}
+        if self.compress_duplicates:
+            tree_dict["compress_duplicates"] = True
         return serializer(tree_dict)
 
     def _dict_to_node(self, node_dict: Optional[Dict[str, Any]]) -> Optional[RangeNode]:
@@ -408,7 +1261,8 @@ class RangeTree:
         node.height = node_dict["height"]
         node.left = self._dict_to_node(node_dict["left"])  # Recursively reconstruct the left child
         node.right = self._dict_to_node(node_dict["right"])  # Recursively reconstruct the right child
-        self._size += 1
+        node.bucket = node_dict.get("bucket")
+        self._size += 1 + len(node.bucket or ())
         return node
 
     @classmethod
@@ -424,8 +1278,213 @@ class RangeTree:
             RangeTree: The deserialized tree.
         """
         if deserializer is None:
+            import json  # Imported on first use to keep the module import cheap
+
             deserializer = json.loads  # Use the standard json library by default
         tree_dict = deserializer(data)
         tree = cls()
+        tree.compress_duplicates = bool(tree_dict.get("compress_duplicates", False))
         tree.root = tree._dict_to_node(tree_dict["root"])
         return tree
+
+    # Precompiled snapshots
+    def to_snapshot(self) -> bytes:
+        """
+        Dumps the tree into a compact precompiled snapshot.
+
+        The snapshot stores the nodes in pre-order as flat columns, including the precomputed
+        `max` and `height` values and the shape of the tree, so that `from_snapshot` can rebuild
+        the exact same tree without any comparison, rotation or recursion. Keys must be
+        marshallable values such as strings or numbers.
+
+        The snapshot uses the `marshal` format of the running interpreter and is meant to be
+        loaded by the same Python version, like a `.pyc` file.
+
+        Returns:
+            bytes: The snapshot.
+        """
+        import marshal
+
+        starts, ends, keys, maxes, heights, shapes = [], [], [], [], [], []
+        buckets = {}
+        stack = [self.root] if self.root else []
+        while stack:
+            node = stack.pop()
+            if node.bucket:
+                buckets[len(starts)] = node.bucket
+            starts.append(node.start)
+            ends.append(node.end)
+            keys.append(node.key)
+            maxes.append(node.max)
+            heights.append(node.height)
+            # Bit 1 flags a left child and bit 2 a right child
+            shapes.append((node.left is not None) | (node.right is not None) << 1)
+            if node.right:
+                stack.append(node.right)
+            if node.left:
+                stack.append(node.left)
+
+        return marshal.dumps(
+            (SNAPSHOT_FORMAT, self.compress_duplicates, self._size, starts, ends, keys, maxes, heights, shapes, buckets)
+        )
+
+    @classmethod
+    def from_snapshot(cls, data: bytes) -> 'RangeTree':
+        """
+        Loads a tree from a snapshot created by `to_snapshot`, ready to be queried.
+
+        Args:
+            data (bytes): The snapshot.
+
+        Returns:
+            RangeTree: The loaded tree.
+
+        Raises:
+            ValueError: If the data is not a supported snapshot.
+        """
+        import marshal
+
+        try:
+            snapshot = marshal.loads(data)
+        except (EOFError, TypeError) as e:
+            raise ValueError("Invalid RangeTree snapshot") from e
+        if not isinstance(snapshot, tuple) or not snapshot or snapshot[0] != SNAPSHOT_FORMAT:
+            raise ValueError("Invalid RangeTree snapshot")
+        _, compress_duplicates, size, starts, ends, keys, maxes, heights, shapes, buckets = snapshot
+
+        tree = cls()
+        tree.compress_duplicates = compress_duplicates
+        tree._size = size
+
+        # Rebuild the links from the pre-order shape: a node is followed by its left child if it
+        # has one, otherwise by the right child of the closest node still waiting for one
+        waiting_right = []
+        parent_left = None
+        for i in range(len(starts)):
+            node = RangeNode(starts[i], ends[i], keys[i])
+            node.max = maxes[i]
+            node.height = heights[i]
+            if parent_left is not None:
+                parent_left.left = node
+            elif waiting_right:
+                waiting_right.pop().right = node
+            else:
+                tree.root = node
+
+            shape = shapes[i]
+            if shape & 2:
+                waiting_right.append(node)
+            parent_left = node if shape & 1 else None
+            if buckets and i in buckets:
+                node.bucket = buckets[i]
+
+        return tree
+
+    # Columnar export and import
+    def to_columns(self) -> Tuple[array, array, List[str]]:
+        """
+        Exports the intervals as columns sorted by start value.
+
+        The bounds are returned as contiguous int64 buffers, which NumPy and Arrow can wrap
+        without copying, for example with `numpy.frombuffer(starts, dtype=numpy.int64)` or
+        `pyarrow.py_buffer(starts)`. No per-row tuple is created.
+
+        Returns:
+            Tuple[array, array, List[str]]: The starts and ends as `array('q')` and the keys as a list.
+
+        Raises:
+            OverflowError: If a bound does not fit in a signed 64-bit integer.
+            TypeError: If a bound is not an int, for example a float.
+        """
+        from array import array  # Imported on first use to keep the module import cheap
+
+        starts, ends, keys = array("q"), array("q"), []
+        stack = []
+        node = self.root
+        while stack or node:
+            while node:
+                stack.append(node)
+                node = node.left
+            node = stack.pop()
+            starts.append(node.start)
+            ends.append(node.end)
+            keys.append(node.key)
+            if node.bucket:
+                for key in node.bucket:
+                    starts.append(node.start)
+                    ends.append(node.end)
+                    keys.append(key)
+            node = node.right
+        return starts, ends, keys
+
+    @classmethod
+    def from_columns(
+            cls, starts, ends, keys, compress_duplicates: bool = False, policy: Optional[SelectionPolicy] = None
+    ) -> 'RangeTree':
+        """
+        Builds a perfectly balanced tree from interval columns.
+
+        The columns can be lists, `array('q')` buffers, NumPy arrays or Arrow arrays. They are
+        converted in bulk with their `tolist` method when available, and the tree is built bottom
+        up in linear time once the intervals are sorted. Already sorted columns are not sorted
+        again. The intervals are numbered for the selection policy in row order.
+
+        Args:
+            starts: The start values of the intervals.
+            ends: The end values of the intervals.
+            keys: The keys associated with the intervals.
+            compress_duplicates (bool): Whether identical intervals share a single node.
+            policy (Optional[SelectionPolicy]): The selection policy of the tree, or None for the smallest interval.
+
+        Returns:
+            RangeTree: The new tree.
+
+        Raises:
+            ValueError: If the columns do not have the same length.
+        """
+        starts, ends, keys = (
+            column.tolist() if hasattr(column, "tolist") else list(column) for column in (starts, ends, keys)
+        )
+        if not len(starts) == len(ends) == len(keys):
+            raise ValueError(f"Columns must have the same length, got {len(starts)}, {len(ends)} and {len(keys)}")
+
+        tree = cls()
+        tree.compress_duplicates = compress_duplicates
+        tree.policy = policy
+        if compress_duplicates:
+            ordered = all(
+                starts[i] < starts[i + 1] or (starts[i] == starts[i + 1] and ends[i] <= ends[i + 1])
+                for i in range(len(starts) - 1)
+            )
+        else:
+            ordered = all(starts[i] <= starts[i + 1] for i in range(len(starts) - 1))
+        if ordered:
+            indices = range(len(starts))
+        else:
+            # Stable sort, so that intervals with the same start keep their relative order
+            indices = sorted(
+                range(len(starts)),
+                key=(lambda i: (starts[i], ends[i])) if compress_duplicates else starts.__getitem__,
+            )
+
+        # Intervals are numbered by their row, not by their position in the tree
+        new_node = tree._new_node
+        tree.root = tree._build_tree([new_node(starts[i], ends[i], keys[i], i) for i in indices])
+        tree._size = len(starts)
+        return tree
+
+
+# When the compiled accelerator is built, nodes are compiled objects and the insertion and search kernels
+# run in C. Setting the environment variable AVL_RANGE_TREE_PURE_PYTHON=1 keeps the pure Python versions.
+ACCELERATED = False
+if not os.environ.get("AVL_RANGE_TREE_PURE_PYTHON"):
+    try:
+        from avl_range_tree import _avl_tree
+    except ImportError:
+        pass
+    else:
+        RangeNode = _avl_tree.RangeNode
+        RangeTree.insert_node = _avl_tree.insert_node
+        RangeTree._insert_batch = _avl_tree.insert_batch
+        RangeTree.search_min_range = _avl_tree.search_min_range
+        ACCELERATED = True
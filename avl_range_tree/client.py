@@ -0,0 +1,258 @@
+"""
+Client for `avl_range_tree.server`, with connection pooling and request pipelining.
+
+Example:
+    client = RangeTreeClient(path="/tmp/avl_range_tree.sock")
+    client.search(123456780000000000)
+    client.search_many([123456780000000000, 987654320000000000])
+"""
+import queue
+import socket
+import sys
+import threading
+from array import array
+from contextlib import contextmanager
+
+from avl_range_tree.protocol import (
+    MAX_BATCH,
+    OP_PING,
+    OP_RELOAD,
+    OP_SEARCH,
+    OP_SEARCH_BATCH,
+    REQUEST_HEADER,
+    RESPONSE_HEADER,
+    RESULT,
+    STATUS_OK,
+)
+
+
+class RangeTreeServerError(Exception):
+    """Raised when the server answers a request with an error."""
+
+
+class _Connection:
+    """A single connection to the server, used by one thread at a time."""
+
+    def __init__(self, address, family: int, timeout):
+        self.sock = socket.socket(family, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        self.sock.connect(address)
+        if family != socket.AF_UNIX:
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = self.sock.makefile("rb")
+        self.next_id = 0
+
+    def send(self, operation: int, points=()) -> int:
+        """Sends a request without waiting for its response, and returns its id."""
+        request_id = self.next_id
+        self.next_id = (self.next_id + 1) & 0xFFFFFFFF
+        payload = array("q", points)
+        if sys.byteorder == "big":
+            payload.byteswap()  # The protocol is little-endian
+        self.sock.sendall(REQUEST_HEADER.pack(request_id, operation, len(payload)) + payload.tobytes())
+        return request_id
+
+    def receive(self, request_id: int) -> list:
+        """Reads the response of the oldest request in flight, which must have the given id."""
+        response_id, status, count = RESPONSE_HEADER.unpack(self._read(RESPONSE_HEADER.size))
+        if status != STATUS_OK:
+            raise RangeTreeServerError(self._read(count).decode("utf-8"))
+        if response_id != request_id:
+            raise RangeTreeServerError(f"Expected the response to request {request_id}, got {response_id}")
+
+        results = []
+        for _ in range(count):
+            found, start, end, key_len = RESULT.unpack(self._read(RESULT.size))
+            if found:
+                results.append((start, end, self._read(key_len).decode("utf-8")))
+            else:
+                results.append(None)
+        return results
+
+    def pipeline(self, operation: int, batches) -> list:
+        """
+        Sends a request per batch of points while a helper thread reads the responses.
+
+        The server stops reading requests while a response waits for room in the socket buffer,
+        so a client that sends everything before reading would deadlock once the responses fill
+        the buffers. Reading concurrently keeps both directions flowing.
+        """
+        sent = queue.SimpleQueue()
+        results = []
+        errors = []  # Error of the reader thread, raised in the calling thread
+        stopping = []
+
+        def read_responses():
+            try:
+                for request_id in iter(sent.get, None):
+                    results.append(self.receive(request_id))
+            except BaseException as e:
+                if not stopping:
+                    errors.append(e)
+                    self._abort()  # Unblocks the sender, whose requests would not be answered
+
+        reader = threading.Thread(target=read_responses, daemon=True)
+        reader.start()
+        try:
+            for batch in batches:
+                sent.put(self.send(operation, batch))
+        except BaseException:
+            # A send failing after the reader shut the socket down is explained by the reader error
+            if not errors:
+                stopping.append(True)
+                self._abort()  # Unblocks the reader, which would wait for responses that never come
+                raise
+        finally:
+            sent.put(None)
+            reader.join()
+        if errors:
+            raise errors[0]
+        return results
+
+    def _abort(self) -> None:
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def _read(self, size: int) -> bytes:
+        data = self.reader.read(size)
+        if len(data) != size:
+            raise ConnectionError("Connection closed by the server")
+        return data
+
+    def close(self) -> None:
+        self.reader.close()
+        self.sock.close()
+
+
+class RangeTreeClient:
+    """
+    A thread-safe client for the lookup server.
+
+    Connections are opened on demand, up to `pool_size`, and reused across calls. A connection
+    that fails is discarded instead of being returned to the pool.
+
+    Attributes:
+        pool_size (int): The maximum number of open connections.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 7878, path: str = None, pool_size: int = 4,
+                 timeout: float = None):
+        """
+        Initializes the client, without connecting yet.
+
+        Args:
+            host (str): The TCP host of the server.
+            port (int): The TCP port of the server.
+            path (str): The Unix socket path of the server, used instead of the TCP address when given.
+            pool_size (int): The maximum number of open connections.
+            timeout (float): The socket timeout in seconds, or None to wait forever.
+        """
+        if path is not None:
+            self._address, self._family = path, socket.AF_UNIX
+        else:
+            self._address, self._family = (host, port), socket.AF_INET
+        self._timeout = timeout
+        self.pool_size = pool_size
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(pool_size)
+        self._closed = False
+
+    @contextmanager
+    def _connection(self):
+        """Borrows a connection from the pool, opening one if none is idle."""
+        self._slots.acquire()
+        try:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = _Connection(self._address, self._family, self._timeout)
+            try:
+                yield conn
+            except BaseException:
+                conn.close()
+                raise
+            if self._closed:
+                conn.close()
+            else:
+                self._idle.put(conn)
+        finally:
+            self._slots.release()
+
+    def search(self, point: int):
+        """
+        Searches for the smallest interval that contains a given point.
+
+        Args:
+            point (int): The point to find an interval for.
+
+        Returns:
+            tuple: A tuple (start, end, key), or None if no interval contains the point.
+        """
+        with self._connection() as conn:
+            return conn.receive(conn.send(OP_SEARCH, (point,)))[0]
+
+    def search_many(self, points) -> list:
+        """
+        Searches for the smallest interval containing each point, in batches pipelined on one connection.
+
+        Args:
+            points (Iterable[int]): The points to find an interval for.
+
+        Returns:
+            list: The (start, end, key) tuple or None for each point, in the same order.
+        """
+        points = list(points)
+        batches = [points[i:i + MAX_BATCH] for i in range(0, len(points), MAX_BATCH)]
+        return [result for results in self.search_pipelined(batches) for result in results]
+
+    def search_pipelined(self, batches) -> list:
+        """
+        Sends several batches of points on one connection without waiting for the responses.
+
+        The responses are read by a helper thread while the requests are being sent, so that the
+        responses never fill the socket buffers, whatever the number and size of the batches.
+
+        Args:
+            batches (Iterable[Iterable[int]]): The batches of points.
+
+        Returns:
+            list: For each batch, the list of results of its points.
+        """
+        batches = list(batches)
+        with self._connection() as conn:
+            if len(batches) == 1:
+                # A single request cannot fill the buffers before the server reads it entirely
+                return [conn.receive(conn.send(OP_SEARCH_BATCH, batches[0]))]
+            return conn.pipeline(OP_SEARCH_BATCH, batches)
+
+    def ping(self) -> None:
+        """Checks that the server answers."""
+        with self._connection() as conn:
+            conn.receive(conn.send(OP_PING))
+
+    def reload(self) -> None:
+        """
+        Asks the server to reload its snapshot, and waits until the new tree is served.
+
+        Raises:
+            RangeTreeServerError: If the server could not load the snapshot.
+        """
+        with self._connection() as conn:
+            conn.receive(conn.send(OP_RELOAD))
+
+    def close(self) -> None:
+        """Closes the idle connections. Connections in use are closed when they are returned."""
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+    def __enter__(self) -> "RangeTreeClient":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
@@ -0,0 +1,389 @@
+from __future__ import annotations
+
+import mmap
+import struct
+from collections import OrderedDict
+
+from avl_range_tree.avl_tree import RangeTree
+
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Iterable, Iterator, List, Optional, Tuple
+
+# File header, stored in page 0:
+# magic, format version, page size, root page, levels, number of intervals
+HEADER = struct.Struct("<8sIIQIQ")
+MAGIC = b"AVLRPAGE"
+FORMAT_VERSION = 2
+
+# Every page starts with its type and number of entries
+PAGE_HEADER = struct.Struct("<BxH")
+LEAF_PAGE = 1
+INTERNAL_PAGE = 2
+
+# Leaf entry: start, end, tie-break rank and key length, followed by the UTF-8 encoded key
+LEAF_ENTRY = struct.Struct("<qqQH")
+# Internal entry: child page, smallest start, largest end, smallest width in the child subtree and
+# lowest rank among the intervals of that width
+INTERNAL_ENTRY = struct.Struct("<QqqQQ")
+
+
+class PagedRangeIndex:
+    """
+    A read-only, disk-backed interval index for datasets larger than RAM.
+
+    The intervals are stored in a B+-tree of fixed-size pages keyed on start. Leaf pages hold the
+    intervals sorted by start, and every internal entry is augmented with the smallest start, the
+    largest end and the smallest width of its child subtree. The file is served through `mmap`
+    and decoded pages are kept in a bounded LRU cache.
+
+    `search` has the same semantics as `RangeTree.search`: it returns the smallest interval
+    containing the point. Every interval stores a tie-break rank, and ties between intervals of
+    the same width go to the lowest rank. An index built from a RangeTree ranks the intervals in
+    the pre-order of the tree, so it returns exactly what the tree returns; an index built from
+    any other iterable ranks them in start order. Subtrees that end before the point, start after
+    it, or cannot hold a better interval than the best one found are skipped, so a lookup usually
+    touches O(log_B n) pages.
+
+    Interval bounds are stored as signed 64-bit integers and keys as UTF-8 strings.
+
+    Attributes:
+        path (str): The path of the index file.
+        page_size (int): The size of every page in bytes.
+        cache_pages (int): The maximum number of decoded pages kept in memory.
+        cache_hits (int): The number of page reads served by the cache.
+        cache_misses (int): The number of page reads decoded from the file.
+    """
+
+    def __init__(self, path: str, cache_pages: int = 1024):
+        """
+        Opens an index file created by `build`.
+
+        Args:
+            path (str): The path of the index file.
+            cache_pages (int): The maximum number of decoded pages kept in memory.
+
+        Raises:
+            ValueError: If the file is not a paged range index.
+        """
+        if cache_pages < 1:
+            raise ValueError("cache_pages must be at least 1")
+
+        self.path = path
+        self.cache_pages = cache_pages
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._cache: OrderedDict = OrderedDict()
+
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if len(self._mmap) < HEADER.size:
+            self._mmap.close()
+            raise ValueError(f"{path} is not a paged range index")
+        magic, version, self.page_size, self._root, self._levels, self._size = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            self._mmap.close()
+            raise ValueError(f"{path} is not a paged range index")
+
+    @classmethod
+    def build(
+            cls, path: str, intervals: Iterable[Tuple[int, int, str]], page_size: int = 4096, cache_pages: int = 1024
+    ) -> 'PagedRangeIndex':
+        """
+        Builds an index file from intervals sorted by start, and opens it.
+
+        Pages are written sequentially: first the leaves as the intervals are consumed, then every
+        internal level from the bottom up, and finally the header. Only the summaries of the pages
+        of the level being built are kept in memory.
+
+        When `intervals` is a RangeTree, ties are ranked in the pre-order of the tree, so that the
+        index breaks them like `RangeTree.search`. Otherwise they are ranked in start order.
+
+        Args:
+            path (str): The path of the index file to create.
+            intervals (Iterable[Tuple[int, int, str]]): The (start, end, key) intervals sorted by start,
+                for example a RangeTree.
+            page_size (int): The size of every page in bytes.
+            cache_pages (int): The maximum number of decoded pages kept in memory.
+
+        Returns:
+            PagedRangeIndex: The opened index.
+
+        Raises:
+            ValueError: If the intervals are not sorted by start, or a key does not fit in a page.
+        """
+        min_page_size = max(HEADER.size, PAGE_HEADER.size + 2 * INTERNAL_ENTRY.size)
+        if not min_page_size <= page_size <= 65536:
+            raise ValueError(f"page_size {page_size} must be between {min_page_size} and 65536 bytes")
+
+        with open(path, "wb") as f:
+            # Reserve page 0 for the header
+            f.write(bytes(page_size))
+            writer = _PageWriter(f, page_size)
+
+            # Leaf level: pack the intervals into pages in start order
+            summaries = []
+            page = bytearray(PAGE_HEADER.size)
+            count = 0
+            min_width = min_rank = None
+            max_end = None
+            first_start = last_start = None
+            size = 0
+            for start, end, key, rank in _ranked(intervals):
+                if last_start is not None and start < last_start:
+                    raise ValueError("Intervals must be sorted by start")
+                last_start = start
+
+                encoded_key = key.encode("utf-8")
+                entry = LEAF_ENTRY.pack(start, end, rank, len(encoded_key)) + encoded_key
+                if PAGE_HEADER.size + len(entry) > page_size:
+                    raise ValueError(f"Key {key!r} does not fit in a page of {page_size} bytes")
+                if len(page) + len(entry) > page_size:
+                    summaries.append((writer.write(LEAF_PAGE, count, page), first_start, max_end, min_width, min_rank))
+                    page = bytearray(PAGE_HEADER.size)
+                    count = 0
+
+                # Empty intervals (end < start) never match, 0 keeps the width a valid lower bound
+                width = max(end - start, 0)
+                if count == 0:
+                    first_start, max_end, min_width, min_rank = start, end, width, rank
+                else:
+                    max_end = max(max_end, end)
+                    min_width, min_rank = min((min_width, min_rank), (width, rank))
+                page += entry
+                count += 1
+                size += 1
+            if count:
+                summaries.append((writer.write(LEAF_PAGE, count, page), first_start, max_end, min_width, min_rank))
+
+            # Internal levels: group the summaries of the level below until a single root remains
+            levels = 1 if summaries else 0
+            fanout = (page_size - PAGE_HEADER.size) // INTERNAL_ENTRY.size
+            while len(summaries) > 1:
+                parents = []
+                for i in range(0, len(summaries), fanout):
+                    children = summaries[i:i + fanout]
+                    page = bytearray(PAGE_HEADER.size)
+                    for child in children:
+                        page += INTERNAL_ENTRY.pack(*child)
+                    parents.append((
+                        writer.write(INTERNAL_PAGE, len(children), page),
+                        children[0][1],
+                        max(child[2] for child in children),
+                        *min(child[3:] for child in children),
+                    ))
+                summaries = parents
+                levels += 1
+
+            root = summaries[0][0] if summaries else 0
+            f.seek(0)
+            f.write(HEADER.pack(MAGIC, FORMAT_VERSION, page_size, root, levels, size))
+
+        return cls(path, cache_pages=cache_pages)
+
+    def _page(self, page_no: int):
+        """
+        Returns a decoded page, from the LRU cache when possible.
+
+        Leaf pages decode into (LEAF_PAGE, starts, ends, ranks, keys) with the keys left as bytes, and
+        internal pages into (INTERNAL_PAGE, children, min_starts, max_ends, min_widths, min_ranks).
+
+        Args:
+            page_no (int): The page number.
+
+        Returns:
+            tuple: The decoded page.
+        """
+        page = self._cache.get(page_no)
+        if page is not None:
+            self._cache.move_to_end(page_no)
+            self.cache_hits += 1
+            return page
+
+        self.cache_misses += 1
+        offset = page_no * self.page_size
+        page_type, count = PAGE_HEADER.unpack_from(self._mmap, offset)
+        offset += PAGE_HEADER.size
+        if page_type == LEAF_PAGE:
+            starts, ends, ranks, keys = [], [], [], []
+            for _ in range(count):
+                start, end, rank, key_len = LEAF_ENTRY.unpack_from(self._mmap, offset)
+                offset += LEAF_ENTRY.size
+                starts.append(start)
+                ends.append(end)
+                ranks.append(rank)
+                keys.append(self._mmap[offset:offset + key_len])
+                offset += key_len
+            page = (LEAF_PAGE, starts, ends, ranks, keys)
+        else:
+            columns = list(zip(*INTERNAL_ENTRY.iter_unpack(self._mmap[offset:offset + count * INTERNAL_ENTRY.size])))
+            page = (INTERNAL_PAGE, *columns)
+
+        self._cache[page_no] = page
+        if len(self._cache) > self.cache_pages:
+            self._cache.popitem(last=False)  # Evict the least recently used page
+        return page
+
+    def _search_page(self, page_no: int, point: int, best: Optional[List]) -> Optional[List]:
+        """
+        Searches for the smallest interval containing a point in the subtree of a page.
+
+        Args:
+            page_no (int): The page number of the subtree root.
+            point (int): The point to find an interval for.
+            best (Optional[List]): The best [width, rank, start, end, key] found so far, or None.
+
+        Returns:
+            Optional[List]: The best [width, rank, start, end, key] found in the subtree or before, or None.
+        """
+        page = self._page(page_no)
+        if page[0] == LEAF_PAGE:
+            _, starts, ends, ranks, keys = page
+            for i in range(len(starts)):
+                start = starts[i]
+                if start > point:
+                    break
+                end = ends[i]
+                if end >= point and (best is None or (end - start, ranks[i]) < (best[0], best[1])):
+                    best = [end - start, ranks[i], start, end, keys[i]]
+            return best
+
+        _, children, min_starts, max_ends, min_widths, min_ranks = page
+        for i in range(len(children)):
+            if min_starts[i] > point:
+                # Children are sorted by start, none of the following ones can contain the point
+                break
+            if max_ends[i] < point or (best is not None and (min_widths[i], min_ranks[i]) >= (best[0], best[1])):
+                continue
+            best = self._search_page(children[i], point, best)
+        return best
+
+    def search(self, point: int) -> Optional[Tuple[int, int, str]]:
+        """
+        Searches for the smallest interval that contains a given point.
+
+        Args:
+            point (int): The point to find an interval for.
+
+        Returns:
+            tuple: A tuple (start, end, key) representing the smallest interval containing the point, or None if no such interval exists.
+        """
+        if not self._size:
+            return None
+        best = self._search_page(self._root, point, None)
+        if best:
+            return (best[2], best[3], best[4].decode("utf-8"))
+        return None
+
+    def __iter__(self):
+        """
+        Iterates over the intervals of the index sorted by start value.
+
+        Yields:
+            Tuple[int, int, str]: A tuple representing (start, end, key) for each interval.
+        """
+        if not self._size:
+            return
+        stack = [self._root]
+        while stack:
+            page = self._page(stack.pop())
+            if page[0] == LEAF_PAGE:
+                _, starts, ends, _, keys = page
+                for i in range(len(starts)):
+                    yield (starts[i], ends[i], keys[i].decode("utf-8"))
+            else:
+                stack.extend(reversed(page[1]))
+
+    def __len__(self) -> int:
+        """
+        Returns the number of intervals in the index.
+
+        Returns:
+            int: The number of intervals in the index.
+        """
+        return self._size
+
+    @property
+    def levels(self) -> int:
+        """
+        Returns the number of page levels from the root to the leaves.
+
+        Returns:
+            int: The number of levels, 0 for an empty index.
+        """
+        return self._levels
+
+    def close(self) -> None:
+        """Releases the cache and unmaps the index file."""
+        self._cache.clear()
+        self._mmap.close()
+
+    def __enter__(self) -> 'PagedRangeIndex':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+
+def _ranked(intervals: Iterable[Tuple[int, int, str]]) -> Iterator[Tuple[int, int, str, int]]:
+    """
+    Adds the tie-break rank to intervals sorted by start.
+
+    The intervals of a RangeTree are ranked in the pre-order of the tree, which is the order in
+    which an in-order walk pushes the nodes on its stack. The extra keys of a compressed node
+    share the rank of the node. Any other iterable is ranked in order.
+
+    Args:
+        intervals (Iterable[Tuple[int, int, str]]): The (start, end, key) intervals sorted by start.
+
+    Yields:
+        Tuple[int, int, str, int]: The (start, end, key, rank) intervals, in the same order.
+    """
+    if not isinstance(intervals, RangeTree):
+        for rank, (start, end, key) in enumerate(intervals):
+            yield start, end, key, rank
+        return
+
+    stack = []
+    node = intervals.root
+    rank = 0
+    while stack or node:
+        while node:
+            stack.append((node, rank))
+            rank += 1
+            node = node.left
+        node, node_rank = stack.pop()
+        yield node.start, node.end, node.key, node_rank
+        if node.bucket:
+            for key in node.bucket:
+                yield node.start, node.end, key, node_rank
+        node = node.right
+
+
+class _PageWriter:
+    """Appends fixed-size pages to an index file, in order."""
+
+    def __init__(self, f, page_size: int):
+        self._f = f
+        self._page_size = page_size
+        self._next_page = 1  # Page 0 holds the header
+
+    def write(self, page_type: int, count: int, page: bytearray) -> int:
+        """
+        Writes a page, filling in its header and padding it to the page size.
+
+        Args:
+            page_type (int): LEAF_PAGE or INTERNAL_PAGE.
+            count (int): The number of entries in the page.
+            page (bytearray): The page content, starting with room for the page header.
+
+        Returns:
+            int: The page number.
+        """
+        PAGE_HEADER.pack_into(page, 0, page_type, count)
+        self._f.write(page)
+        self._f.write(bytes(self._page_size - len(page)))
+        page_no = self._next_page
+        self._next_page += 1
+        return page_no
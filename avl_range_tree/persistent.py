@@ -0,0 +1,550 @@
+from __future__ import annotations
+
+import time
+from bisect import bisect_right
+
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+    from avl_range_tree.avl_tree import RangeNode
+
+from avl_range_tree.avl_tree import RangeTree
+
+
+class PersistentRangeTree(RangeTree):
+    """
+    A persistent (path-copying) variant of the RangeTree.
+
+    Every insertion or removal produces a new version of the tree. Nodes reachable from a
+    published version are never modified: a change copies only the nodes on its path from the
+    root, and the new version shares every other subtree with the previous one. Memory therefore
+    grows with the number of changes, not with the number of versions kept.
+
+    Version 0 is the empty tree, and each change is stamped with a timestamp so that the version
+    in effect at any point in time can be looked up with `as_of`.
+
+    Attributes:
+        root (RangeNode): The root of the latest version.
+    """
+
+    def __init__(self, compress_duplicates: bool = False):
+        """
+        Initializes an empty PersistentRangeTree.
+
+        Args:
+            compress_duplicates (bool): If True, intervals with the same (start, end) are stored in a
+                single node holding a bucket of keys. Buckets are copied, never modified in place.
+        """
+        super().__init__(compress_duplicates=compress_duplicates)
+        self._roots: List[Optional[RangeNode]] = [None]  # Root of every version, version 0 is empty
+        self._sizes: List[int] = [0]  # Number of intervals of every version
+        self._timestamps: List[float] = []  # Timestamp of versions 1..n
+
+    @property
+    def version(self) -> int:
+        """
+        Returns the number of the latest version.
+
+        Returns:
+            int: The latest version, 0 for a tree without changes.
+        """
+        return len(self._roots) - 1
+
+    def _check_version(self, version: int) -> int:
+        """
+        Validates a version number.
+
+        Args:
+            version (int): The version number.
+
+        Returns:
+            int: The version number.
+
+        Raises:
+            IndexError: If the version does not exist.
+        """
+        if not 0 <= version < len(self._roots):
+            raise IndexError(f"Version {version} does not exist, the latest version is {self.version}")
+        return version
+
+    def root_at(self, version: int) -> Optional[RangeNode]:
+        """
+        Returns the root of a given version, to be used with the traversal methods.
+
+        Args:
+            version (int): The version number.
+
+        Returns:
+            Optional[RangeNode]: The root of the version, or None if it is empty.
+
+        Raises:
+            IndexError: If the version does not exist.
+        """
+        return self._roots[self._check_version(version)]
+
+    def size_at(self, version: int) -> int:
+        """
+        Returns the number of intervals stored in a given version.
+
+        Args:
+            version (int): The version number.
+
+        Returns:
+            int: The number of intervals in the version.
+
+        Raises:
+            IndexError: If the version does not exist.
+        """
+        return self._sizes[self._check_version(version)]
+
+    def as_of(self, timestamp: float) -> int:
+        """
+        Returns the version that was in effect at a given point in time.
+
+        Args:
+            timestamp (float): The point in time, in the same unit as the change timestamps.
+
+        Returns:
+            int: The latest version committed at or before the timestamp, or 0 if there is none.
+        """
+        return bisect_right(self._timestamps, timestamp)
+
+    def _commit(self, root: Optional[RangeNode], size: int, timestamp: Optional[float]) -> int:
+        """
+        Publishes a new version of the tree.
+
+        Args:
+            root (Optional[RangeNode]): The root of the new version.
+            size (int): The number of intervals of the new version.
+            timestamp (Optional[float]): The timestamp of the change, or None to use the current time.
+
+        Returns:
+            int: The number of the new version.
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        if self._timestamps and timestamp < self._timestamps[-1]:
+            raise ValueError(
+                f"Timestamp {timestamp} is older than the latest version timestamp {self._timestamps[-1]}"
+            )
+
+        self._roots.append(root)
+        self._sizes.append(size)
+        self._timestamps.append(timestamp)
+        self.root = root
+        self._size = size
+        return self.version
+
+    def _update(self, node: RangeNode) -> None:
+        """
+        Recomputes the height and max value of a node from its children.
+
+        Args:
+            node (RangeNode): The node to update.
+        """
+        node.max = max(node.end, self.get_max(node.left), self.get_max(node.right))
+        node.height = 1 + max(self.get_height(node.left), self.get_height(node.right))
+
+    def left_rotate(self, x):
+        """
+        Performs a left rotation on copies of the nodes that change, leaving older versions intact.
+
+        Args:
+            x (RangeNode): The root of the subtree to rotate.
+
+        Returns:
+            RangeNode: The new root of the rotated subtree.
+        """
+        x = self._copy_node(x)
+        x.right = self._copy_node(x.right)
+        return super().left_rotate(x)
+
+    def right_rotate(self, x):
+        """
+        Performs a right rotation on copies of the nodes that change, leaving older versions intact.
+
+        Args:
+            x (RangeNode): The root of the subtree to rotate.
+
+        Returns:
+            RangeNode: The new root of the rotated subtree.
+        """
+        x = self._copy_node(x)
+        x.left = self._copy_node(x.left)
+        return super().right_rotate(x)
+
+    def insert_node(self, node, start, end, key):
+        """
+        Inserts a new interval into the subtree rooted at the given node by copying its path.
+
+        Args:
+            node (RangeNode): The root of the subtree where the interval should be inserted.
+            start (int): The start value of the interval.
+            end (int): The end value of the interval.
+            key (str): The key associated with the interval.
+
+        Returns:
+            RangeNode: The root of the new version of the subtree.
+        """
+        if not node:
+            return self._new_node(start, end, key, self._size)
+
+        node = self._copy_node(node)
+        if self.compress_duplicates:
+            if start == node.start and end == node.end:
+                # The bucket may be shared with older versions, so it is replaced rather than appended to
+                node.bucket = (node.bucket or []) + [key]
+                return node
+            if (start, end) < (node.start, node.end):
+                node.left = self.insert_node(node.left, start, end, key)
+            else:
+                node.right = self.insert_node(node.right, start, end, key)
+        elif start < node.start:
+            node.left = self.insert_node(node.left, start, end, key)
+        else:
+            node.right = self.insert_node(node.right, start, end, key)
+
+        self._update(node)
+        return self._rebalance(node)
+
+    def _insert_batch(self, node, batch, keys, lo, hi):
+        """
+        Inserts a slice of a sorted batch into the subtree rooted at the given node by copying the visited nodes.
+
+        Args:
+            node (RangeNode): The root of the subtree, or None.
+            batch (List[Tuple[int, int, str, int]]): The (start, end, key, position) intervals, sorted in tree order.
+            keys (list): The sort key of every interval of the batch.
+            lo (int): The index of the first interval of the slice.
+            hi (int): The index after the last interval of the slice.
+
+        Returns:
+            RangeNode: The root of the new version of the subtree.
+        """
+        if node and lo < hi:
+            node = self._copy_node(node)
+        return super()._insert_batch(node, batch, keys, lo, hi)
+
+    def _join(self, left, node, right):
+        """
+        Links two balanced subtrees through a node by copying the nodes of the spine it goes down.
+
+        Args:
+            left (RangeNode): The subtree that goes before the node, or None.
+            node (RangeNode): The node that goes between both subtrees, already copied.
+            right (RangeNode): The subtree that goes after the node, or None.
+
+        Returns:
+            RangeNode: The root of the new version of the joined subtree.
+        """
+        if self.get_height(left) > self.get_height(right) + 1:
+            left = self._copy_node(left)
+        elif self.get_height(right) > self.get_height(left) + 1:
+            right = self._copy_node(right)
+        return super()._join(left, node, right)
+
+    def insert(self, start, end, key, timestamp: Optional[float] = None) -> int:
+        """
+        Inserts a new interval, creating a new version of the tree.
+
+        Args:
+            start (int): The start value of the interval.
+            end (int): The end value of the interval.
+            key (str): The key associated with the interval.
+            timestamp (Optional[float]): The timestamp of the change, or None to use the current time.
+                Timestamps must not decrease from one version to the next.
+
+        Returns:
+            int: The number of the new version.
+        """
+        return self._commit(self.insert_node(self.root, start, end, key), self._size + 1, timestamp)
+
+    def insert_many(self, intervals: Iterable[Tuple[int, int, str]], timestamp: Optional[float] = None) -> int:
+        """
+        Inserts a batch of intervals as a single new version of the tree.
+
+        Args:
+            intervals (Iterable[Tuple[int, int, str]]): The (start, end, key) intervals to insert.
+            timestamp (Optional[float]): The timestamp of the change, or None to use the current time.
+
+        Returns:
+            int: The number of the new version.
+
+        Raises:
+            ValueError: If the timestamp is older than the latest version timestamp. The tree is left unchanged.
+        """
+        root, size = self.root, self._size
+        try:
+            super().insert_many(intervals)
+            return self._commit(self.root, self._size, timestamp)
+        except BaseException:
+            # Published nodes are never modified, so restoring the latest root discards the batch
+            self.root, self._size = root, size
+            raise
+
+    def _build_tree(self, nodes):
+        """
+        Links copies of the nodes into a perfectly balanced tree, leaving older versions intact.
+
+        Args:
+            nodes (List[RangeNode]): The nodes in tree order.
+
+        Returns:
+            Optional[RangeNode]: The root of the new tree.
+        """
+        return super()._build_tree([self._copy_node(node) for node in nodes])
+
+    def rebuild(self, background: bool = False, timestamp: Optional[float] = None) -> int:
+        """
+        Publishes a new version of the tree with a perfectly balanced layout.
+
+        Published nodes are never modified, so the rebuild always runs in the calling thread and
+        searches on any version are never affected.
+
+        Args:
+            background (bool): Ignored.
+            timestamp (Optional[float]): The timestamp of the new version, the current time by default.
+
+        Returns:
+            int: The number of the new version.
+        """
+        return self._commit(self._build_tree(list(self._nodes())), self._size, timestamp)
+
+    def enable_auto_rebuild(self, *args, **kwargs) -> None:
+        """
+        Not supported: every change is rebalanced and published as an immutable version.
+
+        Raises:
+            NotImplementedError: Always.
+        """
+        raise NotImplementedError("PersistentRangeTree does not support automatic rebuilds, use rebuild")
+
+    def _remove_min(self, node: RangeNode):
+        """
+        Removes the leftmost node of a subtree by copying its path.
+
+        Args:
+            node (RangeNode): The root of the subtree.
+
+        Returns:
+            tuple: The root of the new version of the subtree and the removed node.
+        """
+        if node.left is None:
+            return node.right, node
+
+        node = self._copy_node(node)
+        node.left, min_node = self._remove_min(node.left)
+        self._update(node)
+        return self._rebalance(node), min_node
+
+    def _remove_node(self, node: Optional[RangeNode], start, end, key):
+        """
+        Removes an interval from the subtree rooted at the given node by copying its path.
+
+        Args:
+            node (RangeNode): The root of the subtree.
+            start (int): The start value of the interval.
+            end (int): The end value of the interval.
+            key (str): The key associated with the interval.
+
+        Returns:
+            tuple: The root of the new version of the subtree and whether the interval was found.
+                The subtree is returned untouched if the interval was not found.
+        """
+        if not node:
+            return node, False
+
+        if self.compress_duplicates:
+            # Identical intervals share one node, so the tree is strictly ordered by (start, end)
+            if (start, end) < (node.start, node.end):
+                return self._remove_child(node, "left", start, end, key)
+            if (start, end) > (node.start, node.end):
+                return self._remove_child(node, "right", start, end, key)
+            if node.key == key:
+                if node.bucket:
+                    # The next key of the bucket takes the place of the removed one
+                    node = self._copy_node(node)
+                    node.key = node.bucket[0]
+                    node.bucket = node.bucket[1:] or None
+                    return node, True
+                return self._unlink(node), True
+            if node.bucket and key in node.bucket:
+                node = self._copy_node(node)
+                bucket = list(node.bucket)
+                bucket.remove(key)
+                node.bucket = bucket or None
+                return node, True
+            return node, False
+
+        if start < node.start:
+            return self._remove_child(node, "left", start, end, key)
+        if start > node.start:
+            return self._remove_child(node, "right", start, end, key)
+        if node.end == end and node.key == key:
+            return self._unlink(node), True
+
+        # Rotations may leave equal starts on both sides of the node
+        node, removed = self._remove_child(node, "left", start, end, key)
+        if removed:
+            return node, True
+        return self._remove_child(node, "right", start, end, key)
+
+    def _remove_child(self, node: RangeNode, side: str, start, end, key):
+        """
+        Removes an interval from one subtree of a node by copying its path.
+
+        Args:
+            node (RangeNode): The parent node.
+            side (str): "left" or "right".
+            start (int): The start value of the interval.
+            end (int): The end value of the interval.
+            key (str): The key associated with the interval.
+
+        Returns:
+            tuple: The root of the new version of the subtree of the node and whether the interval was found.
+        """
+        child, removed = self._remove_node(getattr(node, side), start, end, key)
+        if not removed:
+            return node, False
+        node = self._copy_node(node)
+        setattr(node, side, child)
+        self._update(node)
+        return self._rebalance(node), True
+
+    def _unlink(self, node: RangeNode) -> Optional[RangeNode]:
+        """
+        Removes a node from the tree by copying the nodes that change.
+
+        Args:
+            node (RangeNode): The node to remove.
+
+        Returns:
+            Optional[RangeNode]: The root of the new version of the subtree of the node.
+        """
+        if node.left is None:
+            return node.right
+        if node.right is None:
+            return node.left
+
+        # Replace the node with its in-order successor, keeping its bucket
+        right, successor = self._remove_min(node.right)
+        successor = self._copy_node(successor)
+        successor.left = node.left
+        successor.right = right
+        self._update(successor)
+        return self._rebalance(successor)
+
+    def remove(self, start, end, key, timestamp: Optional[float] = None) -> int:
+        """
+        Removes an interval, creating a new version of the tree.
+
+        Args:
+            start (int): The start value of the interval.
+            end (int): The end value of the interval.
+            key (str): The key associated with the interval.
+            timestamp (Optional[float]): The timestamp of the change, or None to use the current time.
+                Timestamps must not decrease from one version to the next.
+
+        Returns:
+            int: The number of the new version.
+
+        Raises:
+            KeyError: If the interval is not stored in the latest version.
+        """
+        root, removed = self._remove_node(self.root, start, end, key)
+        if not removed:
+            raise KeyError((start, end, key))
+        return self._commit(root, self._size - 1, timestamp)
+
+    def search(self, point, version: Optional[int] = None):
+        """
+        Searches for the smallest interval that contains a given point in a version of the tree.
+
+        Args:
+            point (int): The point to find an interval for.
+            version (Optional[int]): The version to search, or None for the latest version.
+
+        Returns:
+            tuple: A tuple (start, end, key) representing the smallest interval containing the point, or None if no such interval exists.
+
+        Raises:
+            IndexError: If the version does not exist.
+        """
+        root = self.root if version is None else self.root_at(version)
+        node = self.search_min_range(root, point)
+        if node:
+            return (node.start, node.end, node.key)
+        return None
+
+    def search_keys(self, point, version: Optional[int] = None):
+        """
+        Searches for the smallest interval that contains a given point in a version of the tree and returns all of its keys.
+
+        Args:
+            point (int): The point to find an interval for.
+            version (Optional[int]): The version to search, or None for the latest version.
+
+        Returns:
+            tuple: A tuple (start, end, keys) for the smallest interval containing the point, or None if no such interval exists.
+
+        Raises:
+            IndexError: If the version does not exist.
+        """
+        root = self.root if version is None else self.root_at(version)
+        node = self.search_min_range(root, point)
+        if node:
+            keys = [node.key]
+            if node.bucket:
+                keys.extend(node.bucket)
+            return (node.start, node.end, keys)
+        return None
+
+    @classmethod
+    def deserialize(cls, data: str, deserializer: Optional[Callable[[str], Dict[str, Any]]] = None) -> 'PersistentRangeTree':
+        """
+        Deserializes a tree, publishing its content as version 1.
+
+        Args:
+            data (str): The serialized tree as a string.
+            deserializer (Optional[Callable[[str], Dict[str, Any]]]): A function that takes a serialized string and returns a dictionary.
+
+        Returns:
+            PersistentRangeTree: The deserialized tree.
+        """
+        tree = super().deserialize(data, deserializer)
+        tree._commit(tree.root, tree._size, None)
+        return tree
+
+    @classmethod
+    def from_snapshot(cls, data: bytes) -> 'PersistentRangeTree':
+        """
+        Loads a tree from a snapshot created by `to_snapshot`, publishing its content as version 1.
+
+        Args:
+            data (bytes): The snapshot.
+
+        Returns:
+            PersistentRangeTree: The loaded tree.
+        """
+        tree = super().from_snapshot(data)
+        tree._commit(tree.root, tree._size, None)
+        return tree
+
+    @classmethod
+    def from_columns(cls, starts, ends, keys, compress_duplicates: bool = False) -> 'PersistentRangeTree':
+        """
+        Builds a perfectly balanced tree from interval columns, published as version 1.
+
+        Args:
+            starts: The start values of the intervals.
+            ends: The end values of the intervals.
+            keys: The keys associated with the intervals.
+            compress_duplicates (bool): Whether identical intervals share a single node.
+
+        Returns:
+            PersistentRangeTree: The new tree.
+        """
+        tree = super().from_columns(starts, ends, keys, compress_duplicates)
+        tree._commit(tree.root, tree._size, None)
+        return tree
@@ -0,0 +1,121 @@
+"""
+Selection policies deciding which of the intervals containing a point `RangeTree.search` returns.
+
+A policy gives every interval a score when it is inserted, and the interval with the lowest
+score wins. Each node of the tree also stores the best score of its subtree, so the search skips
+every subtree that cannot beat the best interval found so far and stays logarithmic. Ties are
+broken like in the default search: the first interval in pre-order wins.
+
+Policies can be combined with `Lexicographic`, for example highest priority first and then
+smallest width.
+"""
+from __future__ import annotations
+
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Any, Callable, Optional
+
+
+class SelectionPolicy:
+    """
+    Base class of the selection policies.
+
+    Subclasses implement `score`, which must return values that are comparable with each other.
+    """
+
+    def score(self, start: int, end: int, key: Any, seq: int) -> Any:
+        """
+        Scores an interval, the lowest score wins.
+
+        Args:
+            start (int): The start value of the interval.
+            end (int): The end value of the interval.
+            key (Any): The key associated with the interval.
+            seq (int): The insertion sequence number of the interval: the number of intervals added
+                to the tree before it. The intervals of a batch given to `insert_many` or `from_columns`
+                are numbered in the order they are given.
+
+        Returns:
+            Any: The score of the interval.
+        """
+        raise NotImplementedError
+
+
+class SmallestWidth(SelectionPolicy):
+    """Prefers the smallest interval, like the default search."""
+
+    def score(self, start, end, key, seq):
+        return end - start
+
+
+class HighestPriority(SelectionPolicy):
+    """
+    Prefers the interval with the highest priority.
+
+    Attributes:
+        priority (Callable[[Any], float]): A function returning the priority of a key.
+    """
+
+    def __init__(self, priority: Callable[[Any], float]):
+        """
+        Initializes the policy.
+
+        Args:
+            priority (Callable[[Any], float]): A function returning the priority of a key, for example
+                `priorities.__getitem__` for a dictionary of priorities.
+        """
+        self.priority = priority
+
+    def score(self, start, end, key, seq):
+        return -self.priority(key)
+
+
+class MostRecent(SelectionPolicy):
+    """Prefers the most recently inserted interval."""
+
+    def score(self, start, end, key, seq):
+        return -seq
+
+
+class KeyPreference(SelectionPolicy):
+    """
+    Prefers the interval whose key comes first in lexicographic order.
+
+    Attributes:
+        sort_key (Optional[Callable[[Any], Any]]): A function mapping a key to the value to compare, or None
+            to compare the keys themselves.
+    """
+
+    def __init__(self, sort_key: Optional[Callable[[Any], Any]] = None):
+        """
+        Initializes the policy.
+
+        Args:
+            sort_key (Optional[Callable[[Any], Any]]): A function mapping a key to the value to compare, or
+                None to compare the keys themselves.
+        """
+        self.sort_key = sort_key
+
+    def score(self, start, end, key, seq):
+        return key if self.sort_key is None else self.sort_key(key)
+
+
+class Lexicographic(SelectionPolicy):
+    """
+    Combines several policies: ties on the first policy are broken by the second one, and so on.
+
+    Attributes:
+        policies (tuple): The policies, from the most to the least significant.
+    """
+
+    def __init__(self, *policies: SelectionPolicy):
+        """
+        Initializes the policy.
+
+        Args:
+            *policies (SelectionPolicy): The policies, from the most to the least significant.
+        """
+        self.policies = policies
+
+    def score(self, start, end, key, seq):
+        return tuple(policy.score(start, end, key, seq) for policy in self.policies)
@@ -0,0 +1,65 @@
+"""
+Binary protocol spoken by `avl_range_tree.server` and `avl_range_tree.client`.
+
+All integers are little-endian. A client sends requests on a connection without waiting for
+the responses (pipelining), and the server answers every request in order, echoing its id. The
+server does not read further requests while a response waits for room in the socket buffer, so
+a pipelining client must keep reading responses while it sends.
+
+Request:
+    REQUEST_HEADER (request id u32, operation u8, count u32), followed by `count` search points
+    as int64. SEARCH carries one point, SEARCH_BATCH any number of points up to MAX_BATCH, PING
+    and RELOAD none.
+
+Response:
+    RESPONSE_HEADER (request id u32, status u8, count u32). With STATUS_OK, `count` results follow,
+    one per point: RESULT (found u8, start i64, end i64, key length u16) and the UTF-8 key. With
+    STATUS_ERROR, `count` is the length of the UTF-8 error message that follows.
+"""
+import struct
+
+REQUEST_HEADER = struct.Struct("<IBI")
+RESPONSE_HEADER = struct.Struct("<IBI")
+RESULT = struct.Struct("<BqqH")
+POINT = struct.Struct("<q")
+
+OP_PING = 0
+OP_SEARCH = 1
+OP_SEARCH_BATCH = 2
+OP_RELOAD = 3
+
+STATUS_OK = 0
+STATUS_ERROR = 1
+
+# Largest number of points in a single request
+MAX_BATCH = 1 << 20
+
+# Largest UTF-8 encoded key in a result
+MAX_KEY_LENGTH = 0xFFFF
+
+NOT_FOUND = RESULT.pack(0, 0, 0, 0)
+
+
+def encode_result(result) -> bytes:
+    """
+    Encodes the result of a search.
+
+    Args:
+        result (tuple): A (start, end, key) tuple, or None if no interval contains the point.
+
+    Returns:
+        bytes: The encoded result.
+
+    Raises:
+        ValueError: If the key is longer than MAX_KEY_LENGTH bytes, or a bound is not a signed 64-bit integer.
+    """
+    if result is None:
+        return NOT_FOUND
+    start, end, key = result
+    key = str(key).encode("utf-8")
+    if len(key) > MAX_KEY_LENGTH:
+        raise ValueError(f"Key of {len(key)} bytes exceeds {MAX_KEY_LENGTH} bytes")
+    try:
+        return RESULT.pack(1, start, end, len(key)) + key
+    except struct.error:
+        raise ValueError(f"Interval ({start!r}, {end!r}) does not fit in signed 64-bit integers") from None
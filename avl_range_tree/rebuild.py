@@ -0,0 +1,208 @@
+"""
+Degradation tracking behind `RangeTree.enable_auto_rebuild`.
+
+Two signals are tracked:
+
+- the height of the tree compared with the height of a perfectly balanced tree of the same
+  size, checked after every write;
+- the average number of nodes visited per search, measured on one search out of `sample_every`
+  and averaged over windows of `window` samples. Because heavily overlapping intervals make
+  searches visit many nodes however the tree is laid out, the first window measured after a
+  rebuild becomes a floor, and only a tree doing worse than `visit_ratio` times that floor, or
+  than the optimal height when no rebuild happened yet, is rebuilt again.
+
+With background rebuilds, the searches and writes that cross a threshold only start the rebuild
+thread. Copying the nodes, building the new layout and swapping it in all happen in that thread,
+so the search that triggered the rebuild returns immediately.
+
+This module is imported on first use, so trees that never enable automatic rebuilds do not pay
+for `threading`.
+"""
+from __future__ import annotations
+
+import threading
+
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Iterable, List, Optional, Tuple
+
+    from avl_range_tree.avl_tree import RangeTree
+
+
+class RebuildMonitor:
+    """
+    Tracks the degradation signals of a RangeTree and decides when to rebuild it.
+
+    Attributes:
+        height_ratio (Optional[float]): Rebuild when the height exceeds this multiple of the optimal height,
+            or None to ignore the height.
+        visit_ratio (Optional[float]): Rebuild when the average number of nodes visited per search exceeds this
+            multiple of the reference, or None to ignore visits.
+        sample_every (int): One search out of `sample_every` is measured.
+        window (int): The number of measured searches averaged before the visits are compared.
+        min_size (int): Trees with fewer intervals are never rebuilt automatically.
+        background (bool): Whether automatic rebuilds run in a background thread.
+        detach (bool): Whether the monitor removes itself from the tree once its background rebuild is done,
+            for monitors created by `RangeTree.rebuild` only to serialize the writes with one rebuild.
+        lock (threading.RLock): Serializes the writes to the tree with the rebuilds.
+        pending (Optional[List[Tuple[int, int, str]]]): The intervals inserted since a background rebuild
+            copied the nodes, replayed into the new layout before it is swapped in, or None.
+        thread (Optional[threading.Thread]): The thread of the last background rebuild.
+        visits_per_search (Optional[float]): The average number of nodes visited per search over the last
+            complete window, or None before the first one.
+        visit_floor (Optional[float]): The average measured in the first window after the last rebuild, or
+            None.
+        rebuilds (int): The number of rebuilds completed.
+    """
+
+    def __init__(
+            self,
+            height_ratio: Optional[float] = None,
+            visit_ratio: Optional[float] = None,
+            sample_every: int = 64,
+            window: int = 32,
+            min_size: int = 1024,
+            background: bool = True,
+            detach: bool = False,
+    ):
+        """
+        Initializes the monitor.
+
+        Args:
+            height_ratio (Optional[float]): The height threshold, as a multiple of the optimal height.
+            visit_ratio (Optional[float]): The visits threshold, as a multiple of the reference.
+            sample_every (int): One search out of `sample_every` is measured.
+            window (int): The number of measured searches averaged before the visits are compared.
+            min_size (int): Trees with fewer intervals are never rebuilt automatically.
+            background (bool): Whether automatic rebuilds run in a background thread.
+            detach (bool): Whether the monitor removes itself from the tree once its background rebuild is done.
+
+        Raises:
+            ValueError: If `sample_every` or `window` is not positive.
+        """
+        if sample_every < 1 or window < 1:
+            raise ValueError("sample_every and window must be at least 1")
+
+        self.height_ratio = height_ratio
+        self.visit_ratio = visit_ratio
+        self.sample_every = sample_every
+        self.window = window
+        self.min_size = min_size
+        self.background = background
+        self.detach = detach
+        self.lock = threading.RLock()
+        self.pending = None
+        self.thread = None
+        self.visits_per_search = None
+        self.visit_floor = None
+        self.rebuilds = 0
+        self._searches = 0
+        self._samples = 0
+        self._visits = 0
+        self._measure_floor = False
+        self._starting = threading.Lock()  # Only held to check and start the rebuild thread
+
+    def written(self, tree: RangeTree, intervals: Iterable[Tuple[int, int, str]]) -> None:
+        """
+        Records intervals inserted into the tree, and rebuilds it if it became too high.
+
+        Must be called with the lock held. A background rebuild is only started, it waits for the
+        lock to be released before copying the nodes.
+
+        Args:
+            tree (RangeTree): The monitored tree.
+            intervals (Iterable[Tuple[int, int, str]]): The inserted intervals, in insertion order.
+        """
+        if self.pending is not None:
+            self.pending.extend(intervals)
+        elif (
+                self.height_ratio is not None
+                and not self.running
+                and tree._size >= self.min_size
+                and tree.get_height(tree.root) > self.height_ratio * tree._size.bit_length()
+        ):
+            tree.rebuild(background=self.background)
+
+    def searched(self, tree: RangeTree, point: int) -> None:
+        """
+        Counts a search, measures it if it is sampled, and rebuilds the tree if searches degraded.
+
+        The counters are not locked: concurrent searches may lose a sample, which only delays the
+        next comparison. A background rebuild is only started, so the search is never blocked by
+        the writes or by the copy of the nodes.
+
+        Args:
+            tree (RangeTree): The monitored tree.
+            point (int): The searched point.
+        """
+        self._searches += 1
+        if self._searches < self.sample_every:
+            return
+        self._searches = 0
+        self._visits += tree._search_visits(point)
+        self._samples += 1
+        if self._samples < self.window:
+            return
+
+        average = self._visits / self._samples
+        self._visits = self._samples = 0
+        self.visits_per_search = average
+        if self._measure_floor:
+            self._measure_floor = False
+            self.visit_floor = average
+            return
+
+        if (
+                self.visit_ratio is not None
+                and not self.running
+                and tree._size >= self.min_size
+                and average > self.visit_ratio * max(tree._size.bit_length(), self.visit_floor or 0)
+        ):
+            tree.rebuild(background=self.background)
+
+    @property
+    def running(self) -> bool:
+        """Whether a background rebuild is running."""
+        thread = self.thread
+        return thread is not None and thread.is_alive()
+
+    def rebuilt(self) -> None:
+        """Resets the measurements after a rebuild, the next window sets the floor."""
+        self.rebuilds += 1
+        self._searches = self._samples = self._visits = 0
+        self._measure_floor = True
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        Waits for the running background rebuild, if any.
+
+        Args:
+            timeout (Optional[float]): The maximum number of seconds to wait, or None to wait until it is done.
+
+        Returns:
+            bool: True if no rebuild is running anymore.
+        """
+        thread = self.thread
+        if thread is not None:
+            thread.join(timeout)
+            return not thread.is_alive()
+        return True
+
+    def start(self, tree: RangeTree) -> threading.Thread:
+        """
+        Starts a background rebuild, unless one is already running.
+
+        Does not take the lock: the rebuild thread takes it to copy the nodes and to swap the new
+        layout in.
+
+        Args:
+            tree (RangeTree): The tree to rebuild.
+
+        Returns:
+            threading.Thread: The rebuild thread, or the one already running.
+        """
+        with self._starting:
+            if not self.running:
+                self.thread = threading.Thread(target=tree._background_rebuild, args=(self,), daemon=True)
+                self.thread.start()
+            return self.thread
@@ -0,0 +1,284 @@
+"""
+Point-to-interval lookup server.
+
+Loads a RangeTree snapshot created by `RangeTree.to_snapshot` and serves `search` and batch
+searches over a Unix or TCP socket, using the binary protocol described in
+`avl_range_tree.protocol`. Connections are long-lived and requests can be pipelined. The
+snapshot is reloaded without interrupting the service on SIGHUP, on a RELOAD request, or when
+the file changes if `--watch` is given.
+
+Usage:
+    python -m avl_range_tree.server --snapshot bins.snapshot --unix /tmp/avl_range_tree.sock
+    python -m avl_range_tree.server --snapshot bins.snapshot --host 127.0.0.1 --port 7878
+"""
+import argparse
+import asyncio
+import logging
+import os
+import signal
+import sys
+from array import array
+from itertools import islice
+
+from avl_range_tree.avl_tree import ACCELERATED, RangeTree
+from avl_range_tree.protocol import (
+    MAX_BATCH,
+    OP_PING,
+    OP_RELOAD,
+    OP_SEARCH,
+    OP_SEARCH_BATCH,
+    POINT,
+    REQUEST_HEADER,
+    RESPONSE_HEADER,
+    STATUS_ERROR,
+    STATUS_OK,
+    encode_result,
+)
+
+logger = logging.getLogger(__name__)
+
+# A sorted batch of k points on a tree of n intervals is answered by the single sweep of `RangeTree.search_sorted`
+# when k * log2(n) > SWEEP_FACTOR * n. The sweep walks most of the tree, so it only pays off over one search per
+# point for batches comparable with the tree, and never against the compiled search kernel
+SWEEP_FACTOR = 2
+
+# Batches are answered CHUNK_SIZE points at a time, yielding to the event loop in between, so that a large batch
+# delays the requests of the other connections by one chunk at most
+CHUNK_SIZE = 4096
+
+
+class RangeTreeServer:
+    """
+    Serves lookups on a RangeTree loaded from a snapshot file.
+
+    Attributes:
+        snapshot_path (str): The path of the snapshot file.
+        tree (RangeTree): The tree currently served. Reloads replace it atomically, so requests
+            already being answered keep using the tree they started with.
+    """
+
+    def __init__(self, snapshot_path: str):
+        """
+        Initializes the server and loads the snapshot.
+
+        Args:
+            snapshot_path (str): The path of a snapshot created by `RangeTree.to_snapshot`.
+        """
+        self.snapshot_path = snapshot_path
+        self.tree = self._load()
+        self._mtime = os.stat(snapshot_path).st_mtime_ns
+
+    def _load(self) -> RangeTree:
+        """Reads and loads the snapshot file."""
+        with open(self.snapshot_path, "rb") as f:
+            return RangeTree.from_snapshot(f.read())
+
+    async def reload(self) -> None:
+        """Loads the snapshot again in a worker thread and swaps it in once it is ready."""
+        mtime = os.stat(self.snapshot_path).st_mtime_ns
+        tree = await asyncio.get_running_loop().run_in_executor(None, self._load)
+        self.tree = tree
+        self._mtime = mtime
+        logger.info("Reloaded %s with %d intervals", self.snapshot_path, len(tree))
+
+    async def try_reload(self) -> bool:
+        """
+        Reloads the snapshot, logging the error instead of raising it if the snapshot cannot be loaded.
+
+        The previous tree is still served after a failed reload.
+
+        Returns:
+            bool: True if the new tree is served.
+        """
+        try:
+            await self.reload()
+        except (OSError, ValueError):
+            logger.exception("Could not reload %s", self.snapshot_path)
+            return False
+        return True
+
+    async def watch(self, interval: float) -> None:
+        """
+        Reloads the snapshot whenever its modification time changes.
+
+        Args:
+            interval (float): The number of seconds between two checks.
+        """
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                changed = os.stat(self.snapshot_path).st_mtime_ns != self._mtime
+            except OSError:
+                logger.exception("Could not check %s", self.snapshot_path)
+                continue
+            if changed:
+                await self.try_reload()
+
+    def _results(self, points):
+        """
+        Returns a lazy iterator over the search results of the points, on the tree currently served.
+
+        Args:
+            points (array): The points to search.
+
+        Returns:
+            Iterator[Optional[tuple]]: The result of every point, in the same order as the points.
+        """
+        tree = self.tree
+        size = len(tree)
+        if (
+                not ACCELERATED
+                and len(points) * size.bit_length() > SWEEP_FACTOR * size
+                and all(points[i] <= points[i + 1] for i in range(len(points) - 1))
+        ):
+            return tree.search_sorted(points)
+        return map(tree.search, points)
+
+    def search(self, points) -> bytes:
+        """
+        Searches every point and encodes the results.
+
+        Args:
+            points (array): The points to search.
+
+        Returns:
+            bytes: The encoded results, in the same order as the points.
+
+        Raises:
+            ValueError: If a result cannot be encoded.
+        """
+        return b"".join(map(encode_result, self._results(points)))
+
+    async def search_chunked(self, points) -> bytes:
+        """
+        Searches every point and encodes the results, yielding to the event loop after every chunk.
+
+        Args:
+            points (array): The points to search.
+
+        Returns:
+            bytes: The encoded results, in the same order as the points.
+
+        Raises:
+            ValueError: If a result cannot be encoded.
+        """
+        results = self._results(points)
+        chunks = [b"".join(map(encode_result, islice(results, CHUNK_SIZE)))]
+        for _ in range(CHUNK_SIZE, len(points), CHUNK_SIZE):
+            await asyncio.sleep(0)
+            chunks.append(b"".join(map(encode_result, islice(results, CHUNK_SIZE))))
+        return b"".join(chunks)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """
+        Answers the requests of a connection, in order, until the client disconnects.
+
+        Args:
+            reader (asyncio.StreamReader): The connection reader.
+            writer (asyncio.StreamWriter): The connection writer.
+        """
+        try:
+            while True:
+                try:
+                    header = await reader.readexactly(REQUEST_HEADER.size)
+                except asyncio.IncompleteReadError:
+                    break
+                request_id, operation, count = REQUEST_HEADER.unpack(header)
+
+                if operation in (OP_SEARCH, OP_SEARCH_BATCH):
+                    if count > MAX_BATCH:
+                        # The points cannot be skipped safely, so the connection is closed after the error
+                        self._send_error(writer, request_id, f"Batch of {count} points exceeds {MAX_BATCH}")
+                        break
+                    try:
+                        data = await reader.readexactly(count * POINT.size)
+                    except asyncio.IncompleteReadError:
+                        # The client disconnected in the middle of the request
+                        break
+                    points = array("q")
+                    points.frombytes(data)
+                    if sys.byteorder == "big":
+                        points.byteswap()  # The protocol is little-endian
+                    try:
+                        body = await self.search_chunked(points)
+                    except ValueError as e:
+                        # The request was read entirely, so the connection stays usable
+                        self._send_error(writer, request_id, f"Could not encode the results: {e}")
+                    else:
+                        writer.write(RESPONSE_HEADER.pack(request_id, STATUS_OK, count) + body)
+                elif operation == OP_PING:
+                    writer.write(RESPONSE_HEADER.pack(request_id, STATUS_OK, 0))
+                elif operation == OP_RELOAD:
+                    try:
+                        await self.reload()
+                    except (OSError, ValueError) as e:
+                        self._send_error(writer, request_id, f"Could not reload the snapshot: {e}")
+                    else:
+                        writer.write(RESPONSE_HEADER.pack(request_id, STATUS_OK, 0))
+                else:
+                    self._send_error(writer, request_id, f"Unknown operation {operation}")
+                    break
+
+                # Only waits when the client is not reading its responses fast enough
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    def _send_error(self, writer: asyncio.StreamWriter, request_id: int, message: str) -> None:
+        """Writes an error response."""
+        message = message.encode("utf-8")
+        writer.write(RESPONSE_HEADER.pack(request_id, STATUS_ERROR, len(message)) + message)
+
+    async def start(self, host: str = None, port: int = None, path: str = None) -> asyncio.AbstractServer:
+        """
+        Starts listening on a TCP address or a Unix socket.
+
+        Args:
+            host (str): The TCP host to bind.
+            port (int): The TCP port to bind, 0 to pick a free one.
+            path (str): The Unix socket path to bind, used instead of the TCP address when given.
+
+        Returns:
+            asyncio.AbstractServer: The listening server.
+        """
+        if path is not None:
+            return await asyncio.start_unix_server(self.handle, path=path)
+        return await asyncio.start_server(self.handle, host=host, port=port)
+
+
+async def serve(args) -> None:
+    """Runs the server until it is cancelled."""
+    server = RangeTreeServer(args.snapshot)
+    listener = await server.start(host=args.host, port=args.port, path=args.unix)
+    loop = asyncio.get_running_loop()
+    loop.add_signal_handler(signal.SIGHUP, lambda: loop.create_task(server.try_reload()))
+    if args.watch:
+        loop.create_task(server.watch(args.watch))
+
+    addresses = ", ".join(str(sock.getsockname()) for sock in listener.sockets)
+    logger.info("Serving %d intervals from %s on %s", len(server.tree), args.snapshot, addresses)
+    async with listener:
+        await listener.serve_forever()
+
+
+def main(argv=None) -> None:
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="Serve RangeTree lookups over a socket.")
+    parser.add_argument("--snapshot", required=True, help="Snapshot file created by RangeTree.to_snapshot")
+    parser.add_argument("--unix", help="Unix socket path to listen on")
+    parser.add_argument("--host", default="127.0.0.1", help="TCP host to listen on")
+    parser.add_argument("--port", type=int, default=7878, help="TCP port to listen on")
+    parser.add_argument("--watch", type=float, default=0, help="Seconds between checks for a new snapshot, 0 to disable")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
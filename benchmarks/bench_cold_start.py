@@ -0,0 +1,85 @@
+"""
+Cold start benchmark: module import time and time to first query.
+
+Every measurement runs in a fresh interpreter, as a serverless cold start would.
+
+Usage:
+    python benchmarks/bench_cold_start.py [--intervals 100000] [--runs 5]
+
+The package must be installed, or the repository root added to PYTHONPATH.
+"""
+import argparse
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from avl_range_tree.avl_tree import RangeTree
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+FIRST_QUERY = """
+import time
+t0 = time.perf_counter()
+from avl_range_tree.avl_tree import RangeTree
+with open({path!r}, {mode!r}) as f:
+    data = f.read()
+tree = RangeTree.{loader}(data)
+tree.search({point})
+print(time.perf_counter() - t0)
+"""
+
+
+def run(code):
+    """Runs a snippet in a fresh interpreter and returns its stdout."""
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    return subprocess.run([sys.executable, "-c", code], env=env, check=True, capture_output=True, text=True).stdout
+
+
+def median_ms(code, runs):
+    """Returns the median time in milliseconds printed by a snippet over several runs."""
+    return statistics.median(float(run(code)) for _ in range(runs)) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--intervals", type=int, default=100_000)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    import_code = (
+        "import time\nt0 = time.perf_counter()\nimport avl_range_tree.avl_tree\nprint(time.perf_counter() - t0)"
+    )
+    print(f"import avl_range_tree.avl_tree: {median_ms(import_code, args.runs):8.2f} ms")
+
+    tree = RangeTree()
+    rng = random.Random(42)
+    for i in range(args.intervals):
+        start = rng.randrange(10 ** 15)
+        tree.insert(start, start + rng.randrange(10 ** 9), f"key{i}")
+    point = tree.root.start
+
+    with tempfile.TemporaryDirectory() as tmp:
+        json_path = os.path.join(tmp, "tree.json")
+        with open(json_path, "w") as f:
+            f.write(tree.serialize())
+        snapshot_path = os.path.join(tmp, "tree.snapshot")
+        with open(snapshot_path, "wb") as f:
+            f.write(tree.to_snapshot())
+
+        for name, path, mode, loader in (
+            ("deserialize (json)", json_path, "r", "deserialize"),
+            ("from_snapshot", snapshot_path, "rb", "from_snapshot"),
+        ):
+            code = FIRST_QUERY.format(path=path, mode=mode, loader=loader, point=point)
+            size = os.path.getsize(path) / 1024 / 1024
+            print(
+                f"first query after {name:<18} {median_ms(code, args.runs):8.2f} ms "
+                f"({args.intervals} intervals, {size:.1f} MiB)"
+            )
+
+
+if __name__ == "__main__":
+    main()
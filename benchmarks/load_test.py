@@ -0,0 +1,124 @@
+"""
+Load test of the lookup server: throughput and latency percentiles under concurrent clients.
+
+Builds a random snapshot, starts `avl_range_tree.server` in a subprocess and runs client threads
+against it for a fixed duration. Every thread sends batches of `--batch` random points, with
+`--pipeline` requests in flight per connection.
+
+Usage:
+    python benchmarks/load_test.py [--intervals 100000] [--clients 8] [--batch 1] [--pipeline 1]
+        [--duration 10] [--unix]
+
+The package must be installed, or the repository root added to PYTHONPATH.
+"""
+import argparse
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from avl_range_tree.avl_tree import RangeTree
+from avl_range_tree.client import RangeTreeClient
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SPACE = 10 ** 12
+
+
+def build_snapshot(path, count):
+    """Writes a snapshot of `count` random intervals."""
+    rng = random.Random(42)
+    starts = [rng.randrange(SPACE) for _ in range(count)]
+    ends = [start + rng.randrange(SPACE // count * 10) for start in starts]
+    tree = RangeTree.from_columns(starts, ends, [f"key{i}" for i in range(count)])
+    with open(path, "wb") as f:
+        f.write(tree.to_snapshot())
+
+
+def wait_until_ready(client, process, timeout=30):
+    """Pings the server until it answers."""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            client.ping()
+            return
+        except OSError:
+            if process.poll() is not None or time.monotonic() > deadline:
+                raise RuntimeError("The server did not start")
+            time.sleep(0.05)
+
+
+def worker(client, seed, batch, pipeline, deadline, latencies, counts):
+    """Sends requests until the deadline, recording the latency of every round trip."""
+    rng = random.Random(seed)
+    points = 0
+    while time.perf_counter() < deadline:
+        batches = [[rng.randrange(SPACE) for _ in range(batch)] for _ in range(pipeline)]
+        t0 = time.perf_counter()
+        client.search_pipelined(batches)
+        latencies.append(time.perf_counter() - t0)
+        points += batch * pipeline
+    counts.append(points)
+
+
+def percentile(values, q):
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--intervals", type=int, default=100000)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--batch", type=int, default=1, help="Points per request")
+    parser.add_argument("--pipeline", type=int, default=1, help="Requests in flight per connection")
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--unix", action="store_true", help="Use a Unix socket instead of TCP")
+    parser.add_argument("--port", type=int, default=7878)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        snapshot = os.path.join(tmp, "tree.snapshot")
+        build_snapshot(snapshot, args.intervals)
+
+        command = [sys.executable, "-m", "avl_range_tree.server", "--snapshot", snapshot]
+        if args.unix:
+            address = {"path": os.path.join(tmp, "server.sock")}
+            command += ["--unix", address["path"]]
+        else:
+            address = {"port": args.port}
+            command += ["--port", str(args.port)]
+        env = dict(os.environ, PYTHONPATH=ROOT)
+        process = subprocess.Popen(command, env=env, stderr=subprocess.DEVNULL)
+        try:
+            client = RangeTreeClient(pool_size=args.clients, **address)
+            wait_until_ready(client, process)
+
+            latencies, counts = [], []
+            deadline = time.perf_counter() + args.duration
+            threads = [
+                threading.Thread(target=worker, args=(client, i, args.batch, args.pipeline, deadline, latencies, counts))
+                for i in range(args.clients)
+            ]
+            t0 = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - t0
+            client.close()
+        finally:
+            process.terminate()
+            process.wait()
+
+    latencies.sort()
+    print(f"{args.intervals} intervals, {args.clients} clients, batch {args.batch}, pipeline {args.pipeline}, "
+          f"{'unix' if args.unix else 'tcp'}")
+    print(f"throughput: {sum(counts) / elapsed:,.0f} lookups/s, {len(latencies) / elapsed:,.0f} round trips/s")
+    for q in (0.5, 0.9, 0.99, 0.999):
+        print(f"p{q * 100:g} round trip: {percentile(latencies, q) * 1e6:,.0f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+Builds the optional compiled accelerator `avl_range_tree._avl_tree`.
+
+Poetry generates a `setup.py` that calls `build(setup_kwargs)` when building the package. The
+extension is optional: if it cannot be compiled, the package is still installed and
+`avl_range_tree.avl_tree` falls back to the pure Python implementation.
+
+To build the extension in place for development:
+
+    python build.py build_ext --inplace
+
+Running the script without arguments does the same.
+"""
+import sys
+import warnings
+
+from setuptools import Extension
+from setuptools.command.build_ext import build_ext
+
+extensions = [Extension("avl_range_tree._avl_tree", sources=["avl_range_tree/_avl_tree.c"])]
+
+
+class OptionalBuildExt(build_ext):
+    """Builds the C extensions, falling back to pure Python when compilation fails."""
+
+    def run(self):
+        try:
+            super().run()
+        except Exception as e:
+            warnings.warn(f"Could not build the compiled accelerator, using pure Python: {e}")
+
+    def build_extension(self, ext):
+        try:
+            super().build_extension(ext)
+        except Exception as e:
+            warnings.warn(f"Could not build {ext.name}, using pure Python: {e}")
+
+
+def build(setup_kwargs):
+    """Adds the optional extension to the setup arguments generated by Poetry."""
+    setup_kwargs.update(ext_modules=extensions, cmdclass={"build_ext": OptionalBuildExt})
+
+
+if __name__ == "__main__":
+    from setuptools import setup
+
+    setup(
+        name="avl_range_tree",
+        packages=["avl_range_tree"],
+        ext_modules=extensions,
+        cmdclass={"build_ext": OptionalBuildExt},
+        script_args=sys.argv[1:] or ["build_ext", "--inplace"],
+    )
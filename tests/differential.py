@@ -0,0 +1,499 @@
+"""
+Randomized differential harness for the RangeTree engines.
+
+Random operation sequences are run against an engine and a brute-force oracle that keeps the
+intervals in a plain list. After every write, every invariant of the tree is checked: AVL
+balance, `height`, `max`, `best`, the in-order sequence (which covers the BST order and the
+relative order of equal starts) and `_size`. Every search result is compared with a linear scan
+of the intervals in the pre-order of the tree, which is how ties between intervals of the same
+width are documented to be broken.
+
+Values are drawn from small ranges most of the time, so that equal starts, identical intervals
+and ties are frequent. When a sequence fails, it is shrunk to a minimal failing sequence before
+being reported.
+
+When the compiled accelerator is built, the trees run on its nodes and kernels, setting
+`AVL_RANGE_TREE_PURE_PYTHON=1` checks the pure Python ones instead.
+
+The test suite runs a few cases per engine, `AVL_RANGE_TREE_DIFFERENTIAL_SCALE` multiplies
+their number. Longer runs, for example to validate an optimized engine, use the command line:
+
+    python -m tests.differential --cases 20000 --operations 200 --engine python
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from itertools import count
+
+from avl_range_tree.avl_tree import RangeTree
+from avl_range_tree.paged import PagedRangeIndex
+from avl_range_tree.persistent import PersistentRangeTree
+from avl_range_tree.policies import MostRecent
+
+SCALE = float(os.environ.get("AVL_RANGE_TREE_DIFFERENTIAL_SCALE", "1"))
+
+
+class DifferentialFailure(AssertionError):
+    """Raised with the shrunk operation sequence when an engine disagrees with the oracle."""
+
+
+# Operations
+
+def generate(rng: random.Random, operations: int, removes: bool = False) -> list:
+    """
+    Generates a random operation sequence.
+
+    Operations are tuples: ("insert", start, end, key), ("insert_many", intervals),
+    ("search", point), ("rebuild",) and ("remove", index), which removes the live interval at
+    `index` modulo the number of intervals.
+
+    Args:
+        rng (random.Random): The random generator.
+        operations (int): The number of operations.
+        removes (bool): Whether to generate removals.
+
+    Returns:
+        list: The operations.
+    """
+    space = rng.choice((4, 16, 256, 1 << 40))
+    keys = count()
+
+    def interval():
+        start = rng.randrange(-space, space)
+        shape = rng.random()
+        if shape < 0.05:
+            end = start - 1  # Empty interval, never matches
+        elif shape < 0.3:
+            end = start
+        else:
+            end = start + rng.randrange(space)
+        return (start, end, f"k{next(keys)}")
+
+    ops = []
+    for _ in range(operations):
+        roll = rng.random()
+        if roll < 0.45:
+            ops.append(("insert", *interval()))
+        elif roll < 0.55:
+            ops.append(("insert_many", tuple(interval() for _ in range(rng.randrange(40)))))
+        elif roll < 0.58:
+            ops.append(("rebuild",))
+        elif removes and roll < 0.66:
+            ops.append(("remove", rng.randrange(1 << 16)))
+        else:
+            ops.append(("search", rng.randrange(-space - 1, 2 * space + 1)))
+    return ops
+
+
+class Oracle:
+    """
+    Brute-force model of a tree: the intervals in insertion order, with their sequence numbers.
+
+    Attributes:
+        intervals (list): The (start, end, key, seq) of the live intervals, in insertion order.
+    """
+
+    def __init__(self, compress_duplicates: bool = False):
+        self.compress_duplicates = compress_duplicates
+        self.intervals = []
+        self.seq = 0
+
+    def insert(self, start, end, key):
+        self.intervals.append((start, end, key, self.seq))
+        self.seq += 1
+
+    def insert_many(self, batch):
+        # Batches are numbered in the order they are given, like `RangeTree.insert_many` does
+        for start, end, key in batch:
+            self.insert(start, end, key)
+
+    def remove(self, index):
+        """Removes and returns the live interval at `index` modulo their number, or None."""
+        if not self.intervals:
+            return None
+        return self.intervals.pop(index % len(self.intervals))[:3]
+
+    def in_order(self):
+        """The intervals in the expected in-order sequence: stable by start, or (start, end)."""
+        order = (lambda i: (i[0], i[1])) if self.compress_duplicates else (lambda i: i[0])
+        return [interval[:3] for interval in sorted(self.intervals, key=order)]
+
+    def most_recent(self, point):
+        """The containing interval inserted last, as selected by the MostRecent policy."""
+        best = None
+        for start, end, key, seq in self.intervals:
+            if start <= point <= end:
+                best = (start, end, key)
+        return best
+
+
+def smallest_first(intervals, point):
+    """The first of the smallest intervals containing a point, in the order given."""
+    best = None
+    for start, end, key in intervals:
+        if start <= point <= end and (best is None or end - start < best[1] - best[0]):
+            best = (start, end, key)
+    return best
+
+
+def points_of(ops):
+    """Search points covering every interval bound of a sequence, sorted."""
+    points = set()
+    for op in ops:
+        if op[0] == "insert":
+            points.update((op[1] - 1, op[1], op[2], op[2] + 1))
+        elif op[0] == "insert_many":
+            for start, end, _ in op[1]:
+                points.update((start - 1, start, end, end + 1))
+        elif op[0] == "search":
+            points.add(op[1])
+    return sorted(points)
+
+
+# Invariants
+
+def check_subtree(tree, node, compress_duplicates):
+    """
+    Checks the augmented values and the AVL balance of a subtree.
+
+    Returns:
+        tuple: The height and the number of intervals of the subtree.
+    """
+    if node is None:
+        return 0, 0
+    left_height, left_size = check_subtree(tree, node.left, compress_duplicates)
+    right_height, right_size = check_subtree(tree, node.right, compress_duplicates)
+
+    where = f"node ({node.start}, {node.end}, {node.key!r})"
+    assert abs(left_height - right_height) <= 1, f"{where} is unbalanced: heights {left_height} and {right_height}"
+    assert node.height == 1 + max(left_height, right_height), f"{where} has height {node.height}"
+    expected_max = max(node.end, tree.get_max(node.left), tree.get_max(node.right))
+    assert node.max == expected_max, f"{where} has max {node.max} instead of {expected_max}"
+    if tree.policy is not None:
+        expected_best = min([node.score] + [child.best for child in (node.left, node.right) if child is not None])
+        assert node.best == expected_best, f"{where} has best {node.best} instead of {expected_best}"
+    if not compress_duplicates:
+        assert not node.bucket, f"{where} has a bucket in an uncompressed tree"
+    return node.height, left_size + right_size + 1 + len(node.bucket or ())
+
+
+def check_tree(tree, oracle, root, size):
+    """
+    Checks the invariants of a Python tree, or of one version of a persistent tree, against the oracle.
+
+    Args:
+        tree (RangeTree): The tree.
+        oracle (Oracle): The model of the tree, or of the version.
+        root (RangeNode): The root to check.
+        size (int): The recorded number of intervals to check.
+    """
+    _, counted = check_subtree(tree, root, tree.compress_duplicates)
+    expected = oracle.in_order()
+    assert counted == len(expected), f"The nodes hold {counted} intervals instead of {len(expected)}"
+    assert size == len(expected), f"_size is {size} instead of {len(expected)}"
+    assert list(tree.in_order_traversal(root)) == expected, "The in-order sequence differs from the oracle"
+    if tree.compress_duplicates:
+        nodes = []
+        stack, node = [], root
+        while stack or node:
+            while node:
+                stack.append(node)
+                node = node.left
+            node = stack.pop()
+            nodes.append((node.start, node.end))
+            node = node.right
+        assert len(set(nodes)) == len(nodes), "Identical intervals are stored in separate nodes"
+
+
+def expected_search(tree, oracle, point, root):
+    """The interval `search` must return for a point, from the oracle or the pre-order of the tree."""
+    if tree.policy is not None:
+        return oracle.most_recent(point)
+    return smallest_first(tree.pre_order_traversal(root), point)
+
+
+def check_search(tree, oracle, point, version=None):
+    """Checks `search` and `search_keys` for a point against the oracle."""
+    if version is None:
+        result = tree.search(point)
+        # Read the root after searching, a search may trigger an automatic rebuild
+        expected = expected_search(tree, oracle, point, tree.root)
+    else:
+        result = tree.search(point, version=version)
+        expected = expected_search(tree, oracle, point, tree.root_at(version))
+    assert result == expected, f"search({point}) returned {result} instead of {expected}"
+
+    if version is None:
+        keys = tree.search_keys(point)
+        expected = expected_search(tree, oracle, point, tree.root)
+        if expected is None:
+            assert keys is None, f"search_keys({point}) returned {keys} instead of None"
+        else:
+            expected_keys = [expected[2]]
+            if tree.compress_duplicates:
+                expected_keys = [k for s, e, k in oracle.in_order() if (s, e) == expected[:2]]
+            assert keys == (*expected[:2], expected_keys), f"search_keys({point}) returned {keys}"
+
+
+def check_queries(tree, ops):
+    """Checks the queries that are defined in terms of `search` and of the in-order sequence."""
+    points = points_of(ops)
+    results = [tree.search(point) for point in points]
+    assert list(tree.search_sorted(points)) == results, "search_sorted differs from search"
+    assert list(reversed(tree)) == list(tree)[::-1], "reversed differs from the in-order sequence"
+
+
+# Engines
+
+def run_python(ops, cls=RangeTree, **options):
+    """
+    Runs a sequence on a Python RangeTree, checking it against the oracle after every operation.
+
+    Args:
+        ops (list): The operations.
+        cls (type): The tree class, RangeTree or a subclass with an optimized implementation.
+        **options: The options of the tree, and `auto_rebuild` to rebuild it automatically.
+    """
+    auto_rebuild = options.pop("auto_rebuild", False)
+    tree = cls(**options)
+    if auto_rebuild:
+        # Rebuilds as soon as the tree is higher than a perfectly balanced one, or searches slow down
+        tree.enable_auto_rebuild(height_ratio=1.0, visit_ratio=1.0, sample_every=1, window=2, min_size=1, background=False)
+    oracle = Oracle(tree.compress_duplicates)
+    for op in ops:
+        name = op[0]
+        if name == "insert":
+            tree.insert(*op[1:])
+            oracle.insert(*op[1:])
+        elif name == "insert_many":
+            tree.insert_many(op[1])
+            oracle.insert_many(op[1])
+        elif name == "rebuild":
+            tree.rebuild()
+        elif name == "search":
+            check_search(tree, oracle, op[1])
+            continue
+        check_tree(tree, oracle, tree.root, tree._size)
+    # The following checks compare successive searches, which must not rebuild the tree in between
+    tree.disable_auto_rebuild()
+    check_queries(tree, ops)
+
+
+def run_compressed(ops):
+    """Runs a sequence on a RangeTree compressing duplicate intervals."""
+    run_python(ops, compress_duplicates=True)
+
+
+def run_policy(ops):
+    """Runs a sequence on a RangeTree with the MostRecent selection policy."""
+    run_python(ops, policy=MostRecent())
+
+
+def run_auto_rebuild(ops):
+    """Runs a sequence on a RangeTree rebuilding itself as often as possible."""
+    run_python(ops, auto_rebuild=True)
+
+
+def run_persistent(ops, compress_duplicates=False):
+    """Runs a sequence on a PersistentRangeTree, then checks sampled versions against their oracle."""
+    tree = PersistentRangeTree(compress_duplicates=compress_duplicates)
+    oracle = Oracle(compress_duplicates)
+    versions = [Oracle(compress_duplicates)]
+    for op in ops:
+        name = op[0]
+        if name == "insert":
+            tree.insert(*op[1:])
+            oracle.insert(*op[1:])
+        elif name == "insert_many":
+            tree.insert_many(op[1])
+            oracle.insert_many(op[1])
+        elif name == "rebuild":
+            tree.rebuild()
+        elif name == "remove":
+            interval = oracle.remove(op[1])
+            if interval is None:
+                continue
+            tree.remove(*interval)
+        elif name == "search":
+            check_search(tree, oracle, op[1])
+            continue
+        check_tree(tree, oracle, tree.root, tree._size)
+        snapshot = Oracle(compress_duplicates)
+        snapshot.intervals = list(oracle.intervals)
+        versions.append(snapshot)
+
+    assert tree.version == len(versions) - 1, f"{tree.version} versions instead of {len(versions) - 1}"
+    points = points_of(ops)
+    for version in sorted({*range(0, len(versions), max(1, len(versions) // 8)), len(versions) - 1}):
+        snapshot = versions[version]
+        check_tree(tree, snapshot, tree.root_at(version), tree.size_at(version))
+        for point in points[::7]:
+            check_search(tree, snapshot, point, version=version)
+
+
+def run_persistent_compressed(ops):
+    """Runs a sequence on a PersistentRangeTree compressing duplicate intervals."""
+    run_persistent(ops, compress_duplicates=True)
+
+
+def run_paged(ops, compress_duplicates=False):
+    """Builds a PagedRangeIndex with small pages from a tree holding the intervals of a sequence and checks it."""
+    tree = RangeTree(compress_duplicates=compress_duplicates)
+    oracle = Oracle(compress_duplicates)
+    for op in ops:
+        if op[0] == "insert":
+            tree.insert(*op[1:])
+            oracle.insert(*op[1:])
+        elif op[0] == "insert_many":
+            tree.insert_many(op[1])
+            oracle.insert_many(op[1])
+    intervals = list(tree)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        with PagedRangeIndex.build(os.path.join(tmp, "index"), tree, page_size=128) as index:
+            assert len(index) == len(intervals), f"len() is {len(index)} instead of {len(intervals)}"
+            assert list(index) == intervals, "The intervals differ from the tree"
+            for point in points_of(ops):
+                # Same rule as the tree: ties go to the first interval in pre-order
+                expected = expected_search(tree, oracle, point, tree.root)
+                assert index.search(point) == expected, f"search({point}) returned {index.search(point)}"
+
+
+def run_paged_compressed(ops):
+    """Builds a PagedRangeIndex from a tree compressing duplicate intervals."""
+    run_paged(ops, compress_duplicates=True)
+
+
+ENGINES = {
+    "python": run_python,
+    "compressed": run_compressed,
+    "policy": run_policy,
+    "auto_rebuild": run_auto_rebuild,
+    "persistent": run_persistent,
+    "persistent_compressed": run_persistent_compressed,
+    "paged": run_paged,
+    "paged_compressed": run_paged_compressed,
+}
+
+
+# Shrinking
+
+def failure(engine, ops):
+    """Runs a sequence and returns the error it raises, or None if it passes."""
+    try:
+        ENGINES[engine](ops)
+    except Exception as e:
+        return f"{type(e).__name__}: {e}"
+    return None
+
+
+def simplifications(op):
+    """Yields simpler variants of an operation: fewer intervals, smaller values."""
+    name = op[0]
+    if name == "insert_many":
+        batch = op[1]
+        for i in range(len(batch)):
+            yield ("insert_many", batch[:i] + batch[i + 1:])
+        if len(batch) == 1:
+            yield ("insert", *batch[0])
+    elif name == "insert":
+        _, start, end, key = op
+        if start != 0:
+            yield ("insert", 0, end - start, key)
+            yield ("insert", start // 2, start // 2 + end - start, key)
+        if end - start > 0:
+            yield ("insert", start, start + (end - start) // 2, key)
+    elif name in ("search", "remove") and op[1] != 0:
+        yield (name, 0)
+        yield (name, op[1] // 2)
+
+
+def shrink(engine, ops, max_runs=20000):
+    """
+    Shrinks a failing sequence: removes chunks of operations, then simplifies single operations,
+    until no smaller sequence fails.
+
+    Args:
+        engine (str): The engine name.
+        ops (list): The failing operations.
+        max_runs (int): The maximum number of sequences to run.
+
+    Returns:
+        tuple: The shrunk operations and their error.
+    """
+    error = failure(engine, ops)
+    runs = 0
+    changed = True
+    while changed and runs < max_runs:
+        changed = False
+        size = max(len(ops) // 2, 1)
+        while size >= 1:
+            i = 0
+            while i < len(ops) and runs < max_runs:
+                candidate = ops[:i] + ops[i + size:]
+                runs += 1
+                candidate_error = failure(engine, candidate)
+                if candidate_error:
+                    ops, error, changed = candidate, candidate_error, True
+                else:
+                    i += size
+            size //= 2
+
+        for i in range(len(ops)):
+            for simpler in simplifications(ops[i]):
+                candidate = ops[:i] + [simpler] + ops[i + 1:]
+                runs += 1
+                candidate_error = failure(engine, candidate)
+                if candidate_error:
+                    ops, error, changed = candidate, candidate_error, True
+                    break
+    return ops, error
+
+
+def run(engine: str, cases: int, operations: int, seed: int = 0) -> int:
+    """
+    Runs random sequences on an engine.
+
+    Args:
+        engine (str): The name of the engine, a key of ENGINES.
+        cases (int): The number of sequences.
+        operations (int): The number of operations per sequence.
+        seed (int): The seed of the first sequence, the following ones use the next seeds.
+
+    Returns:
+        int: The number of operations run.
+
+    Raises:
+        DifferentialFailure: With the shrunk sequence, if the engine disagrees with the oracle.
+    """
+    total = 0
+    for case in range(seed, seed + cases):
+        rng = random.Random(case)
+        ops = generate(rng, rng.randrange(1, operations + 1), removes=engine.startswith("persistent"))
+        if failure(engine, ops):
+            ops, error = shrink(engine, ops)
+            steps = "\n".join(f"    {op!r}," for op in ops)
+            raise DifferentialFailure(f"{engine} failed on seed {case}: {error}\nShrunk operations:\n[\n{steps}\n]")
+        total += len(ops) + sum(len(op[1]) for op in ops if op[0] == "insert_many")
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run random operation sequences against a brute-force oracle.")
+    parser.add_argument("--engine", choices=sorted(ENGINES), action="append", help="Engines to run, all by default")
+    parser.add_argument("--cases", type=int, default=1000)
+    parser.add_argument("--operations", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    for engine in args.engine or ENGINES:
+        t0 = time.perf_counter()
+        total = run(engine, args.cases, args.operations, args.seed)
+        elapsed = time.perf_counter() - t0
+        print(f"{engine}: {args.cases} cases, {total} operations in {elapsed:.1f}s ({total / elapsed:,.0f} ops/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,13 @@
+import random
 import xml.etree.ElementTree as ET
+from array import array
 from typing import Dict, Any
 
 import orjson
+import pytest
 
 from avl_range_tree.avl_tree import RangeTree
+from tests.differential import check_subtree
 
 
 def test_insert_single_interval():
@@ -517,3 +521,287 @@ def test_custom_serialization_xml():
 
     # Check if the in-order traversal is as expected
     assert result == expected_in_order, f"Expected {expected_in_order}, but got {result}"
+
+
+def test_search_interval_in_left_subtree_beyond_node_end():
+    tree = RangeTree()
+    tree.insert(10, 20, "key1")
+    tree.insert(1, 100, "key2")
+    tree.insert(30, 40, "key3")
+    # The root (10, 20) does not contain 50, but its left child (1, 100) does
+    assert tree.search(50) == (1, 100, "key2")
+    assert tree.search(35) == (30, 40, "key3")
+
+
+def test_compressed_identical_intervals():
+    tree = RangeTree(compress_duplicates=True)
+    for i in range(1, 6):
+        tree.insert(10, 20, f"key{i}")
+    tree.insert(12, 18, "key6")
+    tree.insert(10, 30, "key7")
+
+    assert len(tree) == 7
+    assert tree.root.height == 2  # Three distinct intervals, so three nodes
+    assert tree.search(15) == (12, 18, "key6")
+    assert tree.search(11) == (10, 20, "key1")  # The first inserted key is returned
+    assert tree.search_keys(11) == (10, 20, ["key1", "key2", "key3", "key4", "key5"])
+    assert tree.search(25) == (10, 30, "key7")
+    assert tree.search(31) is None
+
+    assert list(tree.in_order_traversal(tree.root)) == [
+        (10, 20, "key1"),
+        (10, 20, "key2"),
+        (10, 20, "key3"),
+        (10, 20, "key4"),
+        (10, 20, "key5"),
+        (10, 30, "key7"),
+        (12, 18, "key6"),
+    ]
+
+
+def test_compressed_serialization():
+    tree = RangeTree(compress_duplicates=True)
+    tree.insert(10, 20, "key1")
+    tree.insert(10, 20, "key2")
+    tree.insert(15, 25, "key3")
+
+    restored_tree = RangeTree.deserialize(tree.serialize())
+    assert restored_tree.compress_duplicates
+    assert len(restored_tree) == 3
+    assert restored_tree.search_keys(12) == (10, 20, ["key1", "key2"])
+
+    # New copies of an existing interval still land in the same bucket
+    restored_tree.insert(10, 20, "key4")
+    assert restored_tree.search_keys(12) == (10, 20, ["key1", "key2", "key4"])
+
+
+def test_snapshot():
+    tree = RangeTree()
+    for i in range(100):
+        tree.insert(i % 13, i % 13 + i, f"key{i}")
+
+    restored_tree = RangeTree.from_snapshot(tree.to_snapshot())
+    assert len(restored_tree) == 100
+    # The exact same shape is restored, so every search returns the same result
+    assert list(restored_tree.pre_order_traversal(restored_tree.root)) == list(tree.pre_order_traversal(tree.root))
+    for point in range(-1, 120):
+        assert restored_tree.search(point) == tree.search(point)
+
+    compressed_tree = RangeTree(compress_duplicates=True)
+    compressed_tree.insert(10, 20, "key1")
+    compressed_tree.insert(10, 20, "key2")
+    restored_tree = RangeTree.from_snapshot(compressed_tree.to_snapshot())
+    assert restored_tree.compress_duplicates
+    assert restored_tree.search_keys(15) == (10, 20, ["key1", "key2"])
+
+    empty_tree = RangeTree.from_snapshot(RangeTree().to_snapshot())
+    assert empty_tree.root is None
+    assert len(empty_tree) == 0
+
+
+def test_snapshot_invalid_data():
+    with pytest.raises(ValueError):
+        RangeTree.from_snapshot(b"")
+    with pytest.raises(ValueError):
+        RangeTree.from_snapshot(RangeTree().serialize().encode())
+
+
+@pytest.mark.parametrize("batch_size", [5, 5000])
+@pytest.mark.parametrize("compress_duplicates", [False, True])
+def test_insert_many(batch_size, compress_duplicates):
+    rng = random.Random(batch_size)
+    intervals = []
+    for i in range(1000 + batch_size):
+        start = rng.randrange(500)
+        intervals.append((start, start + rng.randrange(50), f"key{i}"))
+
+    tree = RangeTree(compress_duplicates=compress_duplicates)
+    for start, end, key in intervals[:1000]:
+        tree.insert(start, end, key)
+    tree.insert_many(intervals[1000:])
+
+    # Small batches are inserted in a single descent, large batches trigger a balanced rebuild
+    assert len(tree) == 1000 + batch_size
+    assert tree.root.height <= 1.44 * (len(tree) + 2).bit_length()
+    assert sorted(tree) == sorted(intervals)
+    for point in range(-1, 551):
+        widths = [end - start for start, end, _ in intervals if start <= point <= end]
+        result = tree.search(point)
+        assert (result[1] - result[0] if result else None) == (min(widths) if widths else None)
+
+    if compress_duplicates:
+        # Identical intervals from both the tree and the batch share a bucket, in insertion order
+        start, end, key = intervals[-1]
+        keys = [k for s, e, k in intervals if (s, e) == (start, end)]
+        node = tree.root
+        while (node.start, node.end) != (start, end):
+            node = node.left if (start, end) < (node.start, node.end) else node.right
+        assert [node.key] + (node.bucket or []) == keys
+
+
+@pytest.mark.parametrize("compress_duplicates", [False, True])
+def test_insert_many_small_batch_single_descent(compress_duplicates):
+    rng = random.Random(7)
+    tree = RangeTree(compress_duplicates=compress_duplicates)
+    sequential = RangeTree(compress_duplicates=compress_duplicates)
+    for i in range(1000):
+        start = rng.randrange(1000)
+        tree.insert(start, start + 10, f"key{i}")
+        sequential.insert(start, start + 10, f"key{i}")
+
+    # A batch clustered in one small range grows a single subtree by several levels, spread over the tree
+    # and landing on existing intervals
+    batch = [(500 + i % 3, 510, f"new{i}") for i in range(150)] + [(rng.randrange(1000), 1000, f"far{i}") for i in range(20)]
+    batch += [(start, end, "dup") for start, end, _ in list(tree)[::100]]
+    tree.insert_node = None  # The batch never goes through the per-interval insertion
+    tree.insert_many(batch)
+    for start, end, key in sorted(batch, key=lambda interval: interval[:2] if compress_duplicates else interval[0]):
+        sequential.insert(start, end, key)
+
+    assert check_subtree(tree, tree.root, compress_duplicates) == (tree.root.height, len(tree))
+    assert len(tree) == len(sequential) == 1000 + len(batch)
+    assert list(tree) == list(sequential)
+    for point in range(-1, 1100):
+        # The shapes differ, so intervals of the same width may break ties differently
+        result, expected = tree.search(point), sequential.search(point)
+        assert (result and result[1] - result[0]) == (expected and expected[1] - expected[0])
+    if compress_duplicates:
+        assert [tree.search_keys(point) for point in range(1100)] == [sequential.search_keys(point) for point in range(1100)]
+
+
+def test_insert_many_empty_tree():
+    tree = RangeTree()
+    tree.insert_many([(30, 40, "key3"), (10, 20, "key1"), (15, 25, "key2")])
+    assert len(tree) == 3
+    assert list(tree) == [(10, 20, "key1"), (15, 25, "key2"), (30, 40, "key3")]
+    assert tree.search(12) == (10, 20, "key1")
+
+    tree.insert_many([])
+    assert len(tree) == 3
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_search_sorted(seed):
+    rng = random.Random(seed)
+    tree = RangeTree(compress_duplicates=seed % 2 == 1)
+    for i in range(1000):
+        start = rng.randrange(1000)
+        tree.insert(start, start + rng.randrange(100), f"key{i}")
+
+    points = sorted(rng.randrange(-10, 1200) for _ in range(2000))
+    assert list(tree.search_sorted(points)) == [tree.search(point) for point in points]
+
+
+def test_search_sorted_skips_dead_subtrees():
+    class CountedStart(int):
+        """A start counting how many times the sweep compares it with a point."""
+        comparisons = 0
+
+        def __gt__(self, other):
+            CountedStart.comparisons += 1
+            return int.__gt__(self, other)
+
+    tree = RangeTree()
+    tree.insert_many([(CountedStart(i), i + 2, f"key{i}") for i in range(10000)])
+    tree.insert(5000, 20000, "long")
+
+    CountedStart.comparisons = 0
+    points = [9990, 9995, 9999, 15000, 30000]
+    assert list(tree.search_sorted(points)) == [tree.search(point) for point in points]
+    # Only the paths to the few intervals reaching the points are walked, not the 10000 nodes ending before them
+    assert CountedStart.comparisons < 200
+
+
+def test_search_sorted_unsorted_points():
+    tree = RangeTree()
+    tree.insert(10, 20, "key1")
+    assert list(tree.search_sorted([])) == []
+    assert list(RangeTree().search_sorted([1, 2])) == [None, None]
+    with pytest.raises(ValueError):
+        list(tree.search_sorted([15, 12]))
+
+
+def test_to_columns():
+    tree = RangeTree(compress_duplicates=True)
+    tree.insert(15, 25, "key2")
+    tree.insert(10, 20, "key1")
+    tree.insert(10, 20, "key3")
+
+    starts, ends, keys = tree.to_columns()
+    assert starts.typecode == ends.typecode == "q"
+    assert memoryview(starts).format == "q"
+    assert list(starts) == [10, 10, 15]
+    assert list(ends) == [20, 20, 25]
+    assert keys == ["key1", "key3", "key2"]
+
+    starts, ends, keys = RangeTree().to_columns()
+    assert len(starts) == len(ends) == len(keys) == 0
+
+
+@pytest.mark.parametrize("compress_duplicates", [False, True])
+def test_from_columns(compress_duplicates):
+    rng = random.Random(3)
+    tree = RangeTree(compress_duplicates=compress_duplicates)
+    for i in range(2000):
+        start = rng.randrange(1000)
+        tree.insert(start, start + rng.randrange(30), f"key{i}")
+
+    columns = tree.to_columns()
+    restored_tree = RangeTree.from_columns(*columns, compress_duplicates=compress_duplicates)
+    assert len(restored_tree) == 2000
+    assert restored_tree.root.height <= (2000).bit_length()  # Perfectly balanced
+    assert restored_tree.to_columns() == columns
+    for point in range(-1, 1100):
+        result, expected = restored_tree.search(point), tree.search(point)
+        assert (result and result[1] - result[0]) == (expected and expected[1] - expected[0])
+
+
+def test_from_columns_unsorted():
+    tree = RangeTree.from_columns([30, 10, 15, 10], array("q", [40, 20, 25, 12]), ("key3", "key1", "key2", "key4"))
+    assert list(tree) == [(10, 20, "key1"), (10, 12, "key4"), (15, 25, "key2"), (30, 40, "key3")]
+    assert tree.search(11) == (10, 12, "key4")
+
+    with pytest.raises(ValueError):
+        RangeTree.from_columns([1, 2], [3], ["key1", "key2"])
+
+
+def test_reversed_iteration():
+    tree = RangeTree(compress_duplicates=True)
+    intervals = [(10, 20, "key1"), (5, 15, "key2"), (15, 25, "key3"), (5, 15, "key4"), (3, 8, "key5")]
+    for start, end, key in intervals:
+        tree.insert(start, end, key)
+
+    assert list(reversed(tree)) == list(tree)[::-1]
+    assert list(reversed(RangeTree())) == []
+
+
+@pytest.mark.parametrize("reverse", [False, True])
+def test_irange(reverse):
+    rng = random.Random(11)
+    tree = RangeTree()
+    for i in range(500):
+        start = rng.randrange(100)
+        tree.insert(start, start + 10, f"key{i}")
+    intervals = list(tree)
+
+    for lo, hi in [(None, None), (20, 40), (None, 10), (90, None), (50, 50), (40, 20), (200, 300)]:
+        expected = [
+            interval for interval in intervals
+            if (lo is None or interval[0] >= lo) and (hi is None or interval[0] <= hi)
+        ]
+        if reverse:
+            expected.reverse()
+        assert list(tree.irange(lo, hi, reverse=reverse)) == expected
+
+
+def test_traversals_with_compressed_duplicates():
+    tree = RangeTree(compress_duplicates=True)
+    for start, end, key in [(10, 20, "key1"), (5, 15, "key2"), (15, 25, "key3"), (5, 15, "key4")]:
+        tree.insert(start, end, key)
+
+    assert list(tree.pre_order_traversal(tree.root)) == [
+        (10, 20, "key1"), (5, 15, "key2"), (5, 15, "key4"), (15, 25, "key3")
+    ]
+    assert list(tree.post_order_traversal(tree.root)) == [
+        (5, 15, "key2"), (5, 15, "key4"), (15, 25, "key3"), (10, 20, "key1")
+    ]
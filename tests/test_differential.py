@@ -0,0 +1,34 @@
+import ast
+
+import pytest
+
+from avl_range_tree.avl_tree import RangeTree
+from tests import differential
+from tests.differential import ENGINES, SCALE, DifferentialFailure
+
+
+@pytest.mark.parametrize("engine", sorted(ENGINES))
+def test_engine_matches_oracle(engine):
+    # AVL_RANGE_TREE_DIFFERENTIAL_SCALE=100 runs a few hundred thousand operations per engine
+    differential.run(engine, cases=max(1, int(20 * SCALE)), operations=100)
+
+
+class StaleMaxTree(RangeTree):
+    """Forgets to update the max of the new subtree root after a left rotation."""
+
+    def left_rotate(self, x):
+        y = super().left_rotate(x)
+        y.max = max(y.end, self.get_max(y.right))
+        return y
+
+
+def test_failures_are_shrunk(monkeypatch):
+    monkeypatch.setitem(ENGINES, "stale_max", lambda ops: differential.run_python(ops, cls=StaleMaxTree))
+    with pytest.raises(DifferentialFailure) as failure:
+        differential.run("stale_max", cases=50, operations=100)
+
+    message = str(failure.value)
+    assert "has max" in message
+    # Three ascending insertions are enough to trigger a left rotation
+    ops = ast.literal_eval(message.split("Shrunk operations:\n", 1)[1])
+    assert len(ops) <= 3
@@ -0,0 +1,260 @@
+import importlib.util
+import os
+import random
+
+import pytest
+
+from avl_range_tree import avl_tree
+from avl_range_tree.policies import MostRecent
+
+compiled = pytest.mark.skipif(not avl_tree.ACCELERATED, reason="compiled accelerator is not built or disabled")
+
+
+def load_pure_python():
+    """Loads a separate copy of `avl_range_tree.avl_tree` running on the pure Python nodes and kernels."""
+    spec = importlib.util.find_spec("avl_range_tree.avl_tree")
+    module = importlib.util.module_from_spec(spec)
+    previous = os.environ.get("AVL_RANGE_TREE_PURE_PYTHON")
+    os.environ["AVL_RANGE_TREE_PURE_PYTHON"] = "1"
+    try:
+        spec.loader.exec_module(module)
+    finally:
+        if previous is None:
+            del os.environ["AVL_RANGE_TREE_PURE_PYTHON"]
+        else:
+            os.environ["AVL_RANGE_TREE_PURE_PYTHON"] = previous
+    return module
+
+
+pure_python = load_pure_python() if avl_tree.ACCELERATED else avl_tree
+
+
+@pytest.fixture(params=[pytest.param("python"), pytest.param("compiled", marks=compiled)])
+def engine(request):
+    """Every test in this module runs against both RangeTree implementations."""
+    return pure_python.RangeTree if request.param == "python" else avl_tree.RangeTree
+
+
+def test_insert_and_search(engine):
+    tree = engine()
+    tree.insert(10, 20, "key1")
+    tree.insert(21, 25, "key2")
+    tree.insert(30, 40, "key3")
+    assert len(tree) == 3
+    assert tree.search(18) == (10, 20, "key1")
+    assert tree.search(21) == (21, 25, "key2")
+    assert tree.search(40) == (30, 40, "key3")
+    assert tree.search(5) is None
+    assert tree.search(26) is None
+
+
+def test_search_empty_tree(engine):
+    tree = engine()
+    assert len(tree) == 0
+    assert tree.search(15) is None
+    assert tree.search_keys(15) is None
+    assert list(tree) == []
+
+
+def test_smallest_interval_wins(engine):
+    tree = engine()
+    tree.insert(10, 20, "key1")
+    tree.insert(12, 18, "key2")
+    tree.insert(14, 16, "key3")
+    tree.insert(11, 19, "key4")
+    tree.insert(1, 100, "key5")
+    assert tree.search(15) == (14, 16, "key3")
+    assert tree.search(13) == (12, 18, "key2")
+    assert tree.search(50) == (1, 100, "key5")
+
+
+def test_identical_intervals(engine):
+    tree = engine()
+    for i in range(1, 6):
+        tree.insert(10, 20, f"key{i}")
+    assert tree.search(15) == (10, 20, "key2")
+    assert tree.search_keys(15) == (10, 20, ["key2"])
+
+
+def test_compressed_identical_intervals(engine):
+    tree = engine(compress_duplicates=True)
+    assert tree.compress_duplicates
+    for i in range(1, 6):
+        tree.insert(10, 20, f"key{i}")
+    tree.insert(12, 18, "key6")
+    assert len(tree) == 6
+    assert tree.search(11) == (10, 20, "key1")
+    assert tree.search_keys(11) == (10, 20, ["key1", "key2", "key3", "key4", "key5"])
+    assert tree.search_keys(15) == (12, 18, ["key6"])
+    assert list(tree) == [(10, 20, f"key{i}") for i in range(1, 6)] + [(12, 18, "key6")]
+
+
+def test_negative_and_large_bounds(engine):
+    tree = engine()
+    tree.insert(-20, -10, "key1")
+    tree.insert(-(2 ** 63), 2 ** 63 - 1, "key2")
+    tree.insert(123456000000000000, 123456999999999999, "key3")
+    assert tree.search(-15) == (-20, -10, "key1")
+    assert tree.search(0) == (-(2 ** 63), 2 ** 63 - 1, "key2")
+    assert tree.search(123456500000000000) == (123456000000000000, 123456999999999999, "key3")
+    assert tree.search(2 ** 64) is None
+
+
+def test_in_order_iteration(engine):
+    tree = engine()
+    intervals = [(10, 20, "key1"), (5, 15, "key2"), (15, 25, "key3"), (3, 8, "key4"), (12, 18, "key5")]
+    for start, end, key in intervals:
+        tree.insert(start, end, key)
+    assert list(tree) == sorted(intervals)
+
+
+@pytest.mark.parametrize("compress_duplicates", [False, True])
+@pytest.mark.parametrize("seed", range(5))
+def test_random_intervals_match_brute_force(engine, compress_duplicates, seed):
+    rng = random.Random(seed)
+    tree = engine(compress_duplicates=compress_duplicates)
+    intervals = []
+    for i in range(500):
+        # Few distinct starts and widths, so that ties and duplicates are frequent
+        start = rng.randrange(100)
+        end = start + rng.randrange(20)
+        tree.insert(start, end, f"key{i}")
+        intervals.append((start, end))
+
+    for point in range(-1, 121):
+        widths = [end - start for start, end in intervals if start <= point <= end]
+        result = tree.search(point)
+        if widths:
+            assert result[1] - result[0] == min(widths)
+        else:
+            assert result is None
+
+
+@compiled
+@pytest.mark.parametrize("compress_duplicates", [False, True])
+@pytest.mark.parametrize("seed", range(5))
+def test_compiled_matches_python(compress_duplicates, seed):
+    rng = random.Random(seed)
+    python_tree = pure_python.RangeTree(compress_duplicates=compress_duplicates)
+    compiled_tree = avl_tree.RangeTree(compress_duplicates=compress_duplicates)
+    for i in range(2000):
+        start = rng.randrange(200)
+        end = start + rng.randrange(30)
+        python_tree.insert(start, end, f"key{i}")
+        compiled_tree.insert(start, end, f"key{i}")
+
+    assert len(python_tree) == len(compiled_tree)
+    assert list(python_tree) == list(compiled_tree)
+    # Both trees have the same shape, so ties are broken the same way
+    assert list(python_tree.pre_order_traversal(python_tree.root)) == list(
+        compiled_tree.pre_order_traversal(compiled_tree.root)
+    )
+    for point in range(-1, 231):
+        assert python_tree.search(point) == compiled_tree.search(point)
+        assert python_tree.search_keys(point) == compiled_tree.search_keys(point)
+
+
+@compiled
+def test_compiled_policy_matches_python():
+    rng = random.Random(7)
+    python_tree = pure_python.RangeTree(policy=MostRecent())
+    compiled_tree = avl_tree.RangeTree(policy=MostRecent())
+    for i in range(1000):
+        start = rng.randrange(200)
+        end = start + rng.randrange(30)
+        python_tree.insert(start, end, f"key{i}")
+        compiled_tree.insert(start, end, f"key{i}")
+
+    assert list(python_tree.pre_order_traversal(python_tree.root)) == list(
+        compiled_tree.pre_order_traversal(compiled_tree.root)
+    )
+    for point in range(-1, 231):
+        assert python_tree.search(point) == compiled_tree.search(point)
+
+
+@compiled
+@pytest.mark.parametrize("options", [{}, {"compress_duplicates": True}, {"policy": MostRecent()}])
+def test_compiled_batches_match_python(options):
+    rng = random.Random(11)
+    python_tree = pure_python.RangeTree(**options)
+    compiled_tree = avl_tree.RangeTree(**options)
+    for i in range(1000):
+        start = rng.randrange(1000)
+        end = start + rng.randrange(30)
+        python_tree.insert(start, end, f"key{i}")
+        compiled_tree.insert(start, end, f"key{i}")
+
+    for size in (1, 10, 100, 150):
+        # Random batches and batches clustered in a few starts, small enough to skip the rebuild
+        center = rng.randrange(1000)
+        batch = [(rng.randrange(1000), rng.randrange(1000, 1100), f"random{size}-{i}") for i in range(size)]
+        batch += [(center + i % 4, center + 10, f"clustered{size}-{i}") for i in range(size)]
+        python_tree.insert_many(batch)
+        compiled_tree.insert_many(batch)
+        assert list(python_tree.pre_order_traversal(python_tree.root)) == list(
+            compiled_tree.pre_order_traversal(compiled_tree.root)
+        )
+
+    assert len(python_tree) == len(compiled_tree)
+    for point in range(-1, 1101):
+        assert python_tree.search_keys(point) == compiled_tree.search_keys(point)
+
+
+@compiled
+def test_compiled_nodes():
+    tree = avl_tree.RangeTree()
+    tree.insert(10, 20, "key1")
+    assert type(tree.root) is avl_tree.RangeNode
+    assert avl_tree.RangeNode is not pure_python.RangeNode
+
+    node = avl_tree.RangeNode(1, 2, "key")
+    assert (node.start, node.end, node.max, node.height, node.key) == (1, 2, 2, 1, "key")
+    assert node.left is node.right is node.bucket is node.score is node.best is None
+    with pytest.raises(TypeError):
+        node.left = "not a node"
+    node.right = tree.root
+    assert node.right is tree.root
+
+
+def test_float_and_big_bounds(engine):
+    tree = engine()
+    tree.insert(1.5, 3.5, "key1")
+    tree.insert(2, 3, "key2")
+    tree.insert(2 ** 70, 2 ** 70 + 10, "key3")
+    tree.insert(-(2 ** 70), 2 ** 71, "key4")
+    assert tree.search(2.5) == (2, 3, "key2")
+    assert tree.search(1.75) == (1.5, 3.5, "key1")
+    assert tree.search(2 ** 70 + 5) == (2 ** 70, 2 ** 70 + 10, "key3")
+    assert tree.search(0) == (-(2 ** 70), 2 ** 71, "key4")
+    assert tree.search(2 ** 72) is None
+
+
+def test_full_api(engine):
+    intervals = [(i % 97, i % 97 + i % 13, f"key{i}") for i in range(300)]
+    tree = engine()
+    tree.insert_many(intervals[:200])
+    for interval in intervals[200:]:
+        tree.insert(*interval)
+
+    restored = engine.deserialize(tree.serialize())
+    assert list(restored) == list(tree)
+    loaded = engine.from_snapshot(tree.to_snapshot())
+    assert list(loaded) == list(tree)
+    columns = engine.from_columns(*tree.to_columns())
+    assert list(columns) == list(tree)
+    assert list(tree.irange(10, 20)) == [interval for interval in tree if 10 <= interval[0] <= 20]
+    points = list(range(-1, 112))
+    assert list(tree.search_sorted(points)) == [tree.search(point) for point in points]
+
+
+def test_left_right_rotation_with_equal_starts(engine):
+    # The third interval has the start of the left child, so it goes to its right and the root
+    # needs a left-right rotation
+    tree = engine()
+    tree.insert(0, 0, "key1")
+    tree.insert(-3, -2, "key2")
+    tree.insert(-3, -1, "key3")
+    assert list(tree) == [(-3, -2, "key2"), (-3, -1, "key3"), (0, 0, "key1")]
+    assert (tree.root.start, tree.root.end) == (-3, -1)
+    assert tree.root.height == 2
+    assert tree.search(-2) == (-3, -2, "key2")
@@ -0,0 +1,99 @@
+import random
+
+import pytest
+
+from avl_range_tree.avl_tree import RangeTree
+from avl_range_tree.paged import PagedRangeIndex
+
+
+def brute_force_search(intervals, point):
+    best = None
+    for start, end, key in intervals:
+        if start <= point <= end and (best is None or end - start < best[1] - best[0]):
+            best = (start, end, key)
+    return best
+
+
+def test_search_matches_brute_force(tmp_path):
+    rng = random.Random(7)
+    tree = RangeTree()
+    for i in range(3000):
+        start = rng.randrange(10000)
+        tree.insert(start, start + rng.randrange(500), f"key{i}")
+    intervals = list(tree)
+
+    with PagedRangeIndex.build(str(tmp_path / "index"), tree, page_size=256) as index:
+        assert len(index) == 3000
+        assert index.levels >= 3
+        assert list(index) == intervals
+        for point in range(-1, 10600, 7):
+            # Built from the tree, the index breaks ties like the tree
+            assert index.search(point) == tree.search(point)
+
+    # Built from a list, ties go to the first interval in start order
+    with PagedRangeIndex.build(str(tmp_path / "list_index"), intervals, page_size=256) as index:
+        for point in range(-1, 10600, 7):
+            assert index.search(point) == brute_force_search(intervals, point)
+
+
+@pytest.mark.parametrize("compress_duplicates", [False, True])
+def test_ties_follow_the_tree(tmp_path, compress_duplicates):
+    tree = RangeTree(compress_duplicates=compress_duplicates)
+    tree.insert(5, 15, "a")
+    tree.insert(0, 10, "b")
+    tree.insert(8, 18, "c")
+    tree.insert(5, 15, "d")
+    assert tree.search(9) == (5, 15, "a")  # The root comes first in pre-order
+    with PagedRangeIndex.build(str(tmp_path / "index"), tree) as index:
+        assert index.search(9) == (5, 15, "a")
+        assert index.search(12) == tree.search(12)
+
+
+def test_search_small_index(tmp_path):
+    intervals = [(1, 100, "key1"), (10, 20, "key2"), (12, 18, "key3"), (30, 40, "key4"), (30, 40, "key5")]
+    with PagedRangeIndex.build(str(tmp_path / "index"), intervals) as index:
+        assert index.levels == 1
+        assert index.search(15) == (12, 18, "key3")
+        assert index.search(50) == (1, 100, "key1")
+        assert index.search(35) == (30, 40, "key4")  # Ties go to the first interval in start order
+        assert index.search(0) is None
+        assert index.search(101) is None
+
+
+def test_lookups_touch_few_pages(tmp_path):
+    intervals = [(i * 10, i * 10 + 5, f"key{i}") for i in range(20000)]
+    with PagedRangeIndex.build(str(tmp_path / "index"), intervals, page_size=512, cache_pages=8) as index:
+        misses = index.cache_misses
+        assert index.search(100002) == (100000, 100005, "key10000")
+        assert index.cache_misses - misses <= index.levels + 1
+
+        for i in range(0, 20000, 97):
+            assert index.search(i * 10 + 3) == (i * 10, i * 10 + 5, f"key{i}")
+        assert len(index._cache) <= 8
+
+
+def test_empty_index(tmp_path):
+    with PagedRangeIndex.build(str(tmp_path / "index"), []) as index:
+        assert len(index) == 0
+        assert index.levels == 0
+        assert index.search(10) is None
+        assert list(index) == []
+
+
+def test_reopen_index(tmp_path):
+    path = str(tmp_path / "index")
+    PagedRangeIndex.build(path, [(10, 20, "key1"), (15, 25, "key2")]).close()
+    with PagedRangeIndex(path) as index:
+        assert index.search(21) == (15, 25, "key2")
+
+
+def test_invalid_input(tmp_path):
+    with pytest.raises(ValueError):
+        PagedRangeIndex.build(str(tmp_path / "index"), [(10, 20, "key1"), (5, 15, "key2")])
+    with pytest.raises(ValueError):
+        PagedRangeIndex.build(str(tmp_path / "index"), [(10, 20, "k" * 300)], page_size=256)
+
+    path = tmp_path / "not_an_index"
+    path.write_bytes(b"{}" * 100)
+    with pytest.raises(ValueError):
+        PagedRangeIndex(str(path))
@@ -0,0 +1,197 @@
+import pytest
+
+from avl_range_tree.persistent import PersistentRangeTree
+
+
+def test_search_previous_versions():
+    tree = PersistentRangeTree()
+    v1 = tree.insert(10, 20, "key1", timestamp=100)
+    v2 = tree.insert(12, 18, "key2", timestamp=200)
+    v3 = tree.remove(12, 18, "key2", timestamp=300)
+    v4 = tree.insert(12, 18, "key3", timestamp=400)
+
+    assert (v1, v2, v3, v4) == (1, 2, 3, 4)
+    assert tree.version == 4
+    assert len(tree) == 2
+
+    assert tree.search(15, version=0) is None
+    assert tree.search(15, version=v1) == (10, 20, "key1")
+    assert tree.search(15, version=v2) == (12, 18, "key2")
+    assert tree.search(15, version=v3) == (10, 20, "key1")
+    assert tree.search(15) == (12, 18, "key3")
+    assert [tree.size_at(v) for v in range(5)] == [0, 1, 2, 1, 2]
+
+
+@pytest.mark.parametrize("version", [-1, 5, 100])
+def test_missing_versions_are_rejected(version):
+    tree = PersistentRangeTree()
+    for i in range(4):
+        tree.insert(i, 10, f"key{i}", timestamp=i)
+
+    with pytest.raises(IndexError):
+        tree.search(5, version=version)
+    with pytest.raises(IndexError):
+        tree.search_keys(5, version=version)
+    with pytest.raises(IndexError):
+        tree.root_at(version)
+    with pytest.raises(IndexError):
+        tree.size_at(version)
+
+
+def test_as_of():
+    tree = PersistentRangeTree()
+    tree.insert(10, 20, "key1", timestamp=100)
+    tree.insert(12, 18, "key2", timestamp=200)
+
+    assert tree.as_of(50) == 0
+    assert tree.as_of(100) == 1
+    assert tree.as_of(199) == 1
+    assert tree.search(15, version=tree.as_of(150)) == (10, 20, "key1")
+    assert tree.search(15, version=tree.as_of(250)) == (12, 18, "key2")
+
+    with pytest.raises(ValueError):
+        tree.insert(30, 40, "key3", timestamp=150)
+
+
+def test_versions_share_structure():
+    tree = PersistentRangeTree()
+    for i in range(100):
+        tree.insert(i * 10, i * 10 + 5, f"key{i}", timestamp=i)
+
+    for version in range(1, 101):
+        # Older versions are left untouched by later changes
+        assert list(tree.in_order_traversal(tree.root_at(version))) == [
+            (i * 10, i * 10 + 5, f"key{i}") for i in range(version)
+        ]
+
+    def nodes(node):
+        if node:
+            yield node
+            yield from nodes(node.left)
+            yield from nodes(node.right)
+
+    distinct = {id(node) for version in range(101) for node in nodes(tree.root_at(version))}
+    # Each change copies only O(log n) nodes
+    assert len(distinct) < 100 * 12
+
+
+def test_remove():
+    tree = PersistentRangeTree()
+    intervals = [(i % 7, i % 7 + i, f"key{i}") for i in range(50)]
+    for start, end, key in intervals:
+        tree.insert(start, end, key)
+
+    for start, end, key in intervals[::2]:
+        tree.remove(start, end, key)
+
+    expected = sorted(intervals[1::2], key=lambda interval: interval[0])
+    result = list(tree.in_order_traversal(tree.root))
+    assert sorted(result) == sorted(expected)
+    assert [start for start, _, _ in result] == [start for start, _, _ in expected]
+    assert len(tree) == 25
+    assert list(tree.in_order_traversal(tree.root_at(50))) != result
+
+    with pytest.raises(KeyError):
+        tree.remove(0, 0, "key0")
+
+
+def test_deserialize():
+    tree = PersistentRangeTree()
+    tree.insert(10, 20, "key1")
+    tree.insert(15, 25, "key2")
+
+    restored_tree = PersistentRangeTree.deserialize(tree.serialize())
+    assert restored_tree.version == 1
+    assert len(restored_tree) == 2
+    assert restored_tree.search(21) == (15, 25, "key2")
+    assert restored_tree.search(21, version=0) is None
+
+
+def test_insert_many_creates_one_version():
+    tree = PersistentRangeTree()
+    tree.insert(10, 20, "key1", timestamp=100)
+    version = tree.insert_many([(12, 18, "key2"), (1, 5, "key3")], timestamp=200)
+
+    assert version == 2
+    assert len(tree) == 3
+    assert tree.search(15) == (12, 18, "key2")
+    assert tree.search(15, version=1) == (10, 20, "key1")
+    assert tree.size_at(1) == 1
+
+
+@pytest.mark.parametrize("compress_duplicates", [False, True])
+def test_small_batches_leave_older_versions_intact(compress_duplicates):
+    tree = PersistentRangeTree(compress_duplicates=compress_duplicates)
+    for i in range(500):
+        tree.insert(i * 10, i * 10 + 5, f"key{i}")
+    before = tree.version
+    nodes = [(node, node.start, node.end, node.key, node.max, node.height, node.bucket) for node in tree._nodes()]
+    expected = list(tree)
+
+    # Clustered intervals grow one subtree by several levels, and duplicates fill existing buckets
+    tree.insert_many([(2500 + i % 3, 2600, f"new{i}") for i in range(60)] + [(0, 5, "dup"), (4990, 4995, "dup")])
+
+    assert list(tree.in_order_traversal(tree.root_at(before))) == expected
+    assert [(node, node.start, node.end, node.key, node.max, node.height, node.bucket) for node in tree._nodes()] != nodes
+    assert [(node, node.start, node.end, node.key, node.max, node.height, node.bucket) for node, *_ in nodes] == nodes
+    assert len(tree) == 562
+    assert tree.search_keys(2, version=before)[2] == ["key0"]
+
+
+@pytest.mark.parametrize("batch_size", [2, 100])
+def test_rejected_insert_many_leaves_tree_unchanged(batch_size):
+    tree = PersistentRangeTree()
+    tree.insert(0, 10, "a", timestamp=100)
+    nodes = list(tree._nodes())
+
+    with pytest.raises(ValueError):
+        tree.insert_many([(i + 1, i + 5, f"key{i}") for i in range(batch_size)], timestamp=50)
+
+    assert len(tree) == 1
+    assert tree.version == 1
+    assert list(tree._nodes()) == nodes
+    assert list(tree) == [(0, 10, "a")]
+    assert tree.search(3) == (0, 10, "a")
+    assert tree.insert_many([(1, 5, "b"), (2, 3, "c")], timestamp=150) == 2
+    assert len(tree) == 3
+
+
+def test_compressed_duplicates():
+    tree = PersistentRangeTree.from_columns([1, 1, 5], [10, 10, 6], ["a", "b", "c"], compress_duplicates=True)
+    v1 = tree.version
+
+    v2 = tree.insert(1, 10, "d")
+    assert tree.search_keys(3) == (1, 10, ["a", "b", "d"])
+    assert len(tree) == 4
+
+    v3 = tree.remove(1, 10, "a")
+    assert tree.search_keys(3) == (1, 10, ["b", "d"])
+    assert len(tree) == len(list(tree)) == 3
+
+    tree.remove(1, 10, "d")
+    tree.remove(1, 10, "b")
+    assert tree.search(3) is None
+    assert list(tree) == [(5, 6, "c")]
+    with pytest.raises(KeyError):
+        tree.remove(1, 10, "b")
+
+    # Older versions keep their buckets
+    assert list(tree.in_order_traversal(tree.root_at(v1))) == [(1, 10, "a"), (1, 10, "b"), (5, 6, "c")]
+    assert list(tree.in_order_traversal(tree.root_at(v2))) == [(1, 10, "a"), (1, 10, "b"), (1, 10, "d"), (5, 6, "c")]
+    assert list(tree.in_order_traversal(tree.root_at(v3))) == [(1, 10, "b"), (1, 10, "d"), (5, 6, "c")]
+    assert tree.search_keys(3, version=v2) == (1, 10, ["a", "b", "d"])
+    assert tree.search_keys(3, version=v3) == (1, 10, ["b", "d"])
+    assert tree.search_keys(3, version=0) is None
+
+
+def test_remove_node_with_bucket_and_two_children():
+    tree = PersistentRangeTree(compress_duplicates=True)
+    for start in (20, 10, 30, 25, 35):
+        tree.insert(start, start + 1, f"key{start}")
+    tree.insert(30, 31, "dup")
+
+    # (20, 21) has two children and its successor (25, 26) has none, then (30, 31) carries a bucket
+    tree.remove(20, 21, "key20")
+    tree.remove(25, 26, "key25")
+    assert list(tree) == [(10, 11, "key10"), (30, 31, "key30"), (30, 31, "dup"), (35, 36, "key35")]
+    assert tree.search_keys(30) == (30, 31, ["key30", "dup"])
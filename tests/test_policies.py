@@ -0,0 +1,120 @@
+import random
+
+import pytest
+
+from avl_range_tree.avl_tree import RangeTree
+from avl_range_tree.policies import HighestPriority, KeyPreference, Lexicographic, MostRecent, SmallestWidth
+
+PRIORITIES = {f"key{i}": i % 7 for i in range(3000)}
+
+POLICIES = [
+    SmallestWidth(),
+    HighestPriority(PRIORITIES.__getitem__),
+    MostRecent(),
+    KeyPreference(),
+    Lexicographic(HighestPriority(PRIORITIES.__getitem__), SmallestWidth()),
+]
+
+
+def brute_force_score(policy, intervals, point):
+    """Returns the best score among the intervals containing the point, or None."""
+    scores = [
+        policy.score(start, end, key, seq) for seq, (start, end, key) in enumerate(intervals) if start <= point <= end
+    ]
+    return min(scores) if scores else None
+
+
+@pytest.mark.parametrize("policy", POLICIES, ids=lambda policy: type(policy).__name__)
+def test_policy_matches_brute_force(policy):
+    rng = random.Random(5)
+    tree = RangeTree(policy=policy)
+    intervals = []
+    for i in range(1000):
+        start = rng.randrange(500)
+        interval = (start, start + rng.randrange(60), f"key{i}")
+        tree.insert(*interval)
+        intervals.append(interval)
+
+    for point in range(-1, 570):
+        result = tree.search(point)
+        expected = brute_force_score(policy, intervals, point)
+        if expected is None:
+            assert result is None
+        else:
+            seq = intervals.index(result)
+            assert policy.score(*result, seq) == expected
+
+
+def test_smallest_width_policy_matches_default_search():
+    rng = random.Random(9)
+    tree = RangeTree()
+    policy_tree = RangeTree(policy=SmallestWidth())
+    for i in range(1000):
+        start = rng.randrange(300)
+        end = start + rng.randrange(40)
+        tree.insert(start, end, f"key{i}")
+        policy_tree.insert(start, end, f"key{i}")
+
+    # Both trees have the same shape and break ties the same way
+    for point in range(-1, 350):
+        assert policy_tree.search(point) == tree.search(point)
+
+
+def test_most_recent_and_priority():
+    priorities = {"key1": 1, "key2": 5, "key3": 3}
+    tree = RangeTree(policy=HighestPriority(priorities.__getitem__))
+    tree.insert(10, 20, "key1")
+    tree.insert(0, 100, "key2")
+    tree.insert(12, 18, "key3")
+    assert tree.search(15) == (0, 100, "key2")
+    assert tree.search_keys(15) == (0, 100, ["key2"])
+
+    tree = RangeTree(policy=MostRecent())
+    tree.insert(0, 100, "key1")
+    tree.insert(10, 20, "key2")
+    tree.insert(5, 50, "key3")
+    assert tree.search(15) == (5, 50, "key3")
+    assert tree.search(60) == (0, 100, "key1")
+
+
+def test_policy_survives_rebuild():
+    rng = random.Random(2)
+    tree = RangeTree(policy=MostRecent())
+    intervals = []
+    for i in range(200):
+        start = rng.randrange(100)
+        interval = (start, start + rng.randrange(30), f"key{i}")
+        tree.insert(*interval)
+        intervals.append(interval)
+
+    batch = []
+    for i in range(200, 2200):
+        start = rng.randrange(100)
+        batch.append((start, start + rng.randrange(30), f"key{i}"))
+    tree.insert_many(batch)  # Large batch, the tree is rebuilt from its nodes
+    intervals.extend(batch)
+
+    for point in range(-1, 131):
+        result = tree.search(point)
+        expected = brute_force_score(MostRecent(), intervals, point)
+        assert (result and -intervals.index(result)) == expected
+        assert list(tree.search_sorted([point])) == [result]
+
+
+@pytest.mark.parametrize("size", [0, 10, 1000])
+def test_most_recent_follows_batch_order(size):
+    tree = RangeTree(policy=MostRecent())
+    tree.insert_many([(1000 + i, 1001 + i, f"key{i}") for i in range(size)])
+    # The second interval starts first, but it was given last
+    tree.insert_many([(5, 50, "first"), (0, 100, "second")])
+    assert tree.search(10) == (0, 100, "second")
+
+    tree = RangeTree.from_columns([5, 0], [50, 100], ["first", "second"], policy=MostRecent())
+    assert tree.search(10) == (0, 100, "second")
+
+
+def test_from_columns_with_policy():
+    tree = RangeTree.from_columns([0, 10, 12], [100, 20, 18], ["b", "a", "c"], policy=KeyPreference())
+    assert tree.search(15) == (10, 20, "a")
+    assert tree.search(50) == (0, 100, "b")
+    assert RangeTree(policy=MostRecent()).search(1) is None
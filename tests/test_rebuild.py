@@ -0,0 +1,268 @@
+import random
+import threading
+
+import pytest
+
+from avl_range_tree.avl_tree import RangeTree
+from avl_range_tree.persistent import PersistentRangeTree
+from avl_range_tree.policies import MostRecent
+
+
+def random_intervals(count, seed):
+    # Distinct widths, so that the smallest containing interval is unique whatever the layout
+    rng = random.Random(seed)
+    widths = rng.sample(range(1, 2 * count), count)
+    intervals = []
+    for i, width in enumerate(widths):
+        start = rng.randrange(10 * count)
+        intervals.append((start, start + width, f"key{i}"))
+    return intervals
+
+
+def brute_force_search(intervals, point):
+    best = None
+    for start, end, key in intervals:
+        if start <= point <= end and (best is None or end - start < best[1] - best[0]):
+            best = (start, end, key)
+    return best
+
+
+def check_balanced(node):
+    if node is None:
+        return 0
+    left, right = check_balanced(node.left), check_balanced(node.right)
+    assert abs(left - right) <= 1
+    assert node.height == 1 + max(left, right)
+    assert node.max == max(node.end, node.left.max if node.left else node.end, node.right.max if node.right else node.end)
+    return node.height
+
+
+def test_rebuild_is_perfectly_balanced():
+    intervals = random_intervals(1000, 1)
+    tree = RangeTree()
+    for interval in intervals:
+        tree.insert(*interval)
+    contents = sorted(tree)
+
+    old_root = tree.root
+    assert tree.rebuild() is None
+    assert tree.root is not old_root
+    assert tree.get_height(tree.root) == len(tree).bit_length()
+    check_balanced(tree.root)
+    assert sorted(tree) == contents
+    for point in range(0, 10500, 13):
+        assert tree.search(point) == brute_force_search(intervals, point)
+
+
+def test_degradation():
+    tree = RangeTree()
+    assert tree.degradation() == {
+        "size": 0, "height": 0, "optimal_height": 0, "height_ratio": 1.0, "visits_per_search": None, "rebuilds": 0
+    }
+
+    for interval in random_intervals(500, 2):
+        tree.insert(*interval)
+    report = tree.degradation(points=range(0, 5000, 50))
+    assert report["size"] == 500
+    assert report["optimal_height"] == 9
+    assert report["height"] == tree.root.height
+    assert report["height_ratio"] == tree.root.height / 9
+    assert report["visits_per_search"] >= 1
+    assert tree.degradation()["visits_per_search"] is None
+
+
+def test_auto_rebuild_on_height():
+    intervals = random_intervals(2000, 3)
+    tree = RangeTree()
+    # Any height above the optimal one triggers a rebuild
+    tree.enable_auto_rebuild(height_ratio=1.0, visit_ratio=None, min_size=16, background=False)
+    for interval in intervals[:1000]:
+        tree.insert(*interval)
+    tree.insert_many(intervals[1000:])
+
+    assert tree.degradation()["rebuilds"] > 0
+    assert len(tree) == 2000
+    check_balanced(tree.root)
+    for point in range(0, 20500, 17):
+        assert tree.search(point) == brute_force_search(intervals, point)
+
+
+def test_auto_rebuild_on_visits():
+    intervals = random_intervals(300, 4)
+    tree = RangeTree()
+    for interval in intervals:
+        tree.insert(*interval)
+    tree.enable_auto_rebuild(height_ratio=None, visit_ratio=0.1, sample_every=2, window=4, min_size=1, background=False)
+
+    for point in range(0, 3000, 300):
+        assert tree.search(point) == brute_force_search(intervals, point)
+    report = tree.degradation()
+    assert report["rebuilds"] == 1
+    assert report["visits_per_search"] >= 1
+    assert tree._monitor.visit_floor is None  # The first window after the rebuild is not complete yet
+
+    for point in range(0, 3000, 300):
+        tree.search(point)
+    assert tree._monitor.visit_floor is not None
+
+
+def pause_build(tree):
+    """Makes the next background rebuild wait after copying the nodes, until the returned event is set."""
+    copied, resume = threading.Event(), threading.Event()
+    build_tree = tree._build_tree
+
+    def paused_build_tree(nodes):
+        del tree._build_tree
+        copied.set()
+        resume.wait()
+        return build_tree(nodes)
+
+    tree._build_tree = paused_build_tree
+    return copied, resume
+
+
+def test_background_rebuild_replays_writes():
+    intervals = random_intervals(3000, 5)
+    tree = RangeTree(policy=MostRecent())
+    tree.insert_many(intervals[:2000])
+    tree.enable_auto_rebuild(height_ratio=None, visit_ratio=None)
+
+    # The new layout cannot be swapped in before the build resumes, so these writes are replayed
+    copied, resume = pause_build(tree)
+    thread = tree.rebuild(background=True)
+    assert copied.wait(10)
+    assert tree.rebuild(background=True) is thread
+    assert tree.rebuild() is thread
+    for interval in intervals[2000:2500]:
+        tree.insert(*interval)
+    tree.insert_many(intervals[2500:])
+    assert len(tree._monitor.pending) == 1000
+    resume.set()
+    thread.join()
+
+    assert tree._monitor.pending is None
+    assert len(tree) == 3000
+    assert sorted(tree) == sorted(intervals)
+    check_balanced(tree.root)
+
+    # The replayed intervals kept their sequence numbers, batches being numbered in the order they are given
+    for point in range(0, 30000, 37):
+        containing = [interval for interval in intervals if interval[0] <= point <= interval[1]]
+        assert tree.search(point) == (containing[-1] if containing else None)
+
+
+def test_searches_only_start_background_rebuilds():
+    intervals = random_intervals(300, 9)
+    tree = RangeTree()
+    tree.insert_many(intervals)
+    tree.enable_auto_rebuild(height_ratio=None, visit_ratio=0.1, sample_every=1, window=1, min_size=1)
+    copy_threads = []
+    copy_nodes = tree._copy_nodes
+    tree._copy_nodes = lambda: copy_threads.append(threading.current_thread()) or copy_nodes()
+
+    # The search crossing the threshold returns while the writes are blocked, before any copy
+    with tree._monitor.lock:
+        assert tree.search(intervals[0][0]) == brute_force_search(intervals, intervals[0][0])
+        assert tree._monitor.running
+        assert copy_threads == []
+    assert tree.wait_rebuild(timeout=10)
+    assert copy_threads and threading.current_thread() not in copy_threads
+    assert tree.degradation()["rebuilds"] >= 1
+
+
+def test_background_rebuild_detaches_its_monitor():
+    tree = RangeTree()
+    tree.insert_many(random_intervals(100, 10))
+    copied, resume = pause_build(tree)
+    thread = tree.rebuild(background=True)
+    assert copied.wait(10)
+    assert tree._monitor is not None
+    resume.set()
+    thread.join()
+    assert tree._monitor is None
+    check_balanced(tree.root)
+
+    # A monitor enabled by the user stays in place
+    tree.enable_auto_rebuild(height_ratio=None, visit_ratio=None)
+    tree.rebuild(background=True).join()
+    assert tree._monitor is not None
+
+
+def test_background_rebuild_does_not_block_searches():
+    intervals = random_intervals(5000, 6)
+    tree = RangeTree()
+    tree.insert_many(intervals)
+    tree.enable_auto_rebuild(height_ratio=None, visit_ratio=None)
+
+    errors = []
+    stop = threading.Event()
+
+    def reader():
+        rng = random.Random(0)
+        while not stop.is_set():
+            point = rng.randrange(50000)
+            try:
+                assert tree.search(point) == brute_force_search(intervals, point)
+            except AssertionError as e:  # Collected, as assertions in threads do not fail the test
+                errors.append(e)
+
+    thread = threading.Thread(target=reader)
+    thread.start()
+    for _ in range(3):
+        tree.rebuild(background=True)
+        assert tree.wait_rebuild(timeout=10)
+    stop.set()
+    thread.join()
+
+    assert errors == []
+    assert tree.degradation()["rebuilds"] == 3
+
+
+def test_rebuild_compressed_tree():
+    tree = RangeTree(compress_duplicates=True)
+    tree.enable_auto_rebuild(height_ratio=None, visit_ratio=None)
+    for i in range(200):
+        tree.insert(i % 50, i % 50 + 10, f"key{i}")
+
+    copied, resume = pause_build(tree)
+    thread = tree.rebuild(background=True)
+    assert copied.wait(10)
+    # Appends to buckets shared with the previous layout must not leak into the copies
+    tree.insert(0, 10, "late")
+    tree.insert(100, 110, "new")
+    resume.set()
+    thread.join()
+
+    assert len(tree) == 202
+    assert len(list(tree)) == 202
+    assert tree.search_keys(0) == (0, 10, ["key0", "key50", "key100", "key150", "late"])
+    assert tree.search(105) == (100, 110, "new")
+    check_balanced(tree.root)
+
+
+def test_disable_auto_rebuild():
+    tree = RangeTree()
+    tree.enable_auto_rebuild(height_ratio=1.0, min_size=1, background=False)
+    tree.disable_auto_rebuild()
+    assert tree._monitor is None
+    assert tree.wait_rebuild()
+    for interval in random_intervals(100, 7):
+        tree.insert(*interval)
+    assert tree.degradation()["rebuilds"] == 0
+
+
+def test_persistent_rebuild():
+    tree = PersistentRangeTree()
+    for interval in random_intervals(200, 8):
+        tree.insert(*interval)
+    before = tree.version
+    old_root = tree.root
+    contents = list(tree)
+
+    assert tree.rebuild() == before + 1
+    assert tree.root_at(before) is old_root
+    assert list(tree) == contents
+    check_balanced(tree.root)
+
+    with pytest.raises(NotImplementedError):
+        tree.enable_auto_rebuild()
@@ -0,0 +1,285 @@
+import asyncio
+import random
+import socket
+import threading
+import time
+from array import array
+
+import pytest
+
+from avl_range_tree import server as server_module
+from avl_range_tree.avl_tree import RangeTree
+from avl_range_tree.client import RangeTreeClient, RangeTreeServerError
+from avl_range_tree.protocol import (
+    MAX_BATCH,
+    OP_SEARCH,
+    OP_SEARCH_BATCH,
+    POINT,
+    REQUEST_HEADER,
+    RESPONSE_HEADER,
+    STATUS_ERROR,
+    STATUS_OK,
+    encode_result,
+)
+from avl_range_tree.server import RangeTreeServer
+
+
+def write_snapshot(path, intervals):
+    tree = RangeTree()
+    tree.insert_many(intervals)
+    path.write_bytes(tree.to_snapshot())
+    return tree
+
+
+class ServerThread:
+    """Runs a RangeTreeServer on its own event loop in a background thread."""
+
+    def __init__(self, snapshot_path, unix_path=None):
+        self.server = RangeTreeServer(str(snapshot_path))
+        self.loop = asyncio.new_event_loop()
+        self.listener = self.loop.run_until_complete(self.server.start(host="127.0.0.1", port=0, path=unix_path))
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+    @property
+    def port(self):
+        return self.listener.sockets[0].getsockname()[1]
+
+    def stop(self):
+        async def shutdown():
+            self.listener.close()
+            await self.listener.wait_closed()
+
+        asyncio.run_coroutine_threadsafe(shutdown(), self.loop).result(timeout=5)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout=5)
+        self.loop.close()
+
+
+@pytest.fixture
+def snapshot(tmp_path):
+    rng = random.Random(11)
+    intervals = []
+    for i in range(2000):
+        start = rng.randrange(100000)
+        intervals.append((start, start + rng.randrange(2000), f"key{i}"))
+    path = tmp_path / "tree.snapshot"
+    tree = write_snapshot(path, intervals)
+    return path, tree
+
+
+@pytest.fixture
+def server(snapshot):
+    server = ServerThread(snapshot[0])
+    yield server
+    server.stop()
+
+
+def test_search(server, snapshot):
+    tree = snapshot[1]
+    with RangeTreeClient(port=server.port, timeout=5) as client:
+        client.ping()
+        for point in range(-10, 102000, 997):
+            assert client.search(point) == tree.search(point)
+
+
+def test_search_many_sorted_and_unsorted(server, snapshot):
+    tree = snapshot[1]
+    points = list(range(-10, 102000, 37))
+    with RangeTreeClient(port=server.port, timeout=5) as client:
+        assert client.search_many(points) == [tree.search(point) for point in points]
+
+        random.Random(3).shuffle(points)
+        assert client.search_many(points) == [tree.search(point) for point in points]
+        assert client.search_many([]) == []
+
+
+def test_pipelined_batches(server, snapshot):
+    tree = snapshot[1]
+    batches = [[random.Random(i).randrange(102000) for _ in range(50)] for i in range(20)]
+    with RangeTreeClient(port=server.port, timeout=5) as client:
+        results = client.search_pipelined(batches)
+    assert results == [[tree.search(point) for point in batch] for batch in batches]
+
+
+def test_pipelined_responses_larger_than_socket_buffers(snapshot, tmp_path):
+    # Every response is over 500 kB, sending all the requests before reading would deadlock
+    path = str(tmp_path / "server.sock")
+    server = ServerThread(snapshot[0], unix_path=path)
+    tree = snapshot[1]
+    try:
+        rng = random.Random(5)
+        batches = [[rng.randrange(102000) for _ in range(20000)] for _ in range(10)]
+        with RangeTreeClient(path=path, timeout=30) as client:
+            results = client.search_pipelined(batches)
+            assert results == [[tree.search(point) for point in batch] for batch in batches]
+            points = [point for batch in batches for point in batch]
+            assert client.search_many(points) == [tree.search(point) for point in points]
+    finally:
+        server.stop()
+
+
+def test_pipelined_errors(server):
+    with RangeTreeClient(port=server.port, timeout=5) as client:
+        # The server answers the oversized batch with an error and closes the connection without
+        # reading the points, so the client sees either the error or the reset connection
+        with pytest.raises((RangeTreeServerError, ConnectionError)):
+            client.search_pipelined([[1], range(MAX_BATCH + 1), [2]])
+        # The failed connection is discarded, the next call opens a new one
+        assert client.search_pipelined([[1], [2]]) == [[None], [None]]
+
+
+def test_sweep_only_large_sorted_batches(snapshot, monkeypatch):
+    path, tree = snapshot
+    server = RangeTreeServer(str(path))
+    monkeypatch.setattr(server_module, "ACCELERATED", False)
+    sweeps = []
+    search_sorted = server.tree.search_sorted
+    monkeypatch.setattr(server.tree, "search_sorted", lambda points: sweeps.append(len(points)) or search_sorted(points))
+
+    small = array("q", [100, 50000])
+    large = array("q", range(0, 100000, 10))
+    expected = b"".join(encode_result(tree.search(point)) for point in large)
+    assert server.search(small) == b"".join(encode_result(tree.search(point)) for point in small)
+    assert server.search(large) == expected
+    assert sweeps == [len(large)]
+
+    monkeypatch.setattr(server_module, "ACCELERATED", True)
+    assert server.search(large) == expected
+    assert sweeps == [len(large)]
+
+
+def test_large_batches_do_not_block_other_connections(server, monkeypatch):
+    class SlowTree(RangeTree):
+        def search(self, point):
+            time.sleep(0.001)  # Blocks the event loop, like a search on a much larger tree
+            return super().search(point)
+
+    server.server.tree = SlowTree()
+    monkeypatch.setattr(server_module, "CHUNK_SIZE", 20)
+    points = array("q", range(1000, 0, -1))
+
+    with socket.create_connection(("127.0.0.1", server.port), timeout=10) as sock:
+        start = time.perf_counter()
+        sock.sendall(REQUEST_HEADER.pack(0, OP_SEARCH_BATCH, len(points)) + points.tobytes())
+        time.sleep(0.05)
+        with RangeTreeClient(port=server.port, timeout=10) as client:
+            client.ping()
+            ping_time = time.perf_counter() - start
+        response = sock.recv(RESPONSE_HEADER.size, socket.MSG_WAITALL)
+        batch_time = time.perf_counter() - start
+
+    # The ping is answered between two chunks of the batch, long before the batch is complete
+    assert RESPONSE_HEADER.unpack(response) == (0, STATUS_OK, len(points))
+    assert batch_time > 1
+    assert ping_time < batch_time / 2
+
+
+def test_concurrent_clients(server, snapshot):
+    tree = snapshot[1]
+    errors = []
+
+    def worker(client, seed):
+        rng = random.Random(seed)
+        try:
+            for _ in range(50):
+                point = rng.randrange(102000)
+                assert client.search(point) == tree.search(point)
+        except Exception as e:  # Collected, as assertions in threads do not fail the test
+            errors.append(e)
+
+    with RangeTreeClient(port=server.port, pool_size=3, timeout=5) as client:
+        threads = [threading.Thread(target=worker, args=(client, seed)) for seed in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert client._idle.qsize() <= 3
+    assert errors == []
+
+
+def test_reload(server, snapshot):
+    path = snapshot[0]
+    with RangeTreeClient(port=server.port, timeout=5) as client:
+        write_snapshot(path, [(500000, 500010, "new")])
+        assert client.search(500005) is None
+        client.reload()
+        assert client.search(500005) == (500000, 500010, "new")
+        assert client.search(10) is None
+
+        path.write_bytes(b"not a snapshot")
+        with pytest.raises(RangeTreeServerError, match="Could not reload"):
+            client.reload()
+        # The previous tree is still served
+        assert client.search(500005) == (500000, 500010, "new")
+
+
+def test_try_reload(snapshot, caplog):
+    path, tree = snapshot
+    server = RangeTreeServer(str(path))
+    path.write_bytes(b"not a snapshot")
+    assert asyncio.run(server.try_reload()) is False
+    assert "Could not reload" in caplog.text
+    assert server.search(array("q", [100])) == encode_result(tree.search(100))
+
+    write_snapshot(path, [(500000, 500010, "new")])
+    assert asyncio.run(server.try_reload()) is True
+    assert server.tree.search(500005) == (500000, 500010, "new")
+
+
+def test_unencodable_results(server):
+    tree = RangeTree()
+    tree.insert(0, 2 ** 70, "big")
+    tree.insert(10, 20, "k" * 70000)
+    tree.insert(1000, 1010, "ok")
+    server.server.tree = tree
+
+    with socket.create_connection(("127.0.0.1", server.port), timeout=5) as sock:
+        for request_id, point in enumerate((5, 15, 1005)):
+            sock.sendall(REQUEST_HEADER.pack(request_id, OP_SEARCH, 1) + POINT.pack(point))
+        errors = []
+        for _ in range(2):
+            request_id, status, count = RESPONSE_HEADER.unpack(sock.recv(RESPONSE_HEADER.size, socket.MSG_WAITALL))
+            errors.append((request_id, status, sock.recv(count, socket.MSG_WAITALL)))
+        # Errors are answered in order and the connection keeps serving the next requests
+        assert RESPONSE_HEADER.unpack(sock.recv(RESPONSE_HEADER.size, socket.MSG_WAITALL)) == (2, STATUS_OK, 1)
+
+    assert [error[:2] for error in errors] == [(0, STATUS_ERROR), (1, STATUS_ERROR)]
+    assert b"64-bit" in errors[0][2]
+    assert b"exceeds" in errors[1][2]
+    with RangeTreeClient(port=server.port, timeout=5) as client:
+        with pytest.raises(RangeTreeServerError, match="Could not encode"):
+            client.search(5)
+        assert client.search(1005) == (1000, 1010, "ok")
+
+
+def test_disconnect_in_the_middle_of_a_request(server):
+    errors = []
+    server.loop.set_exception_handler(lambda loop, context: errors.append(context))
+
+    with socket.create_connection(("127.0.0.1", server.port), timeout=5) as sock:
+        sock.sendall(REQUEST_HEADER.pack(0, OP_SEARCH_BATCH, 10) + b"".join(POINT.pack(point) for point in range(3)))
+    with RangeTreeClient(port=server.port, timeout=5) as client:
+        client.ping()
+        assert client.search(-1) is None
+    asyncio.run_coroutine_threadsafe(asyncio.sleep(0.1), server.loop).result(timeout=5)
+
+    assert errors == []
+
+
+def test_unknown_operation(server):
+    with socket.create_connection(("127.0.0.1", server.port), timeout=5) as sock:
+        sock.sendall(REQUEST_HEADER.pack(42, 99, 0))
+        request_id, status, count = RESPONSE_HEADER.unpack(sock.recv(RESPONSE_HEADER.size, socket.MSG_WAITALL))
+        assert (request_id, status) == (42, STATUS_ERROR)
+        assert sock.recv(count, socket.MSG_WAITALL) == b"Unknown operation 99"
+
+
+def test_unix_socket(snapshot, tmp_path):
+    path = str(tmp_path / "server.sock")
+    server = ServerThread(snapshot[0], unix_path=path)
+    try:
+        with RangeTreeClient(path=path, timeout=5) as client:
+            assert client.search_many([100, 50000]) == [snapshot[1].search(100), snapshot[1].search(50000)]
+    finally:
+        server.stop()